@@ -0,0 +1,60 @@
+import io
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# Tests run against source tree, zmake isn't installed as package
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# User config, cache and backups go to temporary folder, config
+# paths are resolved on zmake import
+os.environ["HOME"] = tempfile.mkdtemp(prefix="zmake-test-home-")
+
+
+def make_png(path: Path, colors=((255, 0, 0, 255), (0, 0, 255, 128)), size=(8, 6)):
+    from PIL import Image
+    image = Image.new("RGBA", size)
+    image.putdata([colors[(x + y) % len(colors)] for y in range(size[1]) for x in range(size[0])])
+    path.parent.mkdir(parents=True, exist_ok=True)
+    image.save(path)
+
+
+@pytest.fixture(name="make_png")
+def make_png_fixture():
+    return make_png
+
+
+@pytest.fixture
+def project(tmp_path):
+    """
+    New watchface project with two assets.
+    """
+    from zmake.main import run_task
+    path = tmp_path / "watchface"
+    path.mkdir()
+    summary = run_task(path, "init", project_type="w")
+    assert summary["exit_code"] == 0, summary
+    make_png(path / "assets" / "a.png")
+    make_png(path / "assets" / "sub" / "b.png", ((1, 2, 3, 255), (4, 5, 6, 255), (7, 8, 9, 0)))
+    return path
+
+
+@pytest.fixture
+def run_main(monkeypatch, capsys):
+    """
+    :return: function that runs zmake CLI with given arguments and
+             returns exit code and captured output
+    """
+    from zmake import main
+
+    def run(*args):
+        monkeypatch.setattr(sys, "argv", ["zmake", *args])
+        # Interactive mode waits for key press
+        monkeypatch.setattr(sys, "stdin", io.StringIO("\n"))
+        with pytest.raises(SystemExit) as e:
+            main.main()
+        return e.value.code, capsys.readouterr()
+    return run
@@ -0,0 +1,131 @@
+import json
+import logging
+import shutil
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from zmake import third_tools_manager
+from zmake.project_build import adb_install
+
+FAKE_ADB = Path(__file__).resolve().parent.parent / "tools" / "fake_adb.py"
+
+
+@pytest.fixture
+def device(tmp_path, monkeypatch):
+    """
+    Fake adb with emulated device storage, commands are logged.
+    """
+    root = tmp_path / "device"
+    root.mkdir()
+    log = tmp_path / "adb.log"
+    adb = tmp_path / "adb"
+    adb.write_text(f"#!/bin/sh\nexec {sys.executable} {FAKE_ADB} \"$@\"\n")
+    adb.chmod(0o755)
+
+    monkeypatch.setenv("FAKE_ADB_ROOT", str(root))
+    monkeypatch.setenv("FAKE_ADB_LOG", str(log))
+    monkeypatch.setitem(third_tools_manager._tool_locations, "adb", str(adb))
+    return SimpleNamespace(root=root, log=log)
+
+
+def _context(path: Path, package_extension: str):
+    config = {
+        "with_adb": True,
+        "adb_path": "/sdcard/Android/zmake",
+        "package_extension": package_extension,
+        "ignore_files": [".map"],
+    }
+    return SimpleNamespace(path=path, config=config, logger=logging.getLogger("zmake.test"))
+
+
+def _pushes(device):
+    if not device.log.is_file():
+        return 0
+    return sum(1 for line in device.log.read_text().splitlines() if line.startswith("push "))
+
+
+def _deploy(context, device, caplog):
+    caplog.clear()
+    with caplog.at_level(logging.INFO, logger="zmake.test"):
+        adb_install(context)
+    return caplog.text
+
+
+@pytest.fixture
+def zip_project(tmp_path):
+    project = tmp_path / "watchface"
+    build = project / "build"
+    (build / "assets").mkdir(parents=True)
+    (build / "app.json").write_text("{}")
+    (build / "app.js").write_text("App({})")
+    (build / "app.js.map").write_text("{}")
+    (build / "assets" / "a.png").write_bytes(b"a")
+    (build / "assets" / "b.png").write_bytes(b"b")
+    return project
+
+
+def test_upload_delta(zip_project, device, caplog):
+    context = _context(zip_project, "zip")
+    remote = device.root / "sdcard/Android/zmake"
+
+    text = _deploy(context, device, caplog)
+    assert "Uploaded 4 of 4 files" in text
+    assert (remote / "assets" / "a.png").read_bytes() == b"a"
+    assert (remote / "app.js").read_text() == "App({})"
+    # Ignored files aren't uploaded, delta archive is removed
+    assert not (remote / "app.js.map").exists()
+    assert not (remote / ".watchface.zmake_delta.zip").exists()
+    manifest = json.loads((remote / ".watchface.zmake_manifest.json").read_text())
+    assert sorted(manifest) == ["app.js", "app.json", "assets/a.png", "assets/b.png"]
+    assert _pushes(device) == 1
+
+    text = _deploy(context, device, caplog)
+    assert "Already up to date" in text
+    assert _pushes(device) == 1
+
+    build = zip_project / "build"
+    (build / "assets" / "a.png").write_bytes(b"changed")
+    (build / "assets" / "b.png").unlink()
+    (build / "assets" / "c.png").write_bytes(b"c")
+    text = _deploy(context, device, caplog)
+    assert "Uploaded 2 of 4 files" in text
+    assert "removed 1" in text
+    assert (remote / "assets" / "a.png").read_bytes() == b"changed"
+    assert (remote / "assets" / "c.png").read_bytes() == b"c"
+    assert not (remote / "assets" / "b.png").exists()
+    assert _pushes(device) == 2
+
+
+def test_manifest_lost(zip_project, device, caplog):
+    context = _context(zip_project, "zip")
+    _deploy(context, device, caplog)
+    (device.root / "sdcard/Android/zmake/.watchface.zmake_manifest.json").unlink()
+    assert "Uploaded 4 of 4 files" in _deploy(context, device, caplog)
+
+
+def test_upload_package(tmp_path, device, caplog):
+    project = tmp_path / "my app"
+    dist = project / "dist"
+    dist.mkdir(parents=True)
+    (dist / "my app.bin").write_bytes(b"package")
+    (dist / "infos.xml").write_text("<infos/>")
+    context = _context(project, "bin")
+    remote = device.root / "sdcard/Android/zmake/my app"
+
+    assert "Uploaded 2 of 2 files" in _deploy(context, device, caplog)
+    assert (remote / "my app.bin").read_bytes() == b"package"
+
+    (dist / "preview.png").write_bytes(b"preview")
+    (dist / "my app.bin").write_bytes(b"package v2")
+    assert "Uploaded 2 of 3 files" in _deploy(context, device, caplog)
+    assert (remote / "my app.png").read_bytes() == b"preview"
+    assert (remote / "my app.bin").read_bytes() == b"package v2"
+    assert (remote / "infos.xml").read_text() == "<infos/>"
+
+
+def test_adb_failure_is_ignored(zip_project, device, caplog, monkeypatch):
+    monkeypatch.setitem(third_tools_manager._tool_locations, "adb", shutil.which("false"))
+    assert "Failed, ignore" in _deploy(_context(zip_project, "zip"), device, caplog)
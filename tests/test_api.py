@@ -0,0 +1,57 @@
+import io
+import json
+from zipfile import ZipFile
+
+import pytest
+from PIL import Image
+
+from zmake import api
+from zmake.exceptions import ConfigException
+
+
+def _source_pixels(path):
+    return Image.open(path).convert("RGBA").tobytes()
+
+
+def test_build_package(project):
+    before = sorted(p.relative_to(project) for p in project.rglob("*"))
+    data = api.build_package(project)
+
+    # Nothing is written to project folder
+    assert sorted(p.relative_to(project) for p in project.rglob("*")) == before
+    with ZipFile(io.BytesIO(data)) as arc:
+        names = arc.namelist()
+        assert sorted(names) == ["app.js", "app.json", "assets/a.png", "assets/sub/b.png", "watchface/index.js"]
+        app_json = json.loads(arc.read("app.json"))
+        assert app_json["app"]["appName"] == json.loads((project / "app.json").read_text())["app"]["appName"]
+
+        # Assets are converted to TGA-P and decode back to source pixels
+        for rel_name in ["a.png", "sub/b.png"]:
+            raw = arc.read(f"assets/{rel_name}")
+            assert raw[:2] != b"\x89P"
+            image, file_type = api.decode_image(raw)
+            assert file_type == "TGA-P"
+            assert image.tobytes() == _source_pixels(project / "assets" / rel_name)
+
+
+def test_build_package_to_file(project):
+    out = io.BytesIO()
+    assert api.build_package(project, out) is None
+    assert out.getvalue() == api.build_package(project)
+
+
+def test_build_package_overrides(project):
+    data = api.build_package(project, config_overrides={"def_format": "TGA-32"})
+    with ZipFile(io.BytesIO(data)) as arc:
+        assert api.decode_image(arc.read("assets/a.png"))[1] == "TGA-32"
+
+    with pytest.raises(ConfigException, match="isn't supported"):
+        api.build_package(project, config_overrides={"with_uglifyjs": True})
+
+
+def test_convert_round_trip(project):
+    png = (project / "assets" / "a.png").read_bytes()
+    tga = api.convert(png, "TGA-RLP")
+    assert api.decode_image(tga)[1] == "TGA-RLP"
+    back = api.convert(io.BytesIO(tga))
+    assert Image.open(io.BytesIO(back)).convert("RGBA").tobytes() == _source_pixels(project / "assets" / "a.png")
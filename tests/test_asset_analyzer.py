@@ -0,0 +1,36 @@
+import random
+
+import pytest
+
+from zmake import asset_analyzer, tga_save
+from zmake.asset_analyzer import estimate_rle_size
+
+
+def _random_runs(rng: random.Random, size: int, colors: int):
+    data = bytearray()
+    while len(data) < size:
+        data += bytes([rng.randrange(colors)]) * rng.choice([1, 1, 1, 2, 3, 126, 127, 128, 129, 254, 255, 256, 300])
+    return bytes(data[:size])
+
+
+def _cases():
+    rng = random.Random(1)
+    cases = [b"", b"\0", b"\0\0", b"\0\1", bytes(range(256)) * 3, b"\5" * 1000]
+    for colors in (2, 3, 16, 256):
+        for _ in range(20):
+            size = rng.randrange(1, 3000)
+            cases.append(bytes(rng.randrange(colors) for _ in range(size)))
+            cases.append(_random_runs(rng, size, colors))
+    return cases
+
+
+@pytest.mark.parametrize("with_numpy", [True, False])
+def test_matches_encoder(with_numpy, monkeypatch):
+    if not with_numpy:
+        monkeypatch.setattr(asset_analyzer, "np", None)
+    elif asset_analyzer.np is None:
+        pytest.skip("numpy isn't installed")
+
+    for indexes in _cases():
+        expected = len(tga_save._rl_encode(indexes)) if indexes else 0
+        assert estimate_rle_size(indexes) == expected, indexes[:32]
@@ -0,0 +1,132 @@
+import json
+import os
+from pathlib import Path
+
+from zmake.asset_index import AssetIndex, get_target_type
+from zmake.main import run_task
+
+
+def _config(**values):
+    config = {"overrides": {}, "ignore_files": [".DS_Store", "Thumbs.db"], "def_format": "TGA-P"}
+    config.update(values)
+    return config
+
+
+def _touch(path: Path, data=b"x"):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+
+
+def test_target_type():
+    assert get_target_type(Path("a.png"), "TGA-P") == "TGA-P"
+    assert get_target_type(Path("a.rgba.png"), "TGA-P") == "TGA-32"
+    assert get_target_type(Path("bg.rgb/a.png"), "TGA-P") == "TGA-16"
+    assert get_target_type(Path("x/y.rlp/z/a.png"), None) == "TGA-RLP"
+    assert get_target_type(Path("a.rlp.txt"), None) is None
+
+
+def test_formats_and_outputs(tmp_path):
+    # Folder names above assets don't affect format
+    project = tmp_path / "watchface.rgb"
+    source = project / "assets"
+    _touch(source / "a.png")
+    _touch(source / "b.rlp.png")
+    _touch(source / "fast.rgba" / "c.png")
+
+    index = AssetIndex.build(project, source, project / "build" / "assets", _config())
+    assert sorted(index.entries) == ["a.png", "b.rlp.png", "fast.rgba", "fast.rgba/c.png"]
+    a = index.entries["a.png"]
+    assert (a.target_type, a.explicit_type) == ("TGA-P", False)
+    assert (index.entries["b.rlp.png"].target_type, index.entries["b.rlp.png"].explicit_type) == ("TGA-RLP", True)
+    assert index.entries["fast.rgba/c.png"].target_type == "TGA-32"
+    assert index.entries["fast.rgba/c.png"].output == project / "build" / "assets" / "fast.rgba" / "c.png"
+    assert index.entries["fast.rgba"].is_dir
+    assert [e.rel_name for e in index.files()] == ["a.png", "b.rlp.png", "fast.rgba/c.png"]
+
+
+def test_override(tmp_path):
+    project = tmp_path / "project"
+    source = project / "assets"
+    _touch(source / "a.png")
+    _touch(source / "b.png")
+    _touch(project / "variants" / "a.rgba.png")
+    _touch(project / "variants" / "b.png")
+    config = _config(overrides={"assets/a.png": "variants/a.rgba.png", "assets\\b.png/": "variants/b.png"})
+
+    index = AssetIndex.build(project, source, project / "build" / "assets", config)
+    a = index.entries["a.png"]
+    assert a.source == project / "variants" / "a.rgba.png"
+    # Output keeps original name, format comes from override file name
+    assert a.output == project / "build" / "assets" / "a.png"
+    assert (a.target_type, a.explicit_type) == ("TGA-32", True)
+    assert index.entries["b.png"].source == project / "variants" / "b.png"
+
+
+def test_ignored(tmp_path):
+    project = tmp_path / "project"
+    source = project / "assets"
+    _touch(source / "a.png")
+    _touch(source / "sub" / ".DS_Store")
+    _touch(source / "draft.psd")
+
+    index = AssetIndex.build(project, source, project / "build" / "assets", _config())
+    assert index.entries["sub/.DS_Store"].ignored
+    assert not index.entries["draft.psd"].ignored
+
+    index = AssetIndex.build(project, source, project / "build" / "assets", _config(ignore_files=[".psd"]))
+    assert index.entries["draft.psd"].ignored
+    assert not index.entries["sub/.DS_Store"].ignored
+    assert [e.rel_name for e in index.files()] == ["a.png", "sub/.DS_Store"]
+
+
+def test_target_subfolder(tmp_path):
+    project = tmp_path / "project"
+    source = project / "assets" / "gtr"
+    _touch(source / "a.png")
+    _touch(project / "assets" / "gts" / "a.png")
+    _touch(project / "alt.png")
+    config = _config(overrides={"assets/gtr/a.png": "alt.png", "assets/a.png": "missing.png"})
+
+    index = AssetIndex.build(project, source, project / "build" / "assets", config)
+    assert list(index.entries) == ["a.png"]
+    assert index.entries["a.png"].source == project / "alt.png"
+    assert index.entries["a.png"].output == project / "build" / "assets" / "a.png"
+
+
+def test_changes(tmp_path):
+    project = tmp_path / "project"
+    source = project / "assets"
+    _touch(source / "a.png")
+    _touch(source / "b.png")
+    dest = project / "build" / "assets"
+
+    index = AssetIndex.build(project, source, dest, _config())
+    assert index.previous == {}
+    assert len(index.changed()[0]) == 2
+    index.save()
+
+    _touch(source / "a.png", b"changed")
+    stat = (source / "a.png").stat()
+    os.utime(source / "a.png", ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    (source / "b.png").unlink()
+    _touch(source / "c.png")
+    index = AssetIndex.build(project, source, dest, _config())
+    changed, removed = index.changed()
+    assert sorted(e.rel_name for e in changed) == ["a.png", "c.png"]
+    assert removed == ["b.png"]
+
+    # Other format is a change too
+    index.save()
+    index = AssetIndex.build(project, source, dest, _config(def_format="TGA-32"))
+    assert sorted(e.rel_name for e in index.changed()[0]) == ["a.png", "c.png"]
+
+
+def test_build_with_targets(project, make_png):
+    app_json = json.loads((project / "app.json").read_text())
+    app_json["targets"] = {"gtr": {"module": app_json["module"]}}
+    (project / "app.json").write_text(json.dumps(app_json))
+    make_png(project / "assets" / "gtr" / "only_gtr.png")
+
+    summary = run_task(project, "build")
+    assert summary["exit_code"] == 0, summary
+    assert sorted(p.name for p in (project / "build" / "assets").iterdir()) == ["only_gtr.png"]
@@ -0,0 +1,109 @@
+import json
+import shutil
+from zipfile import ZipFile
+
+import pytest
+
+import zmake.project_build  # noqa: F401, registers built-in handlers
+from zmake.config import load_file
+from zmake.context import BUILD_HANDLERS, HANDLER_INFO, plan_build
+from zmake.exceptions import UsageException
+from zmake.main import run_task
+from zmake.utils import APP_PATH
+
+
+@pytest.fixture
+def config():
+    return dict(load_file(APP_PATH / "zmake.json"))
+
+
+def _stages(plan):
+    return {HANDLER_INFO[key].stage for key in plan}
+
+
+def test_full_build(config):
+    assert plan_build(config) is None
+    assert plan_build(config, [], []) is None
+
+
+def test_only(config):
+    plan = plan_build(config, only=["js"])
+    assert _stages(plan) == {"js", None}
+    # Build order is kept
+    keys = [key for key, _ in BUILD_HANDLERS]
+    assert plan == sorted(plan, key=keys.index)
+
+
+def test_skip(config):
+    plan = plan_build(config, skip=["adb", "preview"])
+    assert "adb" not in _stages(plan)
+    assert "preview" not in _stages(plan)
+    assert "package" in _stages(plan)
+
+
+def test_unknown_stage(config):
+    with pytest.raises(UsageException, match="Unknown build stage"):
+        plan_build(config, only=["nope"])
+    with pytest.raises(UsageException, match="Unknown build stage"):
+        plan_build(config, skip=["nope"])
+
+
+def test_dedup_needs_assets_and_js(config):
+    config["dedup_assets"] = True
+    with pytest.raises(UsageException, match="needs assets, js"):
+        plan_build(config, only=["dedup"])
+    with pytest.raises(UsageException, match="needs js"):
+        plan_build(config, only=["dedup", "assets"])
+    assert "dedup" in _stages(plan_build(config, only=["dedup", "assets", "js"]))
+
+
+def test_dedup_blocks_skipping_inputs(config):
+    config["dedup_assets"] = True
+    with pytest.raises(UsageException, match="needs assets"):
+        plan_build(config, skip=["assets"])
+    with pytest.raises(UsageException, match="needs js"):
+        plan_build(config, skip=["js"])
+
+
+@pytest.mark.parametrize("only, skip", [
+    (["package"], None),
+    (["assets"], ["dedup"]),
+    (None, ["dedup", "assets", "js"]),
+])
+def test_dedup_cant_be_skipped(config, only, skip):
+    # app.json is rebuilt in every build, dedup has to update it again
+    config["dedup_assets"] = True
+    with pytest.raises(UsageException, match="updates app.json.*disable \"dedup_assets\""):
+        plan_build(config, only, skip)
+    assert plan_build(config, ["assets", "js", "dedup", "package"]) is not None
+
+
+def test_disabled_dedup_isnt_checked(config):
+    config["dedup_assets"] = False
+    assert _stages(plan_build(config, only=["assets"])) == {"assets", None}
+    assert "assets" not in _stages(plan_build(config, skip=["assets"]))
+
+
+def test_partial_build_with_dedup(project):
+    shutil.copy(project / "assets" / "a.png", project / "assets" / "icon2.png")
+    app_json = json.loads((project / "app.json").read_text())
+    app_json["app"]["icon"] = "icon2.png"
+    (project / "app.json").write_text(json.dumps(app_json))
+    (project / "zmake.json").write_text(json.dumps({"dedup_assets": True}))
+
+    def packaged():
+        with ZipFile(project / "dist" / f"{project.name}.bin") as arc:
+            return json.loads(arc.read("app.json"))["app"]["icon"], arc.namelist()
+
+    assert run_task(project, "build")["exit_code"] == 0
+    icon, names = packaged()
+    assert icon == "a.png"
+    assert "assets/icon2.png" not in names
+
+    summary = run_task(project, "build", only=["package"])
+    assert summary["error_type"] == "UsageException"
+    assert packaged() == (icon, names)
+
+    summary = run_task(project, "build", only=["assets", "js", "dedup", "package"])
+    assert summary["exit_code"] == 0, summary
+    assert packaged() == (icon, names)
@@ -0,0 +1,55 @@
+from zmake.build_scheduler import handler_dependencies
+from zmake.context import HandlerInfo
+
+
+def _info(inputs=(), outputs=()):
+    return HandlerInfo("test", None, [], None if inputs is None else list(inputs), list(outputs), None)
+
+
+def test_independent_handlers():
+    infos = [_info(outputs=["assets"]), _info(outputs=["app.js"]), _info()]
+    assert handler_dependencies(infos, "page") == [set(), set(), set()]
+
+
+def test_read_after_write():
+    infos = [_info(outputs=["assets"]), _info(inputs=["assets"], outputs=["app.json"])]
+    assert handler_dependencies(infos, "page") == [set(), {0}]
+
+
+def test_write_after_write():
+    infos = [_info(outputs=["assets"]), _info(outputs=["app.js"]), _info(outputs=["assets"])]
+    assert handler_dependencies(infos, "page") == [set(), set(), {0}]
+
+
+def test_write_after_read():
+    infos = [_info(inputs=["app.json"]), _info(outputs=["app.json"])]
+    assert handler_dependencies(infos, "page") == [set(), {0}]
+
+
+def test_nested_paths():
+    infos = [_info(outputs=["assets"]), _info(outputs=["assets/data"]),
+             _info(inputs=["assets/a.png"]), _info(outputs=["assets-2"])]
+    assert handler_dependencies(infos, "page") == [set(), {0}, {0}, set()]
+
+
+def test_read_after_read():
+    infos = [_info(inputs=["app.json"]), _info(inputs=["app.json"])]
+    assert handler_dependencies(infos, "page") == [set(), set()]
+
+
+def test_wildcard():
+    infos = [_info(outputs=["assets"]), _info(outputs=["app.js"]),
+             _info(inputs=["*"]), _info(outputs=["dist"])]
+    # Reader of everything waits for all earlier handlers, and later
+    # writers wait for it
+    assert handler_dependencies(infos, "page") == [set(), set(), {0, 1}, {2}]
+
+
+def test_undeclared_inputs_are_barrier():
+    infos = [_info(outputs=["assets"]), _info(inputs=None), _info(outputs=["app.js"]), _info()]
+    assert handler_dependencies(infos, "page") == [set(), {0}, {1}, {1}]
+
+
+def test_target_dir():
+    infos = [_info(outputs=["{target_dir}"]), _info(inputs=["page"]), _info(inputs=["other"])]
+    assert handler_dependencies(infos, "page") == [set(), {0}, set()]
@@ -0,0 +1,96 @@
+import json
+import logging
+
+import pytest
+
+from zmake import config as zmake_config
+from zmake.config import ZMakeConfig, validate
+from zmake.exceptions import ConfigException
+from zmake.utils import APP_PATH
+
+
+def _config(**overrides):
+    data = zmake_config.load_file(APP_PATH / "zmake.json")
+    config = ZMakeConfig(data, {key: "zmake.json" for key in data})
+    for key, value in overrides.items():
+        config[key] = value
+        config.sources[key] = "project.json"
+    return config
+
+
+def test_defaults_are_valid():
+    validate(_config())
+
+
+@pytest.mark.parametrize("key,value", [
+    ("auto_rle", "yes"),
+    ("anim_min_frames", 2.5),
+    ("auto_rle_tolerance", True),
+    ("cache_max_size_mb", "100"),
+    ("plugins", "plugin.py"),
+    ("overrides", []),
+])
+def test_wrong_type(key, value):
+    with pytest.raises(ConfigException, match=f"\"{key}\" in project.json has wrong type"):
+        validate(_config(**{key: value}))
+
+
+@pytest.mark.parametrize("key,value", [
+    ("def_format", "PNG"),
+    ("encode_mode", "Dialog"),
+    ("quantize_method", "nope"),
+])
+def test_bad_choice(key, value):
+    with pytest.raises(ConfigException, match=f"\"{key}\" in project.json should be one of"):
+        validate(_config(**{key: value}))
+
+
+def test_number_accepts_int_and_float():
+    validate(_config(auto_rle_tolerance=5, cache_max_size_mb=0.5))
+
+
+def test_missing_key():
+    config = _config()
+    del config["dedup_assets"]
+    with pytest.raises(ConfigException, match="\"dedup_assets\" is missing"):
+        validate(config)
+
+
+def test_optional_key():
+    config = _config()
+    config.pop("zab_base_url", None)
+    validate(config)
+
+
+def test_unknown_key_warns(caplog):
+    with caplog.at_level(logging.WARNING, logger="zmake"):
+        validate(_config(auto_frmat=True))
+    assert "Unknown config key \"auto_frmat\" in project.json" in caplog.text
+    assert "did you mean \"auto_format\"?" in caplog.text
+
+
+def test_load_merges_and_validates(tmp_path):
+    base = tmp_path / "base.json"
+    project = tmp_path / "project.json"
+    base.write_text(json.dumps(zmake_config.load_file(APP_PATH / "zmake.json")))
+    project.write_text(json.dumps({"def_format": "TGA-32"}))
+
+    config = zmake_config.load([base, tmp_path / "missing.json", project])
+    assert config.def_format == "TGA-32"
+    assert config.sources["def_format"] == project
+    assert config.sources["auto_rle"] == base
+
+    project.write_text(json.dumps({"def_format": 32}))
+    with pytest.raises(ConfigException, match="wrong type"):
+        zmake_config.load([base, project])
+
+
+def test_load_file_errors(tmp_path):
+    path = tmp_path / "zmake.json"
+    path.write_text("{")
+    with pytest.raises(ConfigException, match="Can't parse config file"):
+        zmake_config.load_file(path)
+
+    path.write_text("[1, 2, 3]")
+    with pytest.raises(ConfigException, match="should contain JSON object"):
+        zmake_config.load_file(path)
@@ -0,0 +1,122 @@
+import json
+
+import pytest
+from PIL import ImageFont
+
+from zmake import glyphs, image_io
+from zmake.exceptions import ConfigException
+from zmake.main import run_task
+from zmake.tga_verify import check_tga
+
+
+def _spec(**values):
+    spec = {"font": "font.ttf", "size": 20, "chars": "0123456789", "output": "time/d_{index}.png"}
+    spec.update(values)
+    return spec
+
+
+@pytest.fixture
+def font_file(tmp_path):
+    """
+    Font bundled with Pillow, saved to file.
+    """
+    font = ImageFont.load_default(20)
+    if not isinstance(font, ImageFont.FreeTypeFont):
+        pytest.skip("Pillow is built without FreeType")
+    path = tmp_path / "font.ttf"
+    path.write_bytes(font.font_bytes)
+    return path
+
+
+def test_parse_defaults():
+    spec = glyphs.parse_set(_spec(), 0, "TGA-RLP")
+    assert spec["chars"] == list("0123456789")
+    assert spec["format"] == "TGA-RLP"
+    assert (spec["color"], spec["stroke_width"], spec["padding"], spec["fixed_width"]) == ("#FFFFFF", 0, 0, True)
+
+    spec = glyphs.parse_set(_spec(chars=["Mon", "Tue"], format="TGA-32"), 0, "TGA-P")
+    assert spec["chars"] == ["Mon", "Tue"]
+    assert spec["format"] == "TGA-32"
+
+
+@pytest.mark.parametrize("values, message", [
+    ({"font": None}, "Glyph set #1 has no \"font\""),
+    ({"size": "20"}, "Wrong type of \"size\""),
+    ({"fixed_width": 1}, "Wrong type of \"fixed_width\""),
+    ({"size": True}, "Wrong type of \"size\""),
+    ({"colour": "#FFF"}, "Unknown key \"colour\""),
+    ({"chars": ""}, "non-empty \"chars\""),
+    ({"chars": ["a", ""]}, "non-empty \"chars\""),
+    ({"chars": ["a", 1]}, "non-empty \"chars\""),
+    ({"size": 0}, "Bad size"),
+    ({"format": "PNG"}, "Unsupported format \"PNG\""),
+    ({"output": "d_{name}.png"}, "Bad \"output\" template"),
+    ({"output": "digit.png"}, "aren't unique"),
+    ({"chars": "aa", "output": "{char}.png"}, "aren't unique"),
+    ({"color": "white-ish"}, "Bad color"),
+])
+def test_parse_errors(values, message):
+    spec = {key: value for key, value in _spec(**values).items() if value is not None}
+    with pytest.raises(ConfigException, match=message):
+        glyphs.parse_set(spec, 0, "TGA-P")
+
+
+def test_parse_not_object():
+    with pytest.raises(ConfigException, match="Glyph set #3 should be an object"):
+        glyphs.parse_set(["0123"], 2, "TGA-P")
+
+
+def test_output_names():
+    spec = glyphs.parse_set(_spec(chars=["1", "Mon", "é"], output="w/{index}_{char}_{code}.png"), 0, "TGA-P")
+    names = [glyphs.output_name(spec, i) for i in range(len(spec["chars"]))]
+    assert names == ["w/0_1_0031.png", "w/1_Mon_004d.png", "w/2_é_00e9.png"]
+
+
+def _encode(image, target_type):
+    return image_io.encode_auto(image, target_type, "dialog"), target_type
+
+
+def test_render_sets(font_file):
+    specs = [glyphs.parse_set(_spec(), 0, "TGA-P"),
+             glyphs.parse_set(_spec(chars=["Mon", "Tue"], output="week/{index}.png", fixed_width=False,
+                                    stroke_width=1, format="TGA-32"), 1, "TGA-P")]
+    results = glyphs.render_sets(font_file.parent, specs, _encode, "test")
+
+    digits, restored = results[0]
+    assert restored == 0
+    assert [name for name, _, _ in digits] == [f"time/d_{i}.png" for i in range(10)]
+    assert {target_type for _, _, target_type in digits} == {"TGA-P"}
+    assert all(check_tga(data) == [] for _, data, _ in digits)
+    # Fixed width set, same size for all digits
+    sizes = {int.from_bytes(data[22:24], "little") for _, data, _ in digits}
+    assert len(sizes) == 1
+
+    week, _ = results[1]
+    assert [(name, target_type) for name, _, target_type in week] == \
+        [("week/0.png", "TGA-32"), ("week/1.png", "TGA-32")]
+
+    # Second run is restored from cache
+    again = glyphs.render_sets(font_file.parent, specs, _encode, "test")
+    assert [restored for _, restored in again] == [10, 2]
+    assert again[0][0] == digits
+
+
+def test_missing_font(tmp_path):
+    with pytest.raises(ConfigException, match="not found"):
+        glyphs.render_sets(tmp_path, [glyphs.parse_set(_spec(), 0, "TGA-P")], _encode, "test")
+
+
+def test_build_glyph_sets(project, font_file):
+    (project / "fonts").mkdir()
+    font_file.rename(project / "fonts" / "digits.ttf")
+    (project / "zmake.json").write_text(json.dumps({"glyph_sets": [
+        _spec(font="fonts/digits.ttf", chars="0123", output="time/d_{char}.png"),
+    ]}))
+
+    summary = run_task(project, "build")
+    assert summary["exit_code"] == 0, summary
+    out = project / "build" / "assets" / "time"
+    assert sorted(p.name for p in out.iterdir()) == ["d_0.png", "d_1.png", "d_2.png", "d_3.png"]
+    assert all(check_tga((out / name).read_bytes()) == [] for name in ["d_0.png", "d_3.png"])
+    # Project assets are converted too
+    assert (project / "build" / "assets" / "a.png").is_file()
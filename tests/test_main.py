@@ -0,0 +1,91 @@
+import json
+
+from PIL import Image
+
+from zmake import constants, tga_save
+
+
+def _summary(output):
+    # Only summary goes to stdout
+    lines = output.out.splitlines()
+    assert len(lines) == 1, output.out
+    return json.loads(lines[0])
+
+
+def test_build(project, run_main):
+    code, output = run_main("-y", str(project))
+    assert code == constants.EXIT_OK
+    summary = _summary(output)
+    assert summary["status"] == "ok"
+    assert summary["action"] == "build"
+    assert summary["exit_code"] == constants.EXIT_OK
+    assert summary["version"] == constants.VERSION
+    assert summary["statistics"]["TGA-P"] == 2
+    assert summary["outputs"] == sorted(str(project / "dist" / name)
+                                        for name in ["infos.xml", f"{project.name}.bin", f"{project.name}.zip"])
+
+
+def test_init(tmp_path, run_main):
+    code, output = run_main("-y", "--type", "a", str(tmp_path))
+    assert code == constants.EXIT_OK
+    assert _summary(output)["action"] == "init"
+    assert json.loads((tmp_path / "app.json").read_text())["app"]["appType"] == "app"
+    assert (tmp_path / "page" / "index.js").is_file()
+
+
+def test_input_required(tmp_path, run_main):
+    code, output = run_main("-y", str(tmp_path))
+    assert code == constants.EXIT_INPUT_REQUIRED
+    summary = _summary(output)
+    assert summary["status"] == "failed"
+    assert summary["exit_code"] == constants.EXIT_INPUT_REQUIRED
+    assert summary["error_type"] == "InputRequiredException"
+    assert "Select new project type" in summary["error"]
+    # Nothing was created
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_convert_direction_required(tmp_path, run_main, make_png):
+    make_png(tmp_path / "a.png")
+    tga_save.save_palette_tga(Image.new("RGBA", (4, 4)), tmp_path / "b.png")
+    code, output = run_main("-y", str(tmp_path))
+    assert code == constants.EXIT_INPUT_REQUIRED
+    assert _summary(output)["action"] == "convert"
+
+    code, output = run_main("-y", "--direction", "encode", str(tmp_path))
+    assert code == constants.EXIT_OK
+    assert _summary(output)["action"] == "convert"
+
+
+def test_config_error(project, run_main):
+    (project / "zmake.json").write_text(json.dumps({"def_format": 32}))
+    code, output = run_main("-y", str(project))
+    assert code == constants.EXIT_CONFIG_ERROR
+    summary = _summary(output)
+    assert summary["error_type"] == "ConfigException"
+    assert "def_format" in summary["error"]
+
+
+def test_usage_error(project, run_main):
+    code, output = run_main("-y", "--only", "nope", str(project))
+    assert code == constants.EXIT_USAGE
+    assert _summary(output)["error_type"] == "UsageException"
+
+    # Partial build needs previous build
+    code, output = run_main("-y", "--only", "js", str(project))
+    assert code == constants.EXIT_USAGE
+    assert "run full build first" in _summary(output)["error"]
+
+
+def test_broken_asset(project, run_main):
+    data = (project / "assets" / "a.png").read_bytes()
+    (project / "assets" / "broken.png").write_bytes(data[:len(data) // 2])
+    code, output = run_main("-y", str(project))
+    assert code == constants.EXIT_ASSET_FAILED
+    assert _summary(output)["error_type"] == "AssetException"
+
+
+def test_no_path(run_main):
+    code, output = run_main("-y")
+    assert code == constants.EXIT_USAGE
+    assert "zmake.json" in output.out
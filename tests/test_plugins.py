@@ -0,0 +1,157 @@
+import json
+import logging
+import os
+import textwrap
+
+import pytest
+
+from zmake import context as zmake_context
+from zmake.context import HANDLER_INFO, active_handlers, plan_build
+from zmake.exceptions import ConfigException
+from zmake.main import run_task
+from zmake.plugins import load_plugins
+
+MINIFY = """
+import json
+from zmake.plugins import plugin_handler
+
+@plugin_handler({name!r}, ["data/*.json"], stage={stage!r}, outputs=[{output!r}])
+def minify(run):
+    for rel_name in run.changed:
+        data = json.loads((run.context.path / rel_name).read_bytes())
+        run.write(rel_name, {output!r} + rel_name[4:], json.dumps(data, separators=(",", ":")))
+"""
+
+
+def _write_plugin(project, name="Minify JSON", stage="data", output="data"):
+    path = project / "minify.py"
+    path.write_text(textwrap.dedent(MINIFY.format(name=name, stage=stage, output=output)))
+    # New version must be seen by mtime check, even within same clock tick
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    return path
+
+
+def _enable(project, plugins):
+    (project / "zmake.json").write_text(json.dumps({"plugins": plugins}))
+
+
+def _build(project, only=None, skip=None):
+    summary = run_task(project, "build", only=only, skip=skip)
+    assert summary["exit_code"] == 0, summary
+    return summary
+
+
+@pytest.fixture
+def plugin_project(project):
+    (project / "data").mkdir()
+    (project / "data" / "x.json").write_text('{"a": 1,\n "b": [1, 2]}')
+    _write_plugin(project)
+    _enable(project, ["minify.py"])
+    yield project
+    zmake_context.remove_plugin_handlers(str((project / "minify.py").resolve()))
+
+
+def _handlers(project):
+    plugin_id = str((project / "minify.py").resolve())
+    return [key for key in HANDLER_INFO if key[0] == plugin_id]
+
+
+def test_plugin_runs_and_caches(plugin_project, caplog):
+    summary = _build(plugin_project)
+    assert (plugin_project / "build" / "data" / "x.json").read_text() == '{"a":1,"b":[1,2]}'
+    assert "Minify JSON" in summary["timings"]
+    assert [HANDLER_INFO[key].stage for key in _handlers(plugin_project)] == ["data"]
+
+    caplog.clear()
+    with caplog.at_level(logging.INFO, logger="zmake"):
+        _build(plugin_project)
+    assert "0 of 1 files changed, 1 restored from cache" in caplog.text
+
+
+def test_reload_replaces_handlers(plugin_project):
+    _build(plugin_project)
+    _write_plugin(plugin_project, name="Compact JSON")
+    summary = _build(plugin_project)
+    assert "Compact JSON" in summary["timings"]
+    assert "Minify JSON" not in summary["timings"]
+    assert [key[1] for key in _handlers(plugin_project)] == ["Compact JSON"]
+
+
+def test_plugins_are_per_project(plugin_project, tmp_path):
+    other = tmp_path / "other"
+    other.mkdir()
+    _write_plugin(other)
+    try:
+        ids = load_plugins(["minify.py"], other) + load_plugins(["minify.py"], plugin_project)
+        assert len(set(ids)) == 2
+        # Only handlers of enabled plugins are used
+        keys = [key for key, _ in active_handlers(ids[:1])]
+        assert (ids[0], "Minify JSON") in keys
+        assert (ids[1], "Minify JSON") not in keys
+    finally:
+        zmake_context.remove_plugin_handlers(str((other / "minify.py").resolve()))
+
+
+def test_missing_plugin(project):
+    with pytest.raises(ConfigException, match="not found"):
+        load_plugins(["nope.py"], project)
+    with pytest.raises(ConfigException, match="isn't installed"):
+        load_plugins(["zmake_no_such_plugin"], project)
+
+
+def test_partial_build_keeps_plugin_outputs(plugin_project):
+    _build(plugin_project)
+    assets = sorted(p.name for p in (plugin_project / "build" / "assets").rglob("*"))
+
+    _build(plugin_project, only=["js"])
+    assert sorted(p.name for p in (plugin_project / "build" / "assets").rglob("*")) == assets
+    assert (plugin_project / "build" / "data" / "x.json").is_file()
+
+    (plugin_project / "data" / "x.json").write_text('{"c": 3}')
+    _build(plugin_project, only=["data"])
+    assert (plugin_project / "build" / "data" / "x.json").read_text() == '{"c":3}'
+    assert sorted(p.name for p in (plugin_project / "build" / "assets").rglob("*")) == assets
+
+
+def test_partial_build_keeps_nested_outputs(plugin_project):
+    _write_plugin(plugin_project, output="assets/data")
+    _build(plugin_project)
+    assert (plugin_project / "build" / "assets" / "data" / "x.json").is_file()
+
+    (plugin_project / "assets" / "a.png").unlink()
+    _build(plugin_project, only=["assets"])
+    # Converted assets are rebuilt, plugin output inside assets/ is kept
+    assert not (plugin_project / "build" / "assets" / "a.png").exists()
+    assert (plugin_project / "build" / "assets" / "sub" / "b.png").is_file()
+    assert (plugin_project / "build" / "assets" / "data" / "x.json").is_file()
+
+
+def test_unstaged_plugin_runs_only_in_full_build(project):
+    (project / "data").mkdir()
+    (project / "data" / "x.json").write_text('{"a": 1}')
+    _write_plugin(project, stage=None)
+    _enable(project, ["minify.py"])
+    try:
+        _build(project)
+        assets = sorted(p.name for p in (project / "build" / "assets").rglob("*"))
+        summary = _build(project, only=["js"])
+        assert "Minify JSON" not in summary["timings"]
+        assert (project / "build" / "data" / "x.json").is_file()
+        assert sorted(p.name for p in (project / "build" / "assets").rglob("*")) == assets
+    finally:
+        zmake_context.remove_plugin_handlers(str((project / "minify.py").resolve()))
+
+
+def test_plan_skips_unstaged_plugin_handlers(plugin_project):
+    plugin_id = load_plugins(["minify.py"], plugin_project)[0]
+    zmake_context.loading_plugin = plugin_id
+    try:
+        zmake_context.build_handler("Unstaged", outputs=["assets"])(lambda context: None)
+    finally:
+        zmake_context.loading_plugin = None
+
+    config = {"dedup_assets": False, "glyph_sets": []}
+    plan = plan_build(config, only=["js"], handlers=active_handlers([plugin_id]))
+    assert (plugin_id, "Unstaged") not in plan
+    assert (None, "Process app.json") in plan
@@ -0,0 +1,95 @@
+import random
+
+import pytest
+from PIL import Image, features
+
+from zmake import quantize
+from zmake.quantize import has_alpha, resolve_method
+
+METHODS = ["kmeans", "octree", "mediancut"]
+if features.check_feature("libimagequant"):
+    METHODS.append("libimagequant")
+
+
+def _gradient(width=64, height=48, alpha=True):
+    image = Image.new("RGBA", (width, height))
+    image.putdata([(x * 4, y * 5, (x * y) % 256, (255 if x < width // 2 else (x * 8) % 256) if alpha else 255)
+                   for y in range(height) for x in range(width)])
+    return image
+
+
+def _colors(image: Image.Image):
+    return {color for _, color in image.getcolors(image.width * image.height)}
+
+
+def test_has_alpha():
+    assert not has_alpha(Image.new("RGB", (4, 4)))
+    assert not has_alpha(Image.new("RGBA", (4, 4), (1, 2, 3, 255)))
+    image = Image.new("RGBA", (4, 4), (1, 2, 3, 255))
+    image.putpixel((3, 3), (1, 2, 3, 254))
+    assert has_alpha(image)
+    assert has_alpha(Image.new("RGBA", (1, 1), (0, 0, 0, 0)))
+
+
+def test_resolve_method():
+    with pytest.raises(ValueError):
+        resolve_method("nope")
+    assert resolve_method("octree") == "octree"
+    assert resolve_method("mediancut") == "mediancut"
+    assert resolve_method("auto") in ("libimagequant", "kmeans", "octree")
+
+
+def test_resolve_method_without_numpy(monkeypatch):
+    monkeypatch.setattr(quantize, "np", None)
+    assert resolve_method("kmeans") == "octree"
+
+
+@pytest.mark.parametrize("method", METHODS)
+@pytest.mark.parametrize("colors", [256, 16, 2])
+@pytest.mark.parametrize("dither", [False, True])
+def test_color_limit(method, colors, dither):
+    image = _gradient()
+    result = quantize.quantize(image, method, dither, colors, use_cache=False)
+    assert result.mode == "RGBA"
+    assert result.size == image.size
+    assert len(_colors(result)) <= colors
+
+
+@pytest.mark.parametrize("method", METHODS)
+def test_transparent_pixels_stay_transparent(method):
+    image = _gradient(alpha=False)
+    for x in range(10):
+        for y in range(10):
+            image.putpixel((x, y), (x * 20, y * 20, 0, 0))
+    result = quantize.quantize(image, method, colors=64, use_cache=False)
+    assert has_alpha(result)
+    assert all(result.getpixel((x, y))[3] < 32 for x in range(10) for y in range(10))
+    # Opaque pixels stay opaque
+    assert result.getpixel((40, 40))[3] == 255
+
+
+@pytest.mark.parametrize("method", METHODS)
+def test_opaque_image_stays_opaque(method):
+    result = quantize.quantize(_gradient(alpha=False), method, True, 32, use_cache=False)
+    assert not has_alpha(result)
+
+
+def test_kmeans_keeps_exact_colors():
+    # Fewer colors than limit: nothing to merge
+    rnd = random.Random(1)
+    palette = [(rnd.randrange(256), rnd.randrange(256), rnd.randrange(256), rnd.choice([0, 100, 255]))
+               for _ in range(20)]
+    image = Image.new("RGBA", (200, 120))
+    image.putdata([palette[(x // 15 + y // 15) % len(palette)] for y in range(120) for x in range(200)])
+    result = quantize.quantize(image, "kmeans", colors=32, use_cache=False)
+    assert result.tobytes() == image.tobytes()
+
+
+def test_cache(monkeypatch):
+    image = _gradient()
+    first = quantize.quantize(image, "octree", colors=16)
+
+    def fail(*args):
+        raise AssertionError("Not cached")
+    monkeypatch.setattr(quantize, "_pillow_quantize", fail)
+    assert quantize.quantize(image, "octree", colors=16).tobytes() == first.tobytes()
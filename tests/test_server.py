@@ -0,0 +1,128 @@
+import json
+import logging
+import os
+import socket
+import stat
+import threading
+
+import pytest
+
+from zmake import constants, server
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="needs Unix sockets")
+
+
+@pytest.fixture
+def daemon(tmp_path, caplog):
+    """
+    Daemon on Unix socket in temporary folder, with default token file.
+    """
+    # Level is set by main() in real daemon
+    caplog.set_level(logging.INFO, logger="zmake")
+    address = f"unix:{tmp_path / 'zmake.sock'}"
+    thread = threading.Thread(target=server.serve, args=(address, 16), daemon=True)
+    thread.start()
+    for _ in range(100):
+        if server.is_running(address):
+            break
+        thread.join(0.05)
+    else:
+        pytest.fail("Daemon didn't start")
+
+    yield address
+
+    server.send_request({"action": "shutdown"}, address=address, timeout=5)
+    thread.join(5)
+    assert not thread.is_alive()
+    assert not (tmp_path / "zmake.sock").exists()
+    assert not constants.DAEMON_TOKEN_FILE.exists()
+
+
+def _raw_request(address: str, line: bytes):
+    family, connect_address = server.parse_address(address)
+    with socket.socket(family, socket.SOCK_STREAM) as sock:
+        sock.settimeout(5)
+        sock.connect(connect_address)
+        sock.sendall(line + b"\n")
+        with sock.makefile("rb") as f:
+            return [json.loads(line) for line in f]
+
+
+def test_socket_and_token_are_private(daemon):
+    assert stat.S_IMODE(os.stat(server.parse_address(daemon)[1]).st_mode) == 0o600
+    assert stat.S_IMODE(constants.DAEMON_TOKEN_FILE.stat().st_mode) == 0o600
+
+
+def test_ping(daemon):
+    result = server.send_request({"action": "ping"}, address=daemon, timeout=5)
+    assert result["status"] == "ok"
+    assert result["version"] == constants.VERSION
+
+
+@pytest.mark.parametrize("line", [
+    b'{"action": "ping"}',
+    b'{"action": "ping", "token": "0000"}',
+    b'{"action": "ping", "token": 1}',
+    b'not json',
+    b'[]',
+    b'"x"',
+    b'null',
+])
+def test_bad_token(daemon, line):
+    events = _raw_request(daemon, line)
+    assert events == [{"event": "result", "status": "failed", "exit_code": constants.EXIT_USAGE,
+                       "error": "Bad or missing token"}]
+    # Daemon is still alive
+    assert server.is_running(daemon)
+
+
+@pytest.mark.parametrize("request_data", [
+    {"action": "nope", "path": "/tmp"},
+    {"action": "build"},
+    {"action": "build", "path": ["x"]},
+])
+def test_bad_request(daemon, request_data):
+    result = server.send_request(request_data, address=daemon, timeout=5)
+    assert result["status"] == "failed"
+    assert result["error"] == "Bad request"
+    assert result["exit_code"] == constants.EXIT_USAGE
+
+
+def test_cancel_without_task(daemon):
+    result = server.send_request({"action": "cancel"}, address=daemon, timeout=5)
+    assert result["status"] == "ok"
+    assert result["cancelled"] is False
+
+
+def test_build(daemon, project):
+    events = []
+    result = server.send_request({"action": "build", "path": str(project)}, events.append, daemon, timeout=60)
+    assert result["status"] == "ok", result
+    assert result["action"] == "build"
+    assert str(project / "dist" / f"{project.name}.bin") in result["outputs"]
+    assert any(e["event"] == "log" and "Completed without error." in e["message"] for e in events)
+    assert any(e["event"] == "progress" for e in events)
+
+
+def test_failed_task(daemon, tmp_path):
+    result = server.send_request({"action": "build", "path": str(tmp_path / "missing")}, address=daemon,
+                                 timeout=60)
+    assert result["status"] == "failed"
+    assert result["exit_code"] != constants.EXIT_OK
+
+
+def test_main_uses_daemon(daemon, project, run_main):
+    code, output = run_main("-y", "--daemon", "--daemon-address", daemon, str(project))
+    assert code == constants.EXIT_OK
+    summary = json.loads(output.out)
+    assert summary["status"] == "ok"
+    assert "event" not in summary
+    assert "Completed without error." in output.err
+
+
+def test_main_falls_back_to_local(project, tmp_path, run_main):
+    address = f"unix:{tmp_path / 'none.sock'}"
+    code, output = run_main("-y", "--daemon", "--daemon-address", address, str(project))
+    assert code == constants.EXIT_OK
+    assert json.loads(output.out)["status"] == "ok"
+    assert (project / "dist" / f"{project.name}.bin").is_file()
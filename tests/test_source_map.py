@@ -0,0 +1,143 @@
+import json
+import sys
+
+import pytest
+
+from zmake import third_tools_manager
+from zmake.main import run_task
+from zmake.source_map import BASE64_CHARS, SourceMapBuilder, shift_source_map
+
+FAKE_UGLIFYJS = """
+import json, sys
+
+args = sys.argv[1:]
+output = args[args.index("-o") + 1]
+with open(args[-1]) as f:
+    code = f.read()
+with open(output, "w") as f:
+    f.write(code)
+if "--source-map" in args:
+    content = args[args.index("--source-map") + 1][len("content="):].strip("'")
+    with open(content) as f:
+        data = json.load(f)
+    data["uglified"] = True
+    with open(output + ".map", "w") as f:
+        json.dump(data, f)
+"""
+
+
+def _decode_vlq(text: str):
+    values = []
+    value = shift = 0
+    for char in text:
+        digit = BASE64_CHARS.index(char)
+        value |= (digit & 31) << shift
+        shift += 5
+        if not digit & 32:
+            values.append(-(value >> 1) if value & 1 else value >> 1)
+            value = shift = 0
+    return values
+
+
+def _decode_mappings(mappings: str):
+    """
+    :return: dict generated line -> (source index, source line)
+    """
+    result = {}
+    source = line = 0
+    for generated_line, segments in enumerate(mappings.split(";")):
+        for segment in filter(None, segments.split(",")):
+            values = _decode_vlq(segment)
+            source += values[1]
+            line += values[2]
+            result[generated_line] = (source, line)
+    return result
+
+
+def test_builder(tmp_path):
+    builder = SourceMapBuilder("index.js")
+    a = builder.add_source("../src/a.js")
+    b = builder.add_source("../src/b.js")
+    builder.add_line(2, a, 0)
+    builder.add_line(3, a, 1)
+    builder.add_line(6, b, 0)
+    builder.add_line(7, a, 40)
+    builder.save(tmp_path / "index.js.map")
+
+    data = json.loads((tmp_path / "index.js.map").read_text())
+    assert data["version"] == 3
+    assert data["file"] == "index.js"
+    assert data["sources"] == ["../src/a.js", "../src/b.js"]
+    assert _decode_mappings(data["mappings"]) == {2: (0, 0), 3: (0, 1), 6: (1, 0), 7: (0, 40)}
+
+
+def test_shift(tmp_path):
+    builder = SourceMapBuilder("index.js")
+    source = builder.add_source("a.js")
+    builder.add_line(0, source, 5)
+    builder.add_line(1, source, 6)
+    builder.save(tmp_path / "index.js.map")
+
+    shift_source_map(tmp_path / "index.js.map", 3)
+    data = json.loads((tmp_path / "index.js.map").read_text())
+    assert _decode_mappings(data["mappings"]) == {3: (0, 5), 4: (0, 6)}
+    assert data["sources"] == ["a.js"]
+
+
+@pytest.fixture
+def src_project(project):
+    (project / "watchface" / "index.js").unlink()
+    (project / "src").mkdir()
+    (project / "src" / "a.js").write_text("const a = 1;\nconst b = 2;\n")
+    (project / "src" / "b.js").write_text("function f() {\n  return a + b;\n}")
+    return project
+
+
+def _set_config(project, **config):
+    (project / "zmake.json").write_text(json.dumps(config))
+
+
+def _check_map(project):
+    """
+    Every mapped line of generated file should be same as source line.
+    """
+    data = json.loads((project / "dist" / "index.js.map").read_text())
+    generated = (project / "build" / "watchface" / "index.js").read_text().splitlines()
+    sources = [(project / "dist" / name).resolve().read_text().splitlines() for name in data["sources"]]
+    mappings = _decode_mappings(data["mappings"])
+    assert len(mappings) == 5
+    for generated_line, (source, source_line) in mappings.items():
+        assert generated[generated_line] == sources[source][source_line]
+    return data
+
+
+def test_build_with_source_map(src_project):
+    _set_config(src_project, with_source_map=True)
+    assert run_task(src_project, "build")["exit_code"] == 0
+    data = _check_map(src_project)
+    assert data["sources"] == ["../src/a.js", "../src/b.js"]
+
+
+def test_uglifyjs_map_chaining(src_project, tmp_path, monkeypatch):
+    tool = tmp_path / "uglifyjs"
+    tool.write_text(f"#!{sys.executable}\n{FAKE_UGLIFYJS}")
+    tool.chmod(0o755)
+    monkeypatch.setitem(third_tools_manager._tool_locations, "uglifyjs", str(tool))
+
+    _set_config(src_project, with_source_map=True, with_uglifyjs=True)
+    summary = run_task(src_project, "build")
+    assert summary["exit_code"] == 0, summary
+    assert not (src_project / "build" / "watchface" / "index.js.map").exists()
+    # Map written by uglify replaces our one, comment shift is applied after
+    assert _check_map(src_project)["uglified"] is True
+
+
+def test_stale_map_is_removed(src_project):
+    _set_config(src_project, with_source_map=True)
+    assert run_task(src_project, "build")["exit_code"] == 0
+    assert (src_project / "dist" / "index.js.map").is_file()
+
+    _set_config(src_project, with_source_map=False)
+    summary = run_task(src_project, "build", only=["js"])
+    assert summary["exit_code"] == 0, summary
+    assert not (src_project / "dist" / "index.js.map").exists()
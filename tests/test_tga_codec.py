@@ -0,0 +1,225 @@
+import io
+import random
+
+import pytest
+from PIL import Image
+
+from zmake import image_io, tga_load, tga_save, tga_verify
+
+ENCODE_MODES = ["dialog", "nxp"]
+
+
+def _palette_image(width, height, colors=40, seed=1):
+    rnd = random.Random(seed)
+    palette = [(rnd.randrange(256), rnd.randrange(256), rnd.randrange(256), rnd.choice([0, 128, 255]))
+               for _ in range(colors)]
+    image = Image.new("RGBA", (width, height))
+    # Runs of same color, so RLE has both run and raw packets
+    pixels = []
+    while len(pixels) < width * height:
+        pixels.extend([rnd.choice(palette)] * rnd.choice([1, 1, 2, 5, 130]))
+    image.putdata(pixels[:width * height])
+    return image
+
+
+def _rgb565_image(width, height, seed=2):
+    # Only colors that RGB565 stores without loss
+    rnd = random.Random(seed)
+    image = Image.new("RGBA", (width, height))
+    image.putdata([(rnd.randrange(32) * 255 // 31, rnd.randrange(64) * 255 // 63, rnd.randrange(32) * 255 // 31, 255)
+                   for _ in range(width * height)])
+    return image
+
+
+def _truecolor_image(width, height, seed=3):
+    rnd = random.Random(seed)
+    image = Image.new("RGBA", (width, height))
+    image.putdata([tuple(rnd.randrange(256) for _ in range(3)) + (rnd.randrange(1, 256),)
+                   for _ in range(width * height)])
+    return image
+
+
+def _decode(data: bytes, encode_mode: str):
+    image, _ = image_io.load_stream(io.BufferedReader(io.BytesIO(data)), encode_mode)
+    return image.convert("RGBA")
+
+
+def _decode_rows(data: bytes, encode_mode: str):
+    reader = image_io.open_rows(io.BufferedReader(io.BytesIO(data)), encode_mode)
+    return Image.frombytes("RGBA", (reader.width, reader.height), b"".join(reader.rows()))
+
+
+@pytest.mark.parametrize("encode_mode", ENCODE_MODES)
+@pytest.mark.parametrize("target_type, make_image", [
+    ("TGA-P", _palette_image),
+    ("TGA-RLP", _palette_image),
+    ("TGA-16", _rgb565_image),
+    ("TGA-32", _truecolor_image),
+])
+@pytest.mark.parametrize("size", [(13, 7), (32, 20), (1, 1)])
+def test_round_trip(encode_mode, target_type, make_image, size):
+    image = make_image(*size)
+    data = image_io.encode_auto(image, target_type, encode_mode)
+
+    decoded = _decode(data, encode_mode)
+    assert decoded.size == image.size
+    assert decoded.tobytes() == image.tobytes()
+    assert _decode_rows(data, encode_mode).tobytes() == image.tobytes()
+
+
+@pytest.mark.parametrize("encode_mode", ENCODE_MODES)
+@pytest.mark.parametrize("target_type", ["TGA-P", "TGA-RLP"])
+def test_truncated_palette_round_trip(encode_mode, target_type):
+    image = _palette_image(17, 9, colors=5)
+    data = image_io.encode_auto(image, target_type, encode_mode, truncate_palette=True)
+
+    assert int.from_bytes(data[5:7], "little") < 256
+    assert _decode(data, encode_mode).tobytes() == image.tobytes()
+
+
+@pytest.mark.parametrize("target_type", ["TGA-16", "TGA-32"])
+def test_truecolor_channel_order(target_type):
+    image = Image.new("RGBA", (16, 1), (255, 0, 0, 255))
+    for encode_mode in ENCODE_MODES:
+        data = image_io.encode_auto(image, target_type, encode_mode)
+        pixel = data[-(2 if target_type == "TGA-16" else 4):]
+        # Device format: little-endian RGB565 / BGRA in both modes
+        assert pixel == (b"\x00\xf8" if target_type == "TGA-16" else b"\x00\x00\xff\xff")
+
+
+def test_nxp_rows_are_padded():
+    image = _palette_image(13, 3)
+    data = image_io.encode_auto(image, "TGA-P", "nxp")
+
+    # Stored width is aligned to 16 pixels, real width is in ID block
+    assert int.from_bytes(data[12:14], "little") == 16
+    assert int.from_bytes(data[22:24], "little") == 13
+
+
+STREAM_FORMATS = [
+    ("TGA-P", _palette_image),
+    ("TGA-RLP", _palette_image),
+    ("TGA-16", _rgb565_image),
+    ("TGA-32", _truecolor_image),
+]
+
+
+@pytest.mark.parametrize("encode_mode", ENCODE_MODES)
+@pytest.mark.parametrize("target_type, make_image", STREAM_FORMATS)
+@pytest.mark.parametrize("numpy", [True, False])
+def test_streamed_rows(encode_mode, target_type, make_image, numpy, monkeypatch):
+    if not numpy:
+        monkeypatch.setattr(tga_load, "np", None)
+    image = make_image(13, 70)
+    data = image_io.encode_auto(image, target_type, encode_mode)
+    full = _decode(data, encode_mode).tobytes()
+
+    f = io.BufferedReader(io.BytesIO(data))
+    reader = image_io.open_rows(f, encode_mode)
+    assert reader.format == target_type
+    assert reader.size == (13, 70)
+    # nxp rows are padded to 16 pixels, padding isn't returned
+    assert reader.tga_width == (16 if encode_mode == "nxp" else 13)
+
+    rows = reader.rows()
+    first = next(rows)
+    if target_type != "TGA-RLP":
+        # Only the first row is read yet
+        assert f.tell() < len(data) - reader.tga_width * reader.bpp
+    rows = [first, *rows]
+    assert len(rows) == 70
+    assert all(len(row) == 13 * 4 for row in rows)
+    assert b"".join(rows) == full
+
+    tiles = list(image_io.open_rows(io.BufferedReader(io.BytesIO(data)), encode_mode).tiles(32))
+    assert [(y, tile.size) for y, tile in tiles] == [(0, (13, 32)), (32, (13, 32)), (64, (13, 6))]
+    assert b"".join(tile.tobytes() for _, tile in tiles) == full
+
+
+@pytest.mark.parametrize("target_type", ["TGA-P", "TGA-RLP"])
+def test_streamed_rows_truncated(target_type):
+    data = image_io.encode_auto(_palette_image(13, 70), target_type, "dialog")
+    reader = image_io.open_rows(io.BufferedReader(io.BytesIO(data[:-1])), "dialog")
+    with pytest.raises(ValueError, match="Truncated"):
+        list(reader.rows())
+
+
+@pytest.mark.parametrize("encode_mode", ENCODE_MODES)
+@pytest.mark.parametrize("target_type, make_image", STREAM_FORMATS)
+def test_save_png_rows(encode_mode, target_type, make_image):
+    image = make_image(13, 70)
+    data = image_io.encode_auto(image, target_type, encode_mode)
+    reader = image_io.open_rows(io.BufferedReader(io.BytesIO(data)), encode_mode)
+
+    out = io.BytesIO()
+    image_io.save_png_rows(out, reader.width, reader.height, reader.rows())
+    out.seek(0)
+    png = Image.open(out)
+    assert (png.mode, png.size) == ("RGBA", (13, 70))
+    assert png.tobytes() == _decode(data, encode_mode).tobytes()
+
+
+def test_open_rows_skips_png(tmp_path, make_png):
+    make_png(tmp_path / "a.png")
+    with open(tmp_path / "a.png", "rb") as f:
+        assert image_io.open_rows(f, "dialog") is None
+        assert f.tell() == 0
+
+
+def _frames(width, height):
+    # Frames share some colors, each frame has own ones too
+    common = [(255, 0, 0, 255), (0, 0, 0, 0)]
+    frames = []
+    for i in range(3):
+        colors = common + [(i * 40, 100, 200, 255), (10, i * 60, 20, 128)]
+        image = Image.new("RGBA", (width, height))
+        image.putdata([colors[(x + y + i) % len(colors)] for y in range(height) for x in range(width)])
+        frames.append(image)
+    return frames
+
+
+def _palette(data: bytes):
+    length = int.from_bytes(data[5:7], "little")
+    start = 18 + data[0]
+    return data[start:start + length * 4]
+
+
+@pytest.mark.parametrize("encode_mode", ENCODE_MODES)
+@pytest.mark.parametrize("rle", [False, True])
+@pytest.mark.parametrize("truncate", [False, True])
+@pytest.mark.parametrize("width", [13, 16])
+def test_palette_sequence(encode_mode, rle, truncate, width):
+    frames = _frames(width, 5)
+    results = tga_save.encode_palette_sequence(frames, encode_mode, rle, truncate)
+    assert len(results) == len(frames)
+
+    # 2 common colors and 2 own colors per frame
+    expected_length = 8 if truncate else 256
+    for data, frame in zip(results, frames):
+        assert int.from_bytes(data[5:7], "little") == expected_length
+        assert data[2] == (9 if rle else 1)
+        assert _palette(data) == _palette(results[0])
+        assert tga_verify.check_tga(data) == []
+        assert _decode(data, encode_mode).tobytes() == frame.tobytes()
+        assert _decode_rows(data, encode_mode).tobytes() == frame.tobytes()
+
+
+@pytest.mark.parametrize("encode_mode", ENCODE_MODES)
+@pytest.mark.parametrize("target_type", ["TGA-P", "TGA-RLP"])
+def test_truncated_palette_index_bounds(encode_mode, target_type):
+    image = _palette_image(13, 9, colors=5)
+    data = image_io.encode_auto(image, target_type, encode_mode, truncate_palette=True)
+    length = int.from_bytes(data[5:7], "little")
+    colors = {color for _, color in image.getcolors()}
+    if encode_mode == "nxp":
+        # Padding pixels are transparent black
+        colors.add((0, 0, 0, 0))
+    assert length == len(colors)
+    assert tga_verify.check_tga(data) == []
+
+    if target_type == "TGA-P":
+        # Index past truncated palette is detected
+        broken = bytearray(data)
+        broken[-1] = length
+        assert tga_verify.check_tga(bytes(broken)) == [f"palette index {length} out of range"]
+
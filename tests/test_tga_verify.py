@@ -0,0 +1,148 @@
+import zipfile
+
+import pytest
+from PIL import Image
+
+from zmake import tga_save
+from zmake.tga_verify import HEADER_SIZE, ID_SIZE, check_tga, verify_path
+
+
+def _image(width=13, height=7):
+    image = Image.new("RGBA", (width, height))
+    colors = [(0, 0, 0, 0), (255, 0, 0, 255), (0, 128, 255, 200)]
+    image.putdata([colors[(x * 7 + y) % 3] for y in range(height) for x in range(width)])
+    return image
+
+
+def _encode(target_type, encode_mode="dialog"):
+    image = _image()
+    if target_type == "TGA-P":
+        return tga_save.encode_palette_tga(image, encode_mode)
+    elif target_type == "TGA-RLP":
+        return tga_save.encode_rl_palette_tga(image, encode_mode)
+    return tga_save.encode_truecolor_tga(image, 16 if target_type == "TGA-16" else 32, encode_mode)
+
+
+def _palette_end(data: bytes):
+    return HEADER_SIZE + data[0] + int.from_bytes(data[5:7], "little") * 4
+
+
+FORMATS = ["TGA-P", "TGA-RLP", "TGA-16", "TGA-32"]
+
+
+@pytest.mark.parametrize("encode_mode", ["dialog", "nxp"])
+@pytest.mark.parametrize("target_type", FORMATS)
+def test_valid(target_type, encode_mode):
+    assert check_tga(_encode(target_type, encode_mode)) == []
+
+
+def test_truncated_header():
+    assert check_tga(b"") == ["truncated header"]
+    assert check_tga(_encode("TGA-P")[:HEADER_SIZE - 1]) == ["truncated header"]
+
+
+@pytest.mark.parametrize("target_type", FORMATS)
+def test_truncated_id_block(target_type):
+    data = _encode(target_type)
+    assert check_tga(data[:HEADER_SIZE + ID_SIZE - 1]) == ["truncated ID block"]
+
+
+@pytest.mark.parametrize("target_type", ["TGA-P", "TGA-RLP"])
+def test_truncated_palette(target_type):
+    data = _encode(target_type)
+    assert check_tga(data[:_palette_end(data) - 1]) == ["truncated palette"]
+
+
+@pytest.mark.parametrize("target_type", ["TGA-P", "TGA-16", "TGA-32"])
+def test_truncated_data(target_type):
+    problems = check_tga(_encode(target_type)[:-1])
+    assert len(problems) == 1
+    assert problems[0].startswith("truncated image data")
+
+
+def test_truncated_rle():
+    data = _encode("TGA-RLP")
+    for end in (len(data) - 1, _palette_end(data) + 1):
+        problems = check_tga(data[:end])
+        assert len(problems) == 1
+        assert problems[0].startswith("truncated RLE data")
+
+
+@pytest.mark.parametrize("target_type", FORMATS)
+def test_trailing_bytes(target_type):
+    assert check_tga(_encode(target_type) + b"\0\0") == ["2 bytes after image data"]
+
+
+def test_rle_packet_exceeds_image():
+    data = bytearray(_encode("TGA-RLP"))
+    # Make image one pixel shorter: last packet now ends after image
+    width = int.from_bytes(data[12:14], "little")
+    height = int.from_bytes(data[14:16], "little")
+    data[12:14] = (width * height - 1).to_bytes(2, "little")
+    data[14:16] = (1).to_bytes(2, "little")
+    data[HEADER_SIZE + 4:HEADER_SIZE + 6] = (width * height - 1).to_bytes(2, "little")
+    assert check_tga(bytes(data)) == ["last RLE packet exceeds image by 1 pixels"]
+
+
+def test_unsupported_type():
+    data = bytearray(_encode("TGA-P"))
+    data[2] = 10
+    assert check_tga(bytes(data)) == ["unsupported image type 10"]
+
+    data = bytearray(_encode("TGA-32"))
+    data[16] = 24
+    assert check_tga(bytes(data)) == ["unsupported color depth 24"]
+
+
+@pytest.mark.parametrize("target_type", ["TGA-P", "TGA-RLP"])
+def test_palette_index_out_of_range(target_type):
+    data = bytearray(_encode(target_type))
+    end = _palette_end(data)
+    # Image uses 3 colors, keep only 2 palette entries
+    data[5:7] = (2).to_bytes(2, "little")
+    del data[_palette_end(data):end]
+    assert check_tga(bytes(data)) == ["palette index 2 out of range"]
+
+
+def test_bad_palette_header():
+    data = bytearray(_encode("TGA-P"))
+    data[1] = 0
+    data[7] = 24
+    assert check_tga(bytes(data)) == ["palette flag isn't set", "unsupported palette entry size 24"]
+
+
+def test_no_somh_block():
+    data = bytearray(_encode("TGA-P"))
+    data[HEADER_SIZE:HEADER_SIZE + 4] = b"XXXX"
+    assert check_tga(bytes(data)) == ["no SOMH ID block"]
+
+    data = bytearray(_encode("TGA-32"))
+    # Same pixels without ID block
+    data = data[:HEADER_SIZE] + data[HEADER_SIZE + data[0]:]
+    data[0] = 0
+    assert check_tga(bytes(data)) == ["no SOMH ID block"]
+
+
+def test_bad_real_width():
+    data = bytearray(_encode("TGA-P", "nxp"))
+    header_width = int.from_bytes(data[12:14], "little")
+    data[HEADER_SIZE + 4:HEADER_SIZE + 6] = (header_width + 1).to_bytes(2, "little")
+    assert check_tga(bytes(data)) == [f"bad width in ID block: {header_width + 1}, header width {header_width}"]
+
+
+def test_verify_path(tmp_path):
+    good = _encode("TGA-RLP")
+    bad = _encode("TGA-32")[:-3]
+    inner = tmp_path / "device.zip"
+    with zipfile.ZipFile(inner, "w") as arc:
+        arc.writestr("assets/good.png", good)
+        arc.writestr("assets/bad.png", bad)
+        arc.writestr("assets/real.png", b"\211PNG\r\n\032\n")
+    package = tmp_path / "app.zab"
+    with zipfile.ZipFile(package, "w") as arc:
+        arc.write(inner, "app.zpk")
+
+    checked, broken = verify_path(package)
+    assert checked == 2
+    assert list(broken) == ["app.zpk/assets/bad.png"]
+    assert broken["app.zpk/assets/bad.png"][0].startswith("truncated image data")
@@ -0,0 +1,36 @@
+import os
+
+from zmake import third_tools_manager
+from zmake.third_tools_manager import find_tool, get_tool_version
+
+
+def _write_tool(path, version):
+    path.write_text(f"#!/bin/sh\necho {version}\n")
+    path.chmod(0o755)
+    # Make sure rewrite is visible even within same clock tick
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_tool_version_follows_updates(tmp_path, monkeypatch):
+    monkeypatch.setenv("PATH", str(tmp_path))
+    monkeypatch.setattr(third_tools_manager, "_tool_locations", {})
+    tool = tmp_path / "zmake-test-tool"
+
+    # Missing tool isn't memoized
+    assert get_tool_version("zmake-test-tool") is None
+    _write_tool(tool, "1.0.0")
+    assert get_tool_version("zmake-test-tool") == "1.0.0"
+    assert find_tool("zmake-test-tool")[0] == str(tool)
+
+    _write_tool(tool, "1.1.0")
+    assert get_tool_version("zmake-test-tool") == "1.1.0"
+
+    # Removed tool is looked up again
+    tool.unlink()
+    assert get_tool_version("zmake-test-tool") is None
+    other = tmp_path / "bin"
+    other.mkdir()
+    monkeypatch.setenv("PATH", str(other))
+    _write_tool(other / "zmake-test-tool", "2.0.0")
+    assert get_tool_version("zmake-test-tool") == "2.0.0"
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Compare in-memory library API with file-based conversion and build.
+
+Usage: python3 tools/bench_api.py [path/to/project] [--rounds N]
+"""
+import argparse
+import io
+import logging
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from PIL import Image
+
+from zmake import api, image_io, ZMakeContext
+
+
+def measure(name, func, rounds):
+    func()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    duration = (time.perf_counter() - start) / rounds
+    print(f"{name:<40} {duration * 1000:8.2f} ms")
+    return duration
+
+
+def bench_images(rounds):
+    image = Image.effect_noise((192, 490), 48).convert("RGBA").quantize(200).convert("RGBA")
+    tmp_dir = Path(tempfile.mkdtemp())
+
+    def file_based():
+        path = tmp_dir / "image.png"
+        image_io.save_auto(image, path, "TGA-RLP", "nxp")
+        loaded, _ = image_io.load_auto(path, "nxp")
+        loaded.load()
+
+    def in_memory():
+        data = api.encode_image(image, "TGA-RLP", "nxp")
+        api.decode_image(data, "nxp")
+
+    print("TGA-RLP encode + decode, 192x490:")
+    measure("  temp file", file_based, rounds)
+    measure("  api.encode_image/decode_image", in_memory, rounds)
+    shutil.rmtree(tmp_dir)
+
+
+def bench_build(project, rounds):
+    tmp_dir = Path(tempfile.mkdtemp())
+    copy = tmp_dir / project.name
+    shutil.copytree(project, copy, ignore=shutil.ignore_patterns("build", "dist"))
+
+    def file_based():
+        context = ZMakeContext(copy, non_interactive=True)
+        context.process_project()
+        with open(copy / "dist" / f"{copy.name}.{context.config['package_extension']}", "rb") as f:
+            f.read()
+
+    def in_memory():
+        api.build_package(copy, io.BytesIO())
+
+    print(f"Build {project}:")
+    measure("  ZMakeContext (build/ and dist/)", file_based, rounds)
+    measure("  api.build_package", in_memory, rounds)
+    shutil.rmtree(tmp_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("project", nargs="?", type=Path)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    # Library API don't need logging, but ZMakeContext is noisy
+    logging.getLogger("zmake").setLevel(logging.ERROR)
+
+    bench_images(args.rounds)
+    if args.project is not None:
+        bench_build(args.project.resolve(), args.rounds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Compare peak memory of full TGA decode (load image, save PNG) and
+row-streaming decode (TgaRowReader + save_png_rows). Each variant runs
+in a separate process, peak RSS growth is reported (Linux only).
+
+Usage: python3 tools/bench_decode_memory.py [--size 4000x4000] [--format TGA-RLP]
+"""
+import argparse
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from PIL import Image
+
+from zmake import image_io
+
+
+def make_tga(path: Path, width, height, target_type, encode_mode):
+    # Gradient with few colors, long runs for RLE
+    image = Image.linear_gradient("L").resize((width, height)).quantize(64).convert("RGBA")
+    path.write_bytes(image_io.encode_auto(image, target_type, encode_mode))
+
+
+def peak_rss():
+    """
+    :return: peak resident set size of this process, KB
+    """
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+    raise RuntimeError("VmHWM not found")
+
+
+def decode(variant, source: Path, dest: Path, encode_mode):
+    """
+    Run in child process, print peak RSS growth in KB and duration.
+    """
+    base = peak_rss()
+    start = time.perf_counter()
+    if variant == "full":
+        image, _ = image_io.load_auto(source, encode_mode)
+        image.save(dest, "PNG")
+    else:
+        with source.open("rb") as f, dest.open("wb") as out:
+            reader = image_io.open_rows(f, encode_mode)
+            image_io.save_png_rows(out, reader.width, reader.height, reader.rows())
+    duration = time.perf_counter() - start
+    print(peak_rss() - base, duration)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", default="4000x4000")
+    parser.add_argument("--format", default="TGA-RLP", choices=["TGA-P", "TGA-RLP", "TGA-16", "TGA-32"])
+    parser.add_argument("--encode-mode", default="dialog", choices=["dialog", "nxp"])
+    parser.add_argument("--child", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        variant, source, dest = args.child
+        return decode(variant, Path(source), Path(dest), args.encode_mode)
+
+    width, height = map(int, args.size.split("x"))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source = Path(tmp_dir) / "image.tga"
+        make_tga(source, width, height, args.format, args.encode_mode)
+        print(f"{args.format} {width}x{height}, {source.stat().st_size / 1024:.0f} KB:")
+
+        for variant in ["full", "streaming"]:
+            output = subprocess.check_output([sys.executable, __file__, "--encode-mode", args.encode_mode,
+                                              "--child", variant, str(source), str(Path(tmp_dir) / "out.png")])
+            peak, duration = output.split()
+            print(f"  {variant:<10} peak +{int(peak) / 1024:8.1f} MB, {float(duration):6.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Minimal adb stand-in, to test ADB upload without a phone.
+Device storage is emulated by local folder FAKE_ADB_ROOT
+(default: /tmp/fake_adb). Supported commands:
+
+    adb shell <command>     run command with sh, device paths are remapped
+    adb push <src> <dest>   copy file into emulated storage
+
+Usage: place it into PATH as "adb", e.g.
+    ln -s $PWD/tools/fake_adb.py ~/.local/bin/adb
+"""
+import os
+import re
+import shutil
+import subprocess
+import sys
+
+ROOT = os.environ.get("FAKE_ADB_ROOT", "/tmp/fake_adb")
+LOG = os.environ.get("FAKE_ADB_LOG")
+
+# Absolute paths in shell command, except special files
+PATH_PATTERN = re.compile(r"(^|[\s'\"])(/(?!dev/)[^\s'\"]*)")
+
+
+def device_path(path: str):
+    return ROOT + path if path.startswith("/") else os.path.join(ROOT, path)
+
+
+def main(args):
+    if LOG is not None:
+        with open(LOG, "a") as f:
+            f.write(" ".join(args) + "\n")
+
+    if args[:1] == ["--version"]:
+        print("Fake Android Debug Bridge version 1.0.41")
+        return 0
+    elif args[:1] == ["shell"]:
+        command = PATH_PATTERN.sub(lambda m: m.group(1) + device_path(m.group(2)), " ".join(args[1:]))
+        return subprocess.run(["sh", "-c", command]).returncode
+    elif args[:1] == ["push"] and len(args) >= 3:
+        dest = device_path(args[-1])
+        for source in args[1:-1]:
+            target = os.path.join(dest, os.path.basename(source)) if os.path.isdir(dest) else dest
+            shutil.copy(source, target)
+            print(f"{source}: 1 file pushed")
+        return 0
+
+    print(f"fake adb: unsupported command {args}", file=sys.stderr)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,123 @@
+import fnmatch
+import re
+
+from PIL import Image
+
+from zmake import tga_save, quantize
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# anim_01.png, anim_01.rlp.png, ...
+FRAME_PATTERN = re.compile(r"^(?P<prefix>.*?)(?P<number>\d+)(?P<suffix>(\.[a-z]+)?\.png)$", re.IGNORECASE)
+
+
+def find_sequences(entries: list, min_frames: int, patterns: list):
+    """
+    Group asset index entries into frame sequences: files in same folder,
+    with same name prefix and format, that differ only by frame number.
+    Only files declared as animation frames are grouped, numbered digit
+    and weekday images shouldn't share one palette.
+
+    :param patterns: fnmatch patterns of frame paths, relative to assets folder
+    :return: list of frame lists, ordered by frame number
+    """
+    groups = {}
+    for entry in entries:
+        if not any(fnmatch.fnmatch(entry.rel_name, pattern) for pattern in patterns):
+            continue
+        match = FRAME_PATTERN.match(entry.source.name)
+        if match is None:
+            continue
+
+        key = (entry.output.parent, match["prefix"], match["suffix"].lower(), entry.target_type)
+        groups.setdefault(key, []).append((int(match["number"]), entry))
+
+    sequences = []
+    for frames in groups.values():
+        if len(frames) >= min_frames:
+            frames.sort(key=lambda f: f[0])
+            sequences.append([entry for _, entry in frames])
+    return sequences
+
+
+def count_colors(images: list):
+    """
+    :return: number of distinct colors in all images, or None if more than 256
+    """
+    colors = set()
+    for img in images:
+        frame_colors = img.getcolors(256)
+        if frame_colors is None:
+            return None
+        colors.update(color for _, color in frame_colors)
+        if len(colors) > 256:
+            return None
+    return len(colors)
+
+
+def _quantize_together(images: list, method: str, dither: bool, use_cache: bool):
+    """
+    Quantize all frames at once, as one sprite sheet, so they'll
+    get same colors.
+    """
+    width = max(img.width for img in images)
+    sheet = Image.new("RGBA", (width, sum(img.height for img in images)))
+    y = 0
+    for img in images:
+        sheet.paste(img, (0, y))
+        y += img.height
+
+    # Keep room for padding color, it may be added by encoder
+    sheet = quantize.quantize(sheet, method, dither, 255, use_cache)
+
+    result = []
+    y = 0
+    for img in images:
+        result.append(sheet.crop((0, y, img.width, y + img.height)))
+        y += img.height
+    return result
+
+
+def frame_deltas(images: list):
+    """
+    :return: share of changed pixels for each frame, compared to previous one
+    """
+    deltas = []
+    for previous, current in zip(images, images[1:]):
+        if previous.size != current.size:
+            deltas.append(1.0)
+            continue
+
+        a = previous.tobytes()
+        b = current.tobytes()
+        if np is not None:
+            changed = np.count_nonzero(np.frombuffer(a, dtype="<u4") != np.frombuffer(b, dtype="<u4"))
+        else:
+            changed = sum(1 for i in range(0, len(a), 4) if a[i:i + 4] != b[i:i + 4])
+        deltas.append(changed / (current.width * current.height))
+    return deltas
+
+
+def encode_sequence(images: list, target_type: str, encode_mode: str, allow_quantize: bool,
+                    quantize_method="auto", quantize_dither=False, use_cache=True, truncate_palette=False):
+    """
+    Encode frames with one shared palette.
+
+    :param images: RGBA frames
+    :param target_type: TGA-P or TGA-RLP
+    :param allow_quantize: reduce colors of all frames together, if they
+                           don't fit into one palette
+    :param truncate_palette: write only used palette entries
+    :return: list of file contents, or None if frames can't share palette
+    """
+    # Padding color may be added to palette
+    colors = count_colors(images)
+    if colors is None or colors > 255:
+        if not allow_quantize:
+            return None
+        images = _quantize_together(images, quantize_method, quantize_dither, use_cache)
+
+    return tga_save.encode_palette_sequence(images, encode_mode, target_type == "TGA-RLP", truncate_palette)
@@ -0,0 +1,185 @@
+"""
+Library API: convert images and build projects in memory.
+
+All functions are thread-safe, never ask questions and don't
+configure logging (messages go to "zmake" logger).
+"""
+import io
+import json
+from pathlib import Path
+from zipfile import ZipFile, ZIP_DEFLATED
+
+from PIL import Image
+
+from zmake import config, image_io, utils, quantize
+from zmake.asset_index import AssetIndex, is_ignored, DEFAULT_IGNORE_FILES
+from zmake.exceptions import ConfigException, AssetException
+from zmake.project_build import prepare_app_json, convert_asset, combine_src, palette_options
+
+PALETTE_FORMATS = ["TGA-P", "TGA-RLP"]
+
+# Options that require external tools or scripts
+UNSUPPORTED_OPTIONS = ["esbuild", "with_uglifyjs", "with_zepp_preview", "with_adb", "with_zeus_compat",
+                       "pre_build_script", "post_build_script", "plugins"]
+
+
+def encode_image(image: Image.Image, target_type="TGA-P", encode_mode="dialog",
+                 quantize_method="auto", quantize_dither=False, use_cache=False):
+    """
+    Encode image to ZeppOS TGA.
+
+    :param image: source image, any mode
+    :param target_type: TGA-P, TGA-RLP, TGA-16 or TGA-32
+    :param encode_mode: "dialog" or "nxp"
+    :param quantize_method: used if image has too many colors for palette format
+    :param use_cache: use on-disk quantization cache
+    :return: file content
+    """
+    image = image.convert("RGBA")
+    if target_type in PALETTE_FORMATS and image.getcolors() is None:
+        image = quantize.quantize(image, quantize_method, quantize_dither, use_cache=use_cache)
+
+    data = image_io.encode_auto(image, target_type, encode_mode)
+    if data is None:
+        raise ValueError(f"Unsupported format {target_type}")
+    return data
+
+
+def _open_stream(data):
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = io.BytesIO(data)
+    if not hasattr(data, "peek"):
+        data = io.BufferedReader(data)
+    return data
+
+
+def decode_image(data, encode_mode="dialog"):
+    """
+    Decode ZeppOS TGA (or PNG).
+
+    :param data: bytes or binary file object
+    :return: RGBA image and source format
+    """
+    image, file_type = image_io.load_stream(_open_stream(data), encode_mode)
+    if image is None:
+        raise ValueError("Unknown image format")
+    return image.convert("RGBA"), file_type
+
+
+def convert(data, target_type=None, encode_mode="dialog"):
+    """
+    Convert PNG to TGA or TGA to PNG.
+
+    :param data: bytes or binary file object
+    :param target_type: TGA format for PNG input, default TGA-P
+    :return: converted file content
+    """
+    data = _open_stream(data)
+    reader = image_io.open_rows(data, encode_mode)
+    if reader is not None:
+        # TGA is decoded row by row
+        out = io.BytesIO()
+        image_io.save_png_rows(out, reader.width, reader.height, reader.rows())
+        return out.getvalue()
+
+    image, _ = decode_image(data, encode_mode)
+    return encode_image(image, target_type or "TGA-P", encode_mode)
+
+
+def load_project_config(path: Path, overrides: dict = None):
+    """
+    :param overrides: config values that replace ones from config files
+    :return: validated project config
+    """
+    result = config.load(config.default_locations(path))
+    if overrides:
+        result = config.ZMakeConfig(result, dict(result.sources))
+        for key, value in overrides.items():
+            result[key] = value
+            result.sources[key] = "overrides"
+        config.validate(result)
+    return result
+
+
+def build_package(path: Path, output=None, config_overrides: dict = None):
+    """
+    Build project into device package (same as .bin file) without
+    writing anything to project folder. Projects that need external
+    tools (esbuild, uglifyjs, etc.) should be built with ZMakeContext.
+    Format auto-selection, animation and folder shared palettes and
+    deduplication aren't applied here.
+
+    :param path: project folder
+    :param output: binary file object to write package into, if None,
+                   package content is returned
+    :param config_overrides: config values that replace ones from config files
+    :return: package content, or None if output is provided
+    """
+    path = Path(path)
+    project_config = load_project_config(path, config_overrides)
+    for key in UNSUPPORTED_OPTIONS:
+        if project_config.get(key):
+            raise ConfigException(f"Option \"{key}\" isn't supported by in-memory build")
+
+    def resolve(rel_name: str):
+        return path / project_config["overrides"].get(rel_name, rel_name)
+
+    app_json = utils.read_json(resolve("app.json"))
+    target_id = prepare_app_json(app_json, project_config)
+    target_dir = "page" if app_json["app"]["appType"] == "app" else "watchface"
+    if project_config["target_dir_override"] != "":
+        target_dir = project_config["target_dir_override"]
+
+    ignore_files = project_config.get("ignore_files", DEFAULT_IGNORE_FILES)
+    result = output if output is not None else io.BytesIO()
+    with ZipFile(result, "w", ZIP_DEFLATED) as arc:
+        def write(name: str, data):
+            if not is_ignored(f"/{name}", ignore_files):
+                arc.writestr(name, data)
+
+        write("app.json", json.dumps(app_json, indent=4, sort_keys=True))
+
+        # Assets
+        assets = path / "assets" / target_id if target_id is not None else path / "assets"
+        if assets.is_dir():
+            index = AssetIndex.build(path, assets, Path("assets"), project_config)
+            for entry in index.files():
+                try:
+                    truncate_palette = palette_options(project_config, entry.rel_name)["truncate"]
+                    data, _ = convert_asset(entry.source, entry.target_type, project_config,
+                                            truncate_palette=truncate_palette)
+                except Exception as e:
+                    raise AssetException(f"Can't convert {entry.source}") from e
+                if data is None:
+                    data = entry.source.read_bytes()
+                arc.writestr(entry.output.as_posix(), data)
+
+        # Common files
+        for name in project_config["common_files"]:
+            file = path / name
+            files = file.rglob("**/*") if file.is_dir() else [file]
+            for item in files:
+                if item.is_file():
+                    write(item.relative_to(path).as_posix(), item.read_bytes())
+
+        # JS
+        comment = utils.get_app_asset("comment.js") + "\n"
+        app_js = resolve("app.js")
+        if app_js.is_file():
+            write("app.js", app_js.read_bytes())
+        else:
+            write("app.js", utils.get_app_asset("app.js"))
+
+        if (path / "src").is_dir() and not (path / target_dir / "index.js").is_file():
+            out = io.StringIO()
+            combine_src(path, out)
+            write(f"{target_dir}/index.js", comment + out.getvalue())
+
+        if (path / target_dir).is_dir():
+            for file in sorted((path / target_dir).rglob("**/*.js")):
+                rel_name = file.relative_to(path).as_posix()
+                write(rel_name, comment + resolve(rel_name).read_text(encoding="utf8"))
+
+    if output is None:
+        return result.getvalue()
+    return None
@@ -0,0 +1,265 @@
+import fnmatch
+import itertools
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from PIL import Image
+
+from zmake import tga_save
+from zmake.cache import FileCache, make_key, hash_file
+from zmake.quantize import has_alpha
+from zmake.utils import load_devices
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+ANALYZER_VERSION = 3
+
+# Preferred order, when sizes are equal
+FORMATS = ["TGA-RLP", "TGA-P", "TGA-16", "TGA-32"]
+
+# TGA header + zmake ID block
+HEADER_SIZE = 18 + 46
+PALETTE_SIZE = 256 * 4
+
+sizes_cache = FileCache("format_sizes")
+
+
+def _padded_width(width: int, encode_mode: str):
+    if encode_mode == "nxp" and width % 16 != 0:
+        return width + 16 - (width % 16)
+    return width
+
+
+def _fixed_size(target_type: str, width: int, height: int, encode_mode: str):
+    """
+    Size of formats without compression can be calculated without encoding.
+    """
+    pixels = _padded_width(width, encode_mode) * height
+    if target_type == "TGA-P":
+        return HEADER_SIZE + PALETTE_SIZE + pixels
+    elif target_type == "TGA-16":
+        return HEADER_SIZE + 2 * pixels
+    return HEADER_SIZE + 4 * pixels
+
+
+def encoded_sizes(image: Image.Image, encode_mode: str):
+    """
+    :return: dict format -> encoded file size, for all formats
+             that can hold this image without quantization
+    """
+    image = image.convert("RGBA")
+    sizes = {
+        "TGA-16": _fixed_size("TGA-16", image.width, image.height, encode_mode),
+        "TGA-32": _fixed_size("TGA-32", image.width, image.height, encode_mode),
+    }
+    if image.getcolors(256) is not None:
+        sizes["TGA-P"] = _fixed_size("TGA-P", image.width, image.height, encode_mode)
+        sizes["TGA-RLP"] = len(tga_save.encode_rl_palette_tga(image, encode_mode))
+    return sizes
+
+
+def _exact_levels(bits: int):
+    """
+    :return: point() table, 255 for 8-bit values that survive
+             conversion to given bit depth and back
+    """
+    top = (1 << bits) - 1
+    return [255 if int(round(top / 255 * v) * 255 / top) == v else 0 for v in range(256)]
+
+
+RGB565_EXACT = (_exact_levels(5), _exact_levels(6), _exact_levels(5))
+
+
+def is_rgb565_exact(image: Image.Image):
+    """
+    :return: True if RGBA image colors are stored by TGA-16 without loss
+    """
+    for band, table in zip(image.split()[:3], RGB565_EXACT):
+        if band.point(table).getextrema()[0] == 0:
+            return False
+    return True
+
+
+def legal_formats(sizes: dict, alpha: bool, rotated: bool, rgb565_exact: bool = False):
+    """
+    Filter out formats that will break image:
+    - TGA-16 can't store transparency and changes most colors
+    - TGA-RLP images can't be rotated
+    """
+    result = {}
+    for target_type, size in sizes.items():
+        if (alpha or not rgb565_exact) and target_type == "TGA-16":
+            continue
+        if rotated and target_type == "TGA-RLP":
+            continue
+        result[target_type] = size
+    return result
+
+
+def best_format(sizes: dict):
+    return min(sizes, key=lambda t: (sizes[t], FORMATS.index(t)))
+
+
+def is_rotated(rel_name: str, patterns: list):
+    return any(fnmatch.fnmatch(rel_name, pattern) for pattern in patterns)
+
+
+def analyse_file(path: Path, rotated: bool, encode_mode: str, use_cache=True):
+    """
+    Find smallest legal format for image file, result is cached
+    by file content.
+
+    :return: dict with "sizes" (all encodable formats), "legal" and "best"
+    """
+    key = make_key(ANALYZER_VERSION, hash_file(path), encode_mode)
+    data = sizes_cache.get(key) if use_cache else None
+    if data is not None:
+        data = json.loads(data)
+    else:
+        with Image.open(path) as image:
+            image = image.convert("RGBA")
+            data = {
+                "sizes": encoded_sizes(image, encode_mode),
+                "alpha": has_alpha(image),
+                "rgb565_exact": is_rgb565_exact(image),
+            }
+        if use_cache:
+            sizes_cache.put(key, json.dumps(data).encode("utf8"))
+
+    data["legal"] = legal_formats(data["sizes"], data["alpha"], rotated, data["rgb565_exact"])
+    data["best"] = best_format(data["legal"])
+    return data
+
+
+def analyse(files: list, rotated_patterns: list, encode_mode: str, use_cache=True, cancel_token=None):
+    """
+    Analyse asset index entries in parallel.
+
+    :param files: AssetEntry list, should be PNG images
+    :return: dict rel_name -> analyse_file() result
+    """
+    def process(entry):
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        return entry.rel_name, analyse_file(entry.source, is_rotated(entry.rel_name, rotated_patterns),
+                                            encode_mode, use_cache)
+
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+        return dict(pool.map(process, files))
+
+
+def estimate_rle_size(indexes: bytes):
+    """
+    Compute TGA-RLP pixel data size from run lengths of palette indexes,
+    without encoding. Matches tga_save._rl_encode(): runs of 2+ pixels
+    take 2 bytes per packet (long runs are split into 127 pixel packets,
+    last one up to 128), each group of single pixels takes raw packets
+    with 1 byte header per 128 pixels.
+    """
+    if len(indexes) == 0:
+        return 0
+
+    if np is not None:
+        data = np.frombuffer(indexes, dtype=np.uint8)
+        bounds = np.concatenate(([0], np.flatnonzero(np.diff(data)) + 1, [len(data)]))
+        lengths = np.diff(bounds)
+        single = lengths == 1
+        runs = int(np.sum((lengths[~single] + 125) // 127))
+        edges = np.diff(np.concatenate(([0], single.astype(np.int8), [0])))
+        groups = np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)
+        raw = int(np.sum(groups)) + int(np.sum((groups + 127) // 128))
+    else:
+        lengths = [len(list(group)) for _, group in itertools.groupby(indexes)]
+        runs = sum((length + 125) // 127 for length in lengths if length > 1)
+        groups = [len(list(group)) for is_single, group in itertools.groupby(lengths, lambda x: x == 1) if is_single]
+        raw = sum(groups) + sum((size + 127) // 128 for size in groups)
+
+    return 2 * runs + raw
+
+
+def palette_sizes(image: Image.Image, encode_mode: str):
+    """
+    :return: dict with exact TGA-P size and estimated TGA-RLP size,
+             or None if image needs quantization
+    """
+    image = image.convert("RGBA")
+    if image.getcolors(256) is None:
+        return None
+
+    header, indexes = tga_save._prep_palette_base(image, encode_mode)
+    return {
+        "TGA-P": len(header) + len(indexes),
+        "TGA-RLP": len(header) + estimate_rle_size(indexes),
+    }
+
+
+def choose_palette_format(sizes: dict, requested: str, tolerance: float):
+    """
+    Keep requested palette format, unless other one is smaller
+    by more than tolerance (share of requested format size).
+    """
+    other = "TGA-P" if requested == "TGA-RLP" else "TGA-RLP"
+    if sizes[other] < sizes[requested] * (1 - tolerance):
+        return other
+    return requested
+
+
+def estimate_palette_file(path: Path, encode_mode: str, use_cache=True):
+    """
+    Same as palette_sizes(), result is cached by file content.
+    """
+    key = make_key(ANALYZER_VERSION, "palette", hash_file(path), encode_mode)
+    data = sizes_cache.get(key) if use_cache else None
+    if data is not None:
+        return json.loads(data)
+
+    with Image.open(path) as image:
+        sizes = palette_sizes(image, encode_mode)
+    if use_cache:
+        sizes_cache.put(key, json.dumps(sizes).encode("utf8"))
+    return sizes
+
+
+def estimate_palette(files: list, encode_mode: str, use_cache=True, cancel_token=None):
+    """
+    Estimate palette format sizes of asset index entries in parallel.
+
+    :param files: AssetEntry list, should be PNG images
+    :return: dict rel_name -> estimate_palette_file() result
+    """
+    def process(entry):
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        return entry.rel_name, estimate_palette_file(entry.source, encode_mode, use_cache)
+
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+        return dict(pool.map(process, files))
+
+
+def check_budget(package_size: int, platforms: list, budgets: dict):
+    """
+    Compare package size with per-device budgets.
+
+    :param platforms: app.json platforms, list of dicts with deviceSource
+    :param budgets: device id (from zepp_devices.json) -> budget in KB
+    :return: list of (device id, budget in bytes, fits)
+    """
+    source_to_device = load_devices()
+    device_ids = []
+    for platform in platforms:
+        device = source_to_device.get(platform.get("deviceSource"))
+        if device is not None and device["id"] not in device_ids:
+            device_ids.append(device["id"])
+
+    result = []
+    for device_id in device_ids:
+        if device_id not in budgets:
+            continue
+        budget = round(budgets[device_id] * 1024)
+        result.append((device_id, budget, package_size <= budget))
+    return result
@@ -0,0 +1,177 @@
+import json
+import logging
+from pathlib import Path
+
+from zmake.cache import FileCache, make_key
+
+INDEX_VERSION = 1
+
+# File or folder name suffix -> target format
+MODE_TABLE = {
+    "rgb": "TGA-16",
+    "rgba": "TGA-32",
+    "p": "TGA-P",
+    "rlp": "TGA-RLP"
+}
+
+DEFAULT_IGNORE_FILES = [".DS_Store", "Thumbs.db"]
+
+log = logging.getLogger("zmake")
+index_cache = FileCache("asset_index")
+
+
+def get_target_type(file: Path, default: str):
+    """
+    Target format of image, based on ".rlp.png"-like file name
+    or ".rlp"-like name of any parent folder.
+
+    :param file: path relative to assets folder, so folders
+                 above it don't affect format
+    """
+    folders = file.parts[:-1]
+    for suffix in MODE_TABLE:
+        if file.name.endswith(f".{suffix}.png") or any(f.endswith(f".{suffix}") for f in folders):
+            return MODE_TABLE[suffix]
+    return default
+
+
+def is_ignored(filename: str, ignore_files: list):
+    for file_to_ignore in ignore_files:
+        if file_to_ignore in filename:
+            return True
+    return False
+
+
+class AssetEntry:
+    __slots__ = ["rel_name", "source", "output", "target_type", "explicit_type", "ignored", "is_dir", "state",
+                 "changed", "duplicate_of"]
+
+    def __init__(self, rel_name: str, source: Path, output: Path, target_type: str, explicit_type: bool,
+                 ignored: bool, is_dir: bool, state: list):
+        self.rel_name = rel_name
+        self.source = source
+        self.output = output
+        self.target_type = target_type
+        # Target format is set by file or folder name
+        self.explicit_type = explicit_type
+        self.ignored = ignored
+        self.is_dir = is_dir
+        self.state = state
+        # Differs from previous build (or there's no previous build)
+        self.changed = True
+        # Relative name of entry with same content, filled during conversion
+        self.duplicate_of = None
+
+    def to_json(self):
+        return {
+            "source": str(self.source),
+            "output": str(self.output),
+            "target_type": self.target_type,
+            "ignored": self.ignored,
+            "is_dir": self.is_dir,
+            "state": self.state,
+        }
+
+    def same_as(self, data: dict):
+        return self.to_json() == data
+
+
+class AssetIndex:
+    """
+    All project assets with pre-resolved overrides, target formats,
+    output paths and ignore rules. Built once per build and persisted
+    in cache, so next build knows what was changed.
+    """
+    def __init__(self, project_path: Path, source: Path, dest: Path):
+        self.project_path = project_path
+        self.source = source
+        self.dest = dest
+        self.entries = {}
+        self.previous = {}
+
+    @property
+    def _cache_key(self):
+        return make_key(INDEX_VERSION, self.project_path, self.source)
+
+    @staticmethod
+    def build(project_path: Path, source: Path, dest: Path, config: dict):
+        """
+        Scan source folder and resolve everything for each file.
+
+        :param project_path: project root, overrides are relative to it
+        :param source: assets folder
+        :param dest: build assets folder
+        :param config: project config
+        """
+        index = AssetIndex(project_path, source, dest)
+
+        # Normalize keys once, instead of path slicing per file
+        overrides = {}
+        for key, value in config["overrides"].items():
+            overrides[key.replace("\\", "/").rstrip("/")] = value
+        ignore_files = config.get("ignore_files", DEFAULT_IGNORE_FILES)
+        assets_prefix = source.relative_to(project_path).as_posix()
+
+        for file in sorted(source.rglob("**/*")):
+            rel_name = file.relative_to(source).as_posix()
+            override = overrides.get(f"{assets_prefix}/{rel_name}")
+            if override is not None:
+                log.info(f"  Override {assets_prefix}/{rel_name} -> {override}")
+                file = project_path / override
+
+            try:
+                stat = file.stat()
+                state = [stat.st_mtime_ns, stat.st_size]
+            except OSError:
+                state = None
+
+            # Folders inside assets and name of file that is actually used
+            type_path = Path(rel_name).parent / file.name
+            explicit_type = get_target_type(type_path, None)
+
+            index.entries[rel_name] = AssetEntry(
+                rel_name=rel_name,
+                source=file,
+                output=dest / rel_name,
+                target_type=explicit_type or config["def_format"],
+                explicit_type=explicit_type is not None,
+                ignored=is_ignored(f"/assets/{rel_name}", ignore_files),
+                is_dir=file.is_dir(),
+                state=state,
+            )
+
+        index._load_previous()
+        return index
+
+    def _load_previous(self):
+        data = index_cache.get(self._cache_key)
+        if data is None:
+            return
+
+        try:
+            data = json.loads(data)
+        except ValueError:
+            return
+
+        self.previous = data
+        for rel_name, entry in self.entries.items():
+            entry.changed = not (rel_name in data and entry.same_as(data[rel_name]))
+
+    def save(self):
+        data = {rel_name: entry.to_json() for rel_name, entry in self.entries.items()}
+        index_cache.put(self._cache_key, json.dumps(data).encode("utf8"))
+
+    def files(self):
+        """
+        :return: entries of regular files, not ignored ones
+        """
+        return [e for e in self.entries.values() if not e.is_dir and not e.ignored]
+
+    def changed(self):
+        """
+        :return: entries that differ from previous build, and relative
+                 names of entries that was removed since it
+        """
+        changed = [e for e in self.entries.values() if e.changed]
+        removed = [rel_name for rel_name in self.previous if rel_name not in self.entries]
+        return changed, removed
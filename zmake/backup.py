@@ -0,0 +1,131 @@
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from zmake.constants import BACKUP_DIR
+
+log = logging.getLogger("ZMakeBackup")
+
+QUEUE_SIZE = 16
+
+
+class BackupWriter:
+    """
+    Writes source file backups in background thread.
+
+    Backup is a hardlink when possible (no data copy at all), otherwise
+    file content is read on caller thread and written by the worker.
+    Queue is bounded, so a slow disk will block producers instead of
+    growing memory usage.
+    """
+    def __init__(self, backup_dir: Path = BACKUP_DIR, queue_size=QUEUE_SIZE):
+        self.backup_dir = backup_dir
+        self.queue = queue.Queue(queue_size)
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.backup_dir.mkdir(parents=True, exist_ok=True)
+            self.thread = threading.Thread(target=self._run, name="BackupWriter", daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while True:
+            path, data = self.queue.get()
+            try:
+                with open(path, "wb") as f:
+                    f.write(data)
+            except OSError as e:
+                log.warning(f"Can't write backup {path}: {e}")
+            finally:
+                self.queue.task_done()
+
+    def submit(self, file: Path):
+        """
+        Schedule backup of file. Source file may be replaced right after
+        this call, but must not be modified in-place.
+
+        :return: backup file path
+        """
+        self._ensure_started()
+
+        time_tag = str(datetime.today()).replace(' ', '_').replace(':', '')
+        path = self.backup_dir / f"{time_tag}__{file.name}"
+
+        try:
+            os.link(file, path)
+            # Shared inode keeps source mtime, refresh it for retention
+            os.utime(path)
+            return path
+        except OSError:
+            # Other filesystem, or links aren't supported
+            pass
+
+        with open(file, "rb") as f:
+            data = f.read()
+        self.queue.put((path, data))
+        return path
+
+    def flush(self):
+        """
+        Wait until all scheduled backups are written.
+        """
+        self.queue.join()
+
+
+def apply_retention(max_size_mb=0, max_age_days=0, backup_dir: Path = BACKUP_DIR):
+    """
+    Remove old backups. Files older than max_age_days are deleted,
+    then oldest files are deleted until total size fits max_size_mb.
+    Zero value disables the limit.
+    """
+    if not backup_dir.is_dir():
+        return
+
+    files = []
+    for file in backup_dir.iterdir():
+        try:
+            stat = file.stat()
+        except OSError:
+            continue
+        if file.is_file():
+            files.append((stat.st_mtime, stat.st_size, file))
+    files.sort()
+
+    total_size = sum(size for _, size, _ in files)
+    min_mtime = time.time() - max_age_days * 86400
+    removed = 0
+
+    for mtime, size, file in files:
+        too_old = max_age_days > 0 and mtime < min_mtime
+        too_big = max_size_mb > 0 and total_size > max_size_mb * 1024 * 1024
+        if not too_old and not too_big:
+            break
+
+        try:
+            file.unlink()
+        except OSError:
+            continue
+        total_size -= size
+        removed += 1
+
+    if removed > 0:
+        log.info(f"  Removed {removed} old backup files")
+
+
+_writer = BackupWriter()
+
+
+def submit(file: Path):
+    return _writer.submit(file)
+
+
+def flush():
+    _writer.flush()
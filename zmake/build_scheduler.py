@@ -0,0 +1,160 @@
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+ANY = "*"
+
+# Task that current code runs for, e.g. GUI worker. Inherited by handler
+# threads and stored in held log records, so log handlers can select
+# records of their task.
+current_task = contextvars.ContextVar("current_task", default=None)
+
+
+def record_task(record: logging.LogRecord):
+    """
+    :return: task that log record belongs to
+    """
+    return getattr(record, "task_id", current_task.get())
+
+
+def _nested(a: str, b: str):
+    return a == b or a.startswith(b + "/") or b.startswith(a + "/")
+
+
+def _overlaps(a: set, b: set):
+    if len(a) == 0 or len(b) == 0:
+        return False
+    return ANY in a or ANY in b or any(_nested(x, y) for x in a for y in b)
+
+
+def handler_dependencies(infos: list, target_dir: str):
+    """
+    Build dependency graph from declared inputs and outputs. Handler waits for
+    earlier handlers that write its inputs or outputs, or read its outputs.
+    Handlers without declared inputs (e.g. old plugins) wait for all earlier
+    handlers, and all later handlers wait for them.
+
+    :param infos: HandlerInfo list, in registration order
+    :return: list of sets, indexes of handlers that each handler waits for
+    """
+    def resolve(paths):
+        return {p.format(target_dir=target_dir) for p in paths}
+
+    reads = [resolve(info.inputs or []) for info in infos]
+    writes = [resolve(info.outputs) for info in infos]
+    result = []
+    for i, info in enumerate(infos):
+        deps = set()
+        for j in range(i):
+            if info.inputs is None or infos[j].inputs is None or ANY in reads[i] \
+                    or _overlaps(writes[j], reads[i]) or _overlaps(writes[j], writes[i]) \
+                    or _overlaps(reads[j], writes[i]):
+                deps.add(j)
+        result.append(deps)
+    return result
+
+
+class OrderedLogFilter(logging.Filter):
+    """
+    Keeps log in handler order: records of the first unfinished handler
+    are printed as is, records of handlers running in parallel with it are
+    held back until all earlier handlers are done.
+    """
+    def __init__(self, logger: logging.Logger):
+        super().__init__()
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.head = 0
+        self.threads = {}
+        self.records = {}
+
+    def filter(self, record):
+        index = self.threads.get(threading.get_ident())
+        if index is None:
+            return True
+        # Held records are printed later, from another thread
+        record.task_id = current_task.get()
+        with self.lock:
+            if index == self.head:
+                return True
+            self.records.setdefault(index, []).append(record)
+            return False
+
+    def attach(self, index: int):
+        self.threads[threading.get_ident()] = index
+
+    def detach(self):
+        self.threads.pop(threading.get_ident(), None)
+
+    def advance(self, done: set):
+        """
+        Move head past finished handlers, print their held records.
+        """
+        with self.lock:
+            while True:
+                for record in self.records.pop(self.head, []):
+                    self.logger.callHandlers(record)
+                if self.head not in done:
+                    break
+                self.head += 1
+
+
+def run_handlers(context, handlers: list, workers: int = None):
+    """
+    Run build handlers concurrently, as soon as handlers they depend on
+    are finished. Fails on first handler error, after running handlers
+    are finished.
+
+    :param handlers: list of (name, func, HandlerInfo), in registration order
+    :param workers: max handlers running at once, default is no limit (handlers
+                    mostly wait for files and external tools)
+    :return: dict handler name -> duration, in registration order
+    """
+    deps = handler_dependencies([info for _, _, info in handlers], context.target_dir)
+    log_filter = OrderedLogFilter(context.logger)
+    durations = {}
+
+    def run(index):
+        name, func, _ = handlers[index]
+        log_filter.attach(index)
+        try:
+            context.check_cancelled()
+            context.progress.start_handler(name, index, len(handlers))
+            start_time = time.time()
+            func(context)
+            durations[index] = round(time.time() - start_time, 3)
+            context.progress.end_handler()
+        finally:
+            log_filter.detach()
+
+    done = set()
+    pending = list(range(len(handlers)))
+    running = {}
+    error = None
+    context.logger.addFilter(log_filter)
+    try:
+        with ThreadPoolExecutor(max_workers=workers or max(len(handlers), 1)) as pool:
+            while len(pending) > 0 or len(running) > 0:
+                if error is None:
+                    for index in [i for i in pending if deps[i] <= done]:
+                        pending.remove(index)
+                        running[pool.submit(contextvars.copy_context().run, run, index)] = index
+                else:
+                    pending.clear()
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in sorted(finished, key=lambda f: running[f]):
+                    done.add(running.pop(future))
+                    if future.exception() is not None and error is None:
+                        error = future.exception()
+                log_filter.advance(done)
+    finally:
+        # Print everything that was held back, e.g. after failure
+        log_filter.advance(set(range(len(handlers))))
+        context.logger.removeFilter(log_filter)
+
+    if error is not None:
+        raise error
+    return {handlers[i][0]: durations[i] for i in sorted(durations)}
@@ -0,0 +1,163 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from zmake.constants import CONFIG_DIR
+
+CACHE_DIR = CONFIG_DIR / "zmake_cache"
+
+log = logging.getLogger("ZMakeCache")
+
+# Optional in-memory layer shared by all namespaces,
+# used by long-running processes (daemon)
+_memory = OrderedDict()
+_memory_size = 0
+_memory_limit = 0
+_memory_lock = threading.Lock()
+
+
+def enable_memory_cache(max_size_mb):
+    global _memory_limit
+    _memory_limit = max_size_mb * 1024 * 1024
+
+
+def _memory_get(key):
+    with _memory_lock:
+        if key not in _memory:
+            return None
+        _memory.move_to_end(key)
+        return _memory[key]
+
+
+def _memory_put(key, data):
+    global _memory_size
+    if len(data) > _memory_limit:
+        return
+
+    with _memory_lock:
+        if key in _memory:
+            _memory_size -= len(_memory.pop(key))
+        _memory[key] = data
+        _memory_size += len(data)
+        while _memory_size > _memory_limit:
+            _, old = _memory.popitem(last=False)
+            _memory_size -= len(old)
+
+
+def make_key(*parts):
+    """
+    Build cache key from given parts (bytes, str or anything
+    with stable str() representation).
+
+    :return: hex digest
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        if not isinstance(part, (bytes, bytearray, memoryview)):
+            part = str(part).encode("utf8")
+        h.update(len(part).to_bytes(8, "little"))
+        h.update(part)
+    return h.hexdigest()
+
+
+def hash_file(path: Path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def evict(max_size_mb, root: Path = CACHE_DIR):
+    """
+    Remove least recently used entries from all cache namespaces,
+    until total size fits into max_size_mb. Zero disables the limit.
+    """
+    if max_size_mb <= 0 or not root.is_dir():
+        return
+
+    entries = []
+    total_size = 0
+    for file in root.rglob("**/*"):
+        try:
+            stat = file.stat()
+        except OSError:
+            continue
+        if file.is_file():
+            entries.append((stat.st_mtime, stat.st_size, file))
+            total_size += stat.st_size
+
+    max_size = max_size_mb * 1024 * 1024
+    if total_size <= max_size:
+        return
+
+    entries.sort()
+    removed = 0
+    for _, size, file in entries:
+        if total_size <= max_size:
+            break
+        try:
+            file.unlink()
+        except OSError:
+            continue
+        total_size -= size
+        removed += 1
+
+    log.info(f"  Cache: removed {removed} old entries")
+
+
+class FileCache:
+    """
+    Content-addressed on-disk cache. Each namespace is a separate
+    folder inside CACHE_DIR, entries are stored as plain files
+    named by their key.
+    """
+    def __init__(self, namespace: str, root: Path = CACHE_DIR):
+        self.path = root / namespace
+        self.enabled = True
+
+    def _entry_path(self, key: str):
+        return self.path / key[:2] / key
+
+    def get(self, key: str):
+        if not self.enabled:
+            return None
+
+        data = _memory_get((self.path, key))
+        if data is not None:
+            return data
+
+        try:
+            with open(self._entry_path(key), "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+
+        try:
+            # Used as "last access" time for eviction
+            os.utime(self._entry_path(key))
+        except OSError:
+            pass
+
+        log.debug(f"hit {self.path.name}/{key}")
+        _memory_put((self.path, key), data)
+        return data
+
+    def put(self, key: str, data: bytes):
+        if not self.enabled:
+            return
+
+        _memory_put((self.path, key), data)
+        path = self._entry_path(key)
+        tmp_path = path.with_name(f"{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            # Cache is optional, never fail build because of it
+            log.debug(f"Can't write cache entry {path}: {e}")
@@ -0,0 +1,196 @@
+import difflib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+from zmake.constants import CONFIG_DIR
+from zmake.exceptions import ConfigException
+from zmake.quantize import METHODS as QUANTIZE_METHODS
+from zmake.utils import read_json, APP_PATH
+
+log = logging.getLogger("zmake")
+
+NUMBER = (int, float)
+
+# key: (allowed types, allowed values or None)
+SCHEMA = {
+    "def_format": (str, ["TGA-P", "TGA-RLP", "TGA-16", "TGA-32"]),
+    "auto_rgba": (bool, None),
+    "auto_format": (bool, None),
+    "auto_rle": (bool, None),
+    "auto_rle_tolerance": (NUMBER, None),
+    "anim_shared_palette": (bool, None),
+    "anim_min_frames": (int, None),
+    "anim_patterns": (list, None),
+    "anim_delta_report": (bool, None),
+    "palette_folders": (dict, None),
+    "glyph_sets": (list, None),
+    "rotated_assets": (list, None),
+    "size_budget_kb": (dict, None),
+    "quantize_method": (str, QUANTIZE_METHODS),
+    "quantize_dither": (bool, None),
+    "with_cache": (bool, None),
+    "parallel_build": (bool, None),
+    "cache_max_size_mb": (NUMBER, None),
+    "backup_max_size_mb": (NUMBER, None),
+    "backup_max_age_days": (NUMBER, None),
+    "target_dir_override": (str, None),
+    "encode_mode": (str, ["dialog", "nxp"]),
+    "package_extension": (str, None),
+    "overrides": (dict, None),
+    "with_source_map": (bool, None),
+    "esbuild": (bool, None),
+    "esbuild_params": (str, None),
+    "with_uglifyjs": (bool, None),
+    "uglifyjs_params": (str, None),
+    "with_zepp_preview": (bool, None),
+    "zepp_preview_gif": (bool, None),
+    "add_preview_asset": (bool, None),
+    "with_adb": (bool, None),
+    "adb_path": (str, None),
+    "pre_build_script": (str, None),
+    "post_build_script": (str, None),
+    "common_files": (list, None),
+    "ignore_files": (list, None),
+    "dedup_assets": (bool, None),
+    "verify_package": (bool, None),
+    "plugins": (list, None),
+    "with_zeus_compat": (bool, None),
+    "zeus_target": (str, None),
+    "zeus_platforms": (list, None),
+    "zab_base_url": (str, None),
+}
+
+# Keys that may be absent in merged config
+OPTIONAL_KEYS = ["zab_base_url"]
+
+# path -> (mtime_ns, size, parsed data)
+_file_cache = {}
+_file_cache_lock = threading.Lock()
+
+# locations -> (state of files, merged config)
+_merged_cache = {}
+
+
+class ZMakeConfig(dict):
+    """
+    Merged and validated config. Values are available both
+    as dict items and as attributes (config.def_format).
+    """
+    def __init__(self, data=None, sources=None):
+        super().__init__(data or {})
+        self.sources = sources or {}
+
+    def __getattr__(self, item):
+        try:
+            return self[item]
+        except KeyError:
+            raise AttributeError(item)
+
+    def dump(self):
+        """
+        :return: effective config as JSON string
+        """
+        return json.dumps(self, indent=2, sort_keys=True)
+
+
+def load_file(path: Path):
+    """
+    Parse config file, result is memoized until file modification.
+
+    :return: dict, or None if file don't exist
+    """
+    if not os.path.isfile(path):
+        return None
+    stat = os.stat(path)
+
+    with _file_cache_lock:
+        cached = _file_cache.get(path)
+        if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            return cached[2]
+
+    try:
+        data = read_json(path)
+    except ValueError as e:
+        raise ConfigException(f"Can't parse config file {path}: {e}")
+    if not isinstance(data, dict):
+        raise ConfigException(f"Config file {path} should contain JSON object")
+
+    with _file_cache_lock:
+        _file_cache[path] = (stat.st_mtime_ns, stat.st_size, data)
+    return data
+
+
+def validate(config: ZMakeConfig):
+    for key, value in config.items():
+        if key not in SCHEMA:
+            hint = difflib.get_close_matches(key, SCHEMA.keys(), 1)
+            hint = f", did you mean \"{hint[0]}\"?" if len(hint) > 0 else ""
+            log.warning(f"  Unknown config key \"{key}\" in {config.sources[key]}{hint}")
+            continue
+
+        types, choices = SCHEMA[key]
+        # bool is int subclass, but "true" isn't valid size
+        if not isinstance(value, types) or (isinstance(value, bool) and types is NUMBER):
+            raise ConfigException(f"Config key \"{key}\" in {config.sources[key]} has wrong type "
+                                  f"{type(value).__name__}")
+        if choices is not None and value not in choices:
+            raise ConfigException(f"Config key \"{key}\" in {config.sources[key]} should be one of {choices}, "
+                                  f"got \"{value}\"")
+
+    for key in SCHEMA:
+        if key not in config and key not in OPTIONAL_KEYS:
+            raise ConfigException(f"Config key \"{key}\" is missing")
+
+
+def _file_state(path: Path):
+    if not os.path.isfile(path):
+        return None
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def default_locations(project_path: Path):
+    """
+    :return: config files for project: app defaults, user config, project config
+    """
+    return [
+        APP_PATH / "zmake.json",
+        CONFIG_DIR / "zmake.json",
+        project_path / "zmake.json",
+    ]
+
+
+def load(locations: list):
+    """
+    Load and merge config files, later files override earlier.
+    Files are re-parsed (and merged config re-validated) only when
+    they're changed.
+
+    :return: ZMakeConfig
+    """
+    cache_key = tuple(str(file) for file in locations)
+    state = [_file_state(file) for file in locations]
+    cached_state, cached_config = _merged_cache.get(cache_key, (None, None))
+    if cached_state == state:
+        for file, file_state in zip(locations, state):
+            if file_state is not None:
+                log.info(f"  {file}")
+        return ZMakeConfig(cached_config, cached_config.sources)
+
+    config = ZMakeConfig()
+    for file in locations:
+        overlay = load_file(file)
+        if overlay is None:
+            continue
+
+        log.info(f"  {file}")
+        for key in overlay:
+            config[key] = overlay[key]
+            config.sources[key] = file
+
+    validate(config)
+    _merged_cache[cache_key] = (state, config)
+    return ZMakeConfig(config, config.sources)
@@ -27,3 +27,24 @@ else:
     CONFIG_DIR = Path.home() / ".config"
 
 BACKUP_DIR = CONFIG_DIR / "backup"
+
+# Unix socket is reachable only by current user, TCP port by anyone on
+# this machine, so every request also carries token from token file
+if sys.platform == "win32":
+    DAEMON_ADDRESS = "127.0.0.1:7650"
+else:
+    DAEMON_ADDRESS = f"unix:{CONFIG_DIR / 'zmake_daemon.sock'}"
+DAEMON_TOKEN_FILE = CONFIG_DIR / "zmake_daemon.token"
+
+# Process exit codes, used by non-interactive (CI) mode
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_INPUT_REQUIRED = 3
+EXIT_BAD_INPUT = 4
+EXIT_CONFIG_ERROR = 5
+EXIT_TOOL_NOT_FOUND = 6
+EXIT_TOOL_FAILED = 7
+EXIT_ASSET_FAILED = 8
+EXIT_CANCELLED = 9
+EXIT_INTERRUPTED = 130
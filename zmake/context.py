@@ -1,29 +1,183 @@
+import getpass
 import json
 import logging
 import os
 import random
 import shutil
+import threading
+import time
 from collections import Counter
 from pathlib import Path
 from zipfile import ZipFile
 
-from zmake import utils, image_io, constants, zab_patch
+from zmake import utils, image_io, constants, zab_patch, backup, cache, config, asset_index, build_scheduler
+from zmake.exceptions import ZMakeException, QuietExitException, InputRequiredException, ConfigException, \
+    ToolNotFoundException, ToolFailedException, AssetException, CancelledException, UsageException
+from zmake.progress import ProgressTracker
 from zmake.utils import read_json
 
+# [(plugin ID or None, name), func], in build order
 BUILD_HANDLERS = []
 
-
-class QuietExitException(Exception):
-    pass
-
-
-def build_handler(name):
+# (plugin ID or None, name) -> HandlerInfo
+HANDLER_INFO = {}
+
+# ID of plugin that is being imported, its handlers run only
+# for projects that enable this plugin
+loading_plugin = None
+
+
+class CancellationToken:
+    """
+    Thread-safe cancel flag. Long operations call raise_if_cancelled()
+    between files and build handlers.
+    """
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def is_cancelled(self):
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise CancelledException("Cancelled by user")
+
+
+class HandlerInfo:
+    """
+    Build handler declaration, used to schedule handlers and
+    to select them for partial builds.
+    """
+    def __init__(self, name: str, stage: str, requires: list, inputs: list, outputs: list, enabled_by: str):
+        self.name = name
+        self.stage = stage
+        self.requires = requires
+        self.inputs = inputs
+        self.outputs = outputs
+        self.enabled_by = enabled_by
+        self.plugin = None
+
+
+def build_handler(name, stage=None, requires=(), inputs=None, outputs=(), enabled_by=None, before=None):
+    """
+    Register build handler. Handlers run in registration order, but
+    ones with declared inputs and outputs may run in parallel with
+    independent handlers. Handlers are registered per plugin (None for
+    built-in ones), handler with already registered name is replaced.
+
+    :param stage: stage name for --only/--skip, handlers without stage always run
+    :param requires: stages that should run in same build with this handler,
+                     e.g. because handler uses their in-memory results or
+                     modifies their outputs
+    :param inputs: paths in build/ read by handler, "*" for everything;
+                   None (default) - run after all earlier handlers and
+                   before all later ones
+    :param outputs: paths in build/ created by handler, "{target_dir}" is replaced;
+                    removed before partial build
+    :param enabled_by: config key, handler does nothing if it's false
+    :param before: name of built-in handler to insert this one before, default is to append
+    """
     def _w(func):
-        BUILD_HANDLERS.append([name, func])
+        key = (loading_plugin, name)
+        keys = [h[0] for h in BUILD_HANDLERS]
+        if key in keys:
+            BUILD_HANDLERS[keys.index(key)][1] = func
+        elif (None, before) in keys:
+            BUILD_HANDLERS.insert(keys.index((None, before)), [key, func])
+        else:
+            BUILD_HANDLERS.append([key, func])
+
+        info = HandlerInfo(name, stage, list(requires), None if inputs is None else list(inputs),
+                           list(outputs), enabled_by)
+        info.plugin = loading_plugin
+        HANDLER_INFO[key] = info
         return func
     return _w
 
 
+def remove_plugin_handlers(plugin: str):
+    """
+    Unregister all handlers of plugin, before it's imported again.
+    """
+    BUILD_HANDLERS[:] = [h for h in BUILD_HANDLERS if h[0][0] != plugin]
+    for key in [k for k in HANDLER_INFO if k[0] == plugin]:
+        del HANDLER_INFO[key]
+
+
+def active_handlers(plugins: list):
+    """
+    :param plugins: IDs of plugins enabled for project
+    :return: built-in handlers and handlers of enabled plugins
+    """
+    return [h for h in BUILD_HANDLERS if h[0][0] is None or h[0][0] in plugins]
+
+
+def list_stages(handlers: list = None):
+    """
+    :return: stage names, in build order
+    """
+    stages = []
+    for key, _ in handlers if handlers is not None else BUILD_HANDLERS:
+        stage = HANDLER_INFO[key].stage
+        if stage is not None and stage not in stages:
+            stages.append(stage)
+    return stages
+
+
+def plan_build(config: dict, only: list = None, skip: list = None, handlers: list = None):
+    """
+    Select handlers for partial build, refuse combinations
+    that will produce inconsistent package.
+
+    :param only: stages to run, None for all
+    :param skip: stages to skip
+    :param handlers: handlers to select from, default is all registered
+    :return: keys of handlers to run, or None for full build
+    """
+    if not only and not skip:
+        return None
+
+    handlers = handlers if handlers is not None else BUILD_HANDLERS
+    stages = list_stages(handlers)
+    for stage in (only or []) + (skip or []):
+        if stage not in stages:
+            raise UsageException(f"Unknown build stage \"{stage}\", available: {', '.join(stages)}")
+
+    selected = [s for s in stages if (not only or s in only) and s not in (skip or [])]
+    # Rewritten in every build, so stages that update them can't be skipped
+    always_written = {output for key, _ in handlers if key[0] is None and HANDLER_INFO[key].stage is None
+                      for output in HANDLER_INFO[key].outputs}
+    plan = []
+    for key, _ in handlers:
+        info = HANDLER_INFO[key]
+        # Plugin handlers without stage may write anywhere, so they
+        # can't be rerun without rest of the build
+        runs = info.stage in selected or (info.stage is None and key[0] is None)
+        if runs:
+            plan.append(key)
+        if info.enabled_by is not None and not config[info.enabled_by]:
+            continue
+
+        updated = [output for output in info.outputs if output in always_written]
+        if not runs and len(updated) > 0:
+            hint = f" or disable \"{info.enabled_by}\"" if info.enabled_by is not None else ""
+            raise UsageException(f"Stage \"{info.stage}\" updates {', '.join(updated)}, that is rebuilt "
+                                 f"in every build, add it to build{hint}")
+
+        running = [s for s in info.requires if s in selected]
+        if runs and len(running) < len(info.requires):
+            missing = [s for s in info.requires if s not in selected]
+            raise UsageException(f"Stage \"{info.stage}\" needs {', '.join(missing)} in same build")
+        elif not runs and len(running) > 0:
+            raise UsageException(f"Stage \"{info.stage}\" should run after {', '.join(running)}, "
+                                 f"add it to build or skip {', '.join(running)} too")
+    return plan
+
+
 ASK_PROJECT_TYPE = """Select new project type:
 w - Watchface
 a - Application"""
@@ -34,39 +188,62 @@ Tell what do you want:
 2 - TGA -> PNG"""
 
 
+def _get_username():
+    try:
+        return os.getlogin()
+    except OSError:
+        # No controlling terminal, e.g. in CI
+        return getpass.getuser()
+
+
 class ZMakeContext:
-    def __init__(self, path: Path):
+    def __init__(self, path: Path, non_interactive=False, project_type=None, convert_direction=None,
+                 cancel_token: CancellationToken = None, only: list = None, skip: list = None):
         self.target_dir = ""
         self.zeus_platform_target = ""
         self.path = path
         self.path_assets = path / "assets"
-        self.config = {}
+        self.asset_index = None
+        self.preview_job = None
+        self.config = config.ZMakeConfig()
         self.app_json = {}
         self.logger = logging.getLogger("zmake")
 
+        # Non-interactive mode: ask_* will fail instead of prompt,
+        # so answers should be provided here
+        self.non_interactive = non_interactive
+        self.project_type = project_type
+        self.convert_direction = convert_direction
+
+        # Partial build: stages to run or skip, other results are reused from build/
+        self.build_only = only
+        self.build_skip = skip
+        self.build_plan = None
+        self.build_handlers = []
+
+        # Filled during processing, used for CI summary
+        self.action = ""
+        self.statistics = {}
+        self.timings = {}
+        self.progress = ProgressTracker()
+        self.cancel_token = cancel_token if cancel_token is not None else CancellationToken()
+
         self.load_config()
 
     def load_config(self):
         self.logger.info("Use config files:")
-        for file in self.list_config_locations():
-            if not file.is_file():
-                continue
-
-            self.logger.info(f"  {file}")
-            with file.open("r", encoding="utf8") as f:
-                overlay = json.loads(f.read())
-
-            for i in overlay:
-                self.config[i] = overlay[i]
+        self.config = config.load(self.list_config_locations())
 
     def list_config_locations(self):
-        return [
-            utils.APP_PATH / "zmake.json",
-            constants.CONFIG_DIR / "zmake.json",
-            self.path / "zmake.json",
-        ]
+        return config.default_locations(self.path)
+
+    def check_cancelled(self):
+        self.cancel_token.raise_if_cancelled()
 
     def ask_question(self, message, options):
+        if self.non_interactive:
+            raise InputRequiredException(f"Answer required in non-interactive mode: {message}")
+
         self.logger.info(message)
         result = ""
         while result not in options:
@@ -74,36 +251,66 @@ class ZMakeContext:
         return result
 
     def ask_input(self, message):
+        if self.non_interactive:
+            raise InputRequiredException(f"Input required in non-interactive mode: {message}")
+
         self.logger.info(message)
         result = input("> ")
         return result
 
+    def perform(self, action="auto"):
+        """
+        Run given action, or detect them by path with "auto".
+        """
+        if action == "auto":
+            return self.perform_auto()
+
+        handlers = {
+            "unpack": self.process_bin,
+            "patch_zab": self.process_zab,
+            "init": self.process_empty,
+            "build": self.process_project,
+            "convert": self.process_convert_auto,
+        }
+        if action not in handlers:
+            raise ValueError(f"Unknown action {action}")
+
+        self.action = action
+        handlers[action]()
+
     def perform_auto(self):
         if self.path.name.endswith(".bin") or self.path.name.endswith(".zip"):
             self.logger.info("We think that you want to unpack this file")
+            self.action = "unpack"
             self.process_bin()
         elif self.path.name.endswith(".zab"):
             self.logger.info("We think that you want to patch this ZAB for self-hosting")
+            self.action = "patch_zab"
             self.process_zab()
         elif self.path.is_dir() and next(self.path.iterdir(), False) is False:
             self.logger.info("We think that you want to create new project in this empty dir")
+            self.action = "init"
             self.process_empty()
         elif self.path.is_dir() and (self.path / "app.json").is_file():
             self.logger.info("We think that you want... build this project")
+            self.action = "build"
             self.process_project()
         else:
             self.logger.info("We think that you want... convert some images")
+            self.action = "convert"
             self.process_convert_auto()
 
     def process_empty(self):
-        inp = self.ask_question(ASK_PROJECT_TYPE, ["w", "a"])
+        inp = self.project_type
+        if inp is None:
+            inp = self.ask_question(ASK_PROJECT_TYPE, ["w", "a"])
         source_dirname = "page" if inp == "a" else "watchface"
 
         with (self.path / "app.json").open("w", encoding="utf8") as f:
             app_json = json.loads(utils.get_app_asset(f"app_{inp}.json"))
             app_json['app']['appId'] = random.randint(0x0000FFFF, 0x7FFFFFFF)
             app_json['app']['appName'] = self.path.name
-            app_json['app']['vender'] = os.getlogin()
+            app_json['app']['vender'] = _get_username()
             f.write(json.dumps(app_json, indent=2, sort_keys=True))
 
         for n in ["assets", source_dirname]:
@@ -141,6 +348,13 @@ class ZMakeContext:
         self.process_decode_images()
 
     def process_convert_auto(self):
+        if self.convert_direction == "encode":
+            self.logger.info("Direction: PNG -> TGA (forced)")
+            return self.process_encode_images()
+        elif self.convert_direction == "decode":
+            self.logger.info("Direction: TGA -> PNG (forced)")
+            return self.process_decode_images()
+
         files_png = 0
         files_tga = 0
 
@@ -173,74 +387,87 @@ class ZMakeContext:
             return self.process_decode_images()
 
     def get_img_target_type(self, file: Path):
-        mode_table = {
-            "rgb": "TGA-16",
-            "rgba": "TGA-32",
-            "p": "TGA-P",
-            "rlp": "TGA-RLP"
-        }
-
-        mode = self.config["def_format"]
-        for a in mode_table:
-            if file.name.endswith(f".{a}.png") or f".{a}/" in str(file):
-                mode = mode_table[a]
-                break
-
-        return mode
+        return asset_index.get_target_type(file, self.config["def_format"])
 
     def process_encode_images(self):
-        iterator = self.path.rglob("**/*.png")
+        iterator = list(self.path.rglob("**/*.png"))
         if self.path.is_file():
             iterator = [self.path]
 
-        statistics = {}
-        for file in iterator:
-            try:
-                image, file_type = image_io.load_auto(file, self.config["encode_mode"])
-                target_type = self.get_img_target_type(file)
-                if file_type == target_type or file_type == "N/A":
-                    continue
-
-                if self.config["auto_rgba"]:
-                    count_colors = len(Counter(image.getdata()).values())
-                    if count_colors > 256:
-                        target_type = "TGA-32"
-
-                if target_type in ["TGA-P", "TGA-RLP"] and not image.getcolors():
-                    image = utils.image_color_compress(image, file, self.logger)
-
-                ret = image_io.save_auto(image, file, target_type, self.config["encode_mode"])
-                assert ret is True
-                utils.increment_or_add(statistics, target_type)
-            except Exception as e:
-                self.logger.exception(f"FAILED, file {file}")
-                raise e
+        self.progress.start_handler("Convert PNG -> TGA", 0, 1)
+        self.progress.set_total(len(iterator))
 
+        statistics = {}
+        try:
+            for file in iterator:
+                self.check_cancelled()
+                try:
+                    image, file_type = image_io.load_auto(file, self.config["encode_mode"])
+                    target_type = self.get_img_target_type(file)
+                    if file_type == target_type or file_type == "N/A":
+                        self.progress.advance()
+                        continue
+
+                    if self.config["auto_rgba"]:
+                        count_colors = len(Counter(image.getdata()).values())
+                        if count_colors > 256:
+                            target_type = "TGA-32"
+
+                    if target_type in ["TGA-P", "TGA-RLP"] and not image.getcolors():
+                        image = utils.image_color_compress(image, file, self.logger,
+                                                           self.config["quantize_method"],
+                                                           self.config["quantize_dither"],
+                                                           self.config["with_cache"])
+
+                    # Write to temporary file and replace, backup may be a hardlink to source
+                    tmp_file = file.with_name(f".{file.name}.tmp")
+                    ret = image_io.save_auto(image, tmp_file, target_type, self.config["encode_mode"])
+                    assert ret is True
+                    os.replace(tmp_file, file)
+                    utils.increment_or_add(statistics, target_type)
+                    self.progress.advance(1, file.stat().st_size)
+                except Exception as e:
+                    self.logger.exception(f"FAILED, file {file}")
+                    raise AssetException(f"Can't convert {file}") from e
+        finally:
+            backup.flush()
+
+        backup.apply_retention(self.config["backup_max_size_mb"], self.config["backup_max_age_days"])
+        cache.evict(self.config["cache_max_size_mb"])
+        self.progress.end_handler()
+        self.statistics.update(statistics)
         for key in statistics:
             self.logger.info(f"  {statistics[key]} saved in {key} format")
 
     def process_decode_images(self):
-        iterator = self.path.rglob("**/*.png")
+        iterator = list(self.path.rglob("**/*.png"))
         if self.path.is_file():
             iterator = [self.path]
 
+        self.progress.start_handler("Convert TGA -> PNG", 0, 1)
+        self.progress.set_total(len(iterator))
+
         for file in iterator:
+            self.check_cancelled()
             try:
-                image, file_type = image_io.load_auto(file, self.config["encode_mode"])
-                if file_type == "PNG" or file_type == "N/A":
-                    continue
-
-                image.save(file)
+                # Decode and write row by row, to keep memory usage low on huge images
+                tmp_file = file.with_name(f".{file.name}.tmp")
+                with file.open("rb") as f:
+                    reader = image_io.open_rows(f, self.config["encode_mode"])
+                    if reader is None:
+                        self.progress.advance()
+                        continue
+
+                    with tmp_file.open("wb") as out:
+                        image_io.save_png_rows(out, reader.width, reader.height, reader.rows())
+                os.replace(tmp_file, file)
+                utils.increment_or_add(self.statistics, "PNG")
+                self.progress.advance(1, file.stat().st_size)
             except Exception as e:
                 self.logger.exception(f"FAILED, file {file}")
-                raise e
+                raise AssetException(f"Can't convert {file}") from e
 
-    def check_override_relative(self, rel_name):
-        if rel_name in self.config["overrides"]:
-            new_name = self.config["overrides"][rel_name]
-            self.logger.info(f"  Override {rel_name} -> {new_name}")
-            return new_name
-        return rel_name
+        self.progress.end_handler()
 
     def check_override(self, file: Path):
         rel_name = str(file)[len(str(self.path)) + 1:]
@@ -262,7 +489,27 @@ class ZMakeContext:
         if self.config["target_dir_override"] != "":
             self.target_dir = self.config["target_dir_override"]
 
-        for name, func in BUILD_HANDLERS:
-            func(self)
+        # Prevent circular import, plugins use build_handler
+        from zmake import plugins
+        handlers = active_handlers(plugins.load_plugins(self.config["plugins"], self.path))
+        self.build_handlers = [key for key, _ in handlers]
+        self.build_plan = plan_build(self.config, self.build_only, self.build_skip, handlers)
+        if self.build_plan is not None:
+            skipped = [s for s in list_stages(handlers)
+                       if not any(HANDLER_INFO[key].stage == s for key in self.build_plan)]
+            handlers = [h for h in handlers if h[0] in self.build_plan]
+            self.logger.info(f"Partial build, skip stages: {', '.join(skipped)}")
+
+        start_time = time.time()
+        workers = None if self.config["parallel_build"] else 1
+        self.timings = build_scheduler.run_handlers(self, [(HANDLER_INFO[key].name, func, HANDLER_INFO[key])
+                                                           for key, func in handlers],
+                                                    workers)
+
+        cache.evict(self.config["cache_max_size_mb"])
+
+        slow = [f"{name} {duration:.1f}s" for name, duration in self.timings.items() if duration >= 0.05]
+        self.logger.info(f"Build took {time.time() - start_time:.1f}s" +
+                         (f": {', '.join(slow)}" if len(slow) > 0 else ""))
 
         self.logger.info("Completed without error.")
@@ -0,0 +1,41 @@
+from zmake import constants
+
+
+class ZMakeException(Exception):
+    exit_code = constants.EXIT_FAILED
+
+
+class QuietExitException(ZMakeException):
+    """
+    Failure that was already reported to log,
+    application should just stop.
+    """
+    pass
+
+
+class UsageException(ZMakeException):
+    exit_code = constants.EXIT_USAGE
+
+
+class InputRequiredException(ZMakeException):
+    exit_code = constants.EXIT_INPUT_REQUIRED
+
+
+class ConfigException(ZMakeException):
+    exit_code = constants.EXIT_CONFIG_ERROR
+
+
+class ToolNotFoundException(QuietExitException):
+    exit_code = constants.EXIT_TOOL_NOT_FOUND
+
+
+class ToolFailedException(ZMakeException):
+    exit_code = constants.EXIT_TOOL_FAILED
+
+
+class AssetException(ZMakeException):
+    exit_code = constants.EXIT_ASSET_FAILED
+
+
+class CancelledException(ZMakeException):
+    exit_code = constants.EXIT_CANCELLED
@@ -0,0 +1,222 @@
+"""
+Render digit/text image sets from TTF/OTF fonts, described in
+"glyph_sets" config key:
+
+    {
+      "font": "fonts/Roboto-Bold.ttf",
+      "size": 48,
+      "chars": "0123456789",
+      "output": "time/digit_{index}.png",
+      "color": "#FFFFFF"
+    }
+
+Optional keys: "stroke_width", "stroke_color", "padding", "format",
+"fixed_width" (all images of set have same width, default true).
+"chars" may be a list of strings (e.g. weekday names). Output name
+placeholders: {index}, {char}, {code} (hex code of first char).
+"""
+import json
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+
+from zmake.cache import FileCache, make_key, hash_file
+from zmake.exceptions import ConfigException, AssetException
+
+GLYPHS_VERSION = 1
+
+# key: (allowed types, default), None default for required keys
+SET_SCHEMA = {
+    "font": (str, None),
+    "size": (int, None),
+    "chars": ((str, list), None),
+    "output": (str, None),
+    "color": (str, "#FFFFFF"),
+    "stroke_width": (int, 0),
+    "stroke_color": (str, "#000000"),
+    "padding": (int, 0),
+    "format": (str, ""),
+    "fixed_width": (bool, True),
+}
+
+FORMATS = ["TGA-P", "TGA-RLP", "TGA-16", "TGA-32"]
+
+glyph_cache = FileCache("glyphs")
+
+
+def _parse_color(value: str, name: str):
+    try:
+        return ImageColor.getrgb(value)[:3]
+    except ValueError:
+        raise ConfigException(f"Bad color \"{value}\" in glyph set {name}")
+
+
+def parse_set(spec: dict, index: int, def_format: str):
+    """
+    Validate glyph set config and fill defaults.
+
+    :param index: position in "glyph_sets", for error messages
+    :return: normalized glyph set
+    """
+    name = f"#{index + 1}"
+    if not isinstance(spec, dict):
+        raise ConfigException(f"Glyph set {name} should be an object")
+
+    result = {}
+    for key, (types, default) in SET_SCHEMA.items():
+        value = spec.get(key, default)
+        if value is None:
+            raise ConfigException(f"Glyph set {name} has no \"{key}\"")
+        if not isinstance(value, types) or (types is int and isinstance(value, bool)):
+            raise ConfigException(f"Wrong type of \"{key}\" in glyph set {name}")
+        result[key] = value
+
+    for key in spec:
+        if key not in SET_SCHEMA:
+            raise ConfigException(f"Unknown key \"{key}\" in glyph set {name}")
+
+    if isinstance(result["chars"], str):
+        result["chars"] = list(result["chars"])
+    if len(result["chars"]) == 0 or not all(isinstance(c, str) and c != "" for c in result["chars"]):
+        raise ConfigException(f"Glyph set {name} should have non-empty \"chars\"")
+    if result["size"] <= 0 or result["stroke_width"] < 0 or result["padding"] < 0:
+        raise ConfigException(f"Bad size, stroke_width or padding in glyph set {name}")
+
+    result["format"] = result["format"] or def_format
+    if result["format"] not in FORMATS:
+        raise ConfigException(f"Unsupported format \"{result['format']}\" in glyph set {name}")
+
+    try:
+        names = [output_name(result, i) for i in range(len(result["chars"]))]
+    except (KeyError, IndexError, ValueError):
+        raise ConfigException(f"Bad \"output\" template in glyph set {name}, "
+                              f"allowed placeholders: {{index}}, {{char}}, {{code}}")
+    if len(set(names)) != len(names):
+        raise ConfigException(f"Output names of glyph set {name} aren't unique, "
+                              f"use {{index}} or {{code}} in \"output\"")
+
+    _parse_color(result["color"], name)
+    _parse_color(result["stroke_color"], name)
+    return result
+
+
+def output_name(spec: dict, index: int):
+    """
+    :return: output path of glyph, relative to assets folder
+    """
+    text = spec["chars"][index]
+    return spec["output"].format(index=index, char=text, code=f"{ord(text[0]):04x}")
+
+
+def _text_width(font: ImageFont.FreeTypeFont, text: str, stroke_width: int):
+    left, _, right, _ = font.getbbox(text, stroke_width=stroke_width, anchor="ls")
+    # Spaces have empty bbox
+    return max(right - left, math.ceil(font.getlength(text)))
+
+
+def render_glyph(font: ImageFont.FreeTypeFont, spec: dict, text: str, width: int = None):
+    """
+    Render text centered in transparent image, with font baseline
+    at the same height in all images of set.
+
+    :param width: image width, default is text width
+    :return: RGBA image
+    """
+    stroke = spec["stroke_width"]
+    padding = spec["padding"]
+    ascent, descent = font.getmetrics()
+    if width is None:
+        width = _text_width(font, text, stroke) + 2 * padding
+    height = ascent + descent + 2 * (stroke + padding)
+
+    left, _, right, _ = font.getbbox(text, stroke_width=stroke, anchor="ls")
+    position = ((width - (right - left)) / 2 - left, padding + stroke + ascent)
+
+    # Layers are drawn as alpha masks, so pixels keep exact colors
+    layers = [(spec["color"], 0)]
+    if stroke > 0:
+        layers.insert(0, (spec["stroke_color"], stroke))
+
+    image = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+    for color, stroke_width in layers:
+        mask = Image.new("L", image.size, 0)
+        ImageDraw.Draw(mask).text(position, text, fill=255, font=font, anchor="ls", stroke_width=stroke_width)
+        layer = Image.new("RGBA", image.size, ImageColor.getrgb(color)[:3] + (0,))
+        layer.putalpha(mask)
+        image = Image.alpha_composite(image, layer)
+    return image
+
+
+def _load_font(path: Path, size: int):
+    try:
+        return ImageFont.truetype(str(path), size)
+    except OSError as e:
+        raise AssetException(f"Can't load font {path}") from e
+
+
+def _tga_format(data: bytes):
+    if data[2] == 2:
+        return "TGA-16" if data[16] == 16 else "TGA-32"
+    return "TGA-RLP" if data[2] == 9 else "TGA-P"
+
+
+def render_sets(project_path: Path, specs: list, encode, encode_key, use_cache=True, cancel_token=None):
+    """
+    Render and encode all glyphs of all sets in parallel. Results are
+    cached by font content, set parameters and encoder settings.
+
+    :param specs: sets returned by parse_set()
+    :param encode: function (image, target type) -> (file content, saved format)
+    :param encode_key: encoder settings, part of cache key
+    :return: per set, list of (output name, file content, format) and
+             number of glyphs restored from cache
+    """
+    fonts = {}
+    for spec in specs:
+        path = project_path / spec["font"]
+        if not path.is_file():
+            raise ConfigException(f"Font file \"{spec['font']}\" not found")
+        if spec["font"] not in fonts:
+            fonts[spec["font"]] = hash_file(path)
+
+    tasks = []
+    for set_index, spec in enumerate(specs):
+        width = None
+        if spec["fixed_width"]:
+            font = _load_font(project_path / spec["font"], spec["size"])
+            width = max(_text_width(font, text, spec["stroke_width"]) for text in spec["chars"]) \
+                + 2 * spec["padding"]
+        set_key = make_key("glyphs", GLYPHS_VERSION, fonts[spec["font"]], json.dumps(spec, sort_keys=True),
+                           width, encode_key)
+        for index in range(len(spec["chars"])):
+            tasks.append((set_index, index, width, make_key(set_key, index)))
+
+    def process(task):
+        set_index, index, width, key = task
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        spec = specs[set_index]
+
+        data = glyph_cache.get(key) if use_cache else None
+        if data is not None:
+            return data, _tga_format(data), True
+
+        # FreeType font objects aren't shared between threads
+        font = _load_font(project_path / spec["font"], spec["size"])
+        data, target_type = encode(render_glyph(font, spec, spec["chars"][index], width), spec["format"])
+        if use_cache:
+            glyph_cache.put(key, data)
+        return data, target_type, False
+
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+        results = list(pool.map(process, tasks))
+
+    output = [([], 0) for _ in specs]
+    for (set_index, index, _, _), (data, target_type, cached) in zip(tasks, results):
+        items, restored = output[set_index]
+        items.append((output_name(specs[set_index], index), data, target_type))
+        output[set_index] = (items, restored + int(cached))
+    return output
@@ -1,5 +1,7 @@
 import logging
+import struct
 import sys
+import zlib
 from pathlib import Path
 
 from PIL import Image
@@ -34,17 +36,80 @@ def load_auto(path: Path, encode_mode):
 
         if header == PNG_SIGNATURE:
             return Image.open(path), "PNG"
-        elif header[1] == 0 and header[2] == 2:
-            log.debug("Load as truecolor TGA")
-            return tga_load.load_truecolor_tga(f, encode_mode)
-        elif header[1] == 1 and header[2] == 1:
-            log.debug("Load as palette TGA")
-            return tga_load.load_palette_tga(f, encode_mode), "TGA-P"
-        elif header[1] == 1 and header[2] == 9:
-            log.debug("Load as palette RLP TGA")
-            return tga_load.load_rl_palette_tga(f, encode_mode), "TGA-RLP"
-        else:
-            return None, "N/A"
+        return load_stream(f, encode_mode)
+
+
+def load_stream(f, encode_mode):
+    """
+    Same as load_auto, but reads image from binary file object
+    (should support seek() and peek(), e.g. io.BufferedReader).
+    """
+    header = f.read(4)
+    f.seek(0)
+
+    if header == PNG_SIGNATURE:
+        image = Image.open(f)
+        image.load()
+        return image, "PNG"
+    elif len(header) < 4:
+        return None, "N/A"
+    elif header[1] == 0 and header[2] == 2:
+        log.debug("Load as truecolor TGA")
+        return tga_load.load_truecolor_tga(f, encode_mode)
+    elif header[1] == 1 and header[2] == 1:
+        log.debug("Load as palette TGA")
+        return tga_load.load_palette_tga(f, encode_mode), "TGA-P"
+    elif header[1] == 1 and header[2] == 9:
+        log.debug("Load as palette RLP TGA")
+        return tga_load.load_rl_palette_tga(f, encode_mode), "TGA-RLP"
+    else:
+        return None, "N/A"
+
+
+def open_rows(f, encode_mode):
+    """
+    Open TGA image for row-by-row decoding.
+
+    :param f: binary file object, should support seek()
+    :return: tga_load.TgaRowReader, or None if it isn't a TGA image
+    """
+    header = f.read(4)
+    f.seek(0)
+
+    if len(header) < 4 or header == PNG_SIGNATURE:
+        return None
+    try:
+        return tga_load.TgaRowReader(f, encode_mode)
+    except ValueError:
+        f.seek(0)
+        return None
+
+
+def _png_chunk(out, chunk_type: bytes, data: bytes):
+    out.write(struct.pack(">I", len(data)))
+    out.write(chunk_type)
+    out.write(data)
+    out.write(struct.pack(">I", zlib.crc32(chunk_type + data)))
+
+
+def save_png_rows(out, width: int, height: int, rows):
+    """
+    Write RGBA PNG incrementally, without whole image in memory.
+
+    :param out: binary file object
+    :param rows: iterable of RGBA rows (bytes)
+    """
+    out.write(b"\211PNG\r\n\032\n")
+    _png_chunk(out, b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+
+    compressor = zlib.compressobj(6)
+    for row in rows:
+        # Filter type 0 (none)
+        data = compressor.compress(b"\x00" + row)
+        if data:
+            _png_chunk(out, b"IDAT", data)
+    _png_chunk(out, b"IDAT", compressor.flush())
+    _png_chunk(out, b"IEND", b"")
 
 
 def save_auto(img: Image.Image, out: Path, dest_type: str, encode_mode):
@@ -67,6 +132,25 @@ def save_auto(img: Image.Image, out: Path, dest_type: str, encode_mode):
         return False
 
 
+def encode_auto(img: Image.Image, dest_type: str, encode_mode, truncate_palette=False):
+    """
+    Same as save_auto, but returns TGA file content.
+
+    :param truncate_palette: write only used palette entries (TGA-P, TGA-RLP)
+    :return: bytes, or None if format isn't supported
+    """
+    if dest_type == "TGA-P":
+        return tga_save.encode_palette_tga(img, encode_mode, truncate_palette)
+    elif dest_type == "TGA-16":
+        return tga_save.encode_truecolor_tga(img, 16, encode_mode)
+    elif dest_type == "TGA-32":
+        return tga_save.encode_truecolor_tga(img, 32, encode_mode)
+    elif dest_type == "TGA-RLP":
+        return tga_save.encode_rl_palette_tga(img, encode_mode, truncate_palette)
+    else:
+        return None
+
+
 if __name__ == "__main__":
     logging.basicConfig(level=logging.DEBUG)
 
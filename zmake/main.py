@@ -1,11 +1,72 @@
+import argparse
+import contextlib
+import json
 import logging
 import os.path
 import sys
+import time
 import traceback
 from pathlib import Path
 
 from zmake import ZMakeContext, GUIDE, utils, constants
-from zmake.context import QuietExitException
+from zmake.context import QuietExitException, ZMakeException
+
+
+def _stage_list(value: str):
+    # Stages are validated by build, plugins may add own ones
+    return [s.strip() for s in value.split(",") if s.strip() != ""]
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="zmake",
+                                     description="Unofficial ZeppOS build tool")
+    parser.add_argument("path", nargs="?",
+                        help="file or directory to process")
+    parser.add_argument("-y", "--yes", "--non-interactive", dest="non_interactive", action="store_true",
+                        help="never wait for user input, print JSON summary to stdout (for CI)")
+    parser.add_argument("--direction", choices=["encode", "decode"],
+                        help="image conversion direction: encode (PNG -> TGA) or decode (TGA -> PNG)")
+    parser.add_argument("--type", dest="project_type", choices=["w", "a"],
+                        help="new project type: w - watchface, a - application")
+    parser.add_argument("--only", type=_stage_list,
+                        help="partial build: run only these comma-separated stages, reuse build/ for others")
+    parser.add_argument("--skip", type=_stage_list,
+                        help="partial build: skip these comma-separated stages, reuse their results from build/")
+    parser.add_argument("--dump-config", action="store_true",
+                        help="print effective config for given path and exit")
+    parser.add_argument("--daemon", action="store_true",
+                        help="send task to running `zmake serve` daemon")
+    parser.add_argument("--daemon-address", default=constants.DAEMON_ADDRESS,
+                        help=f"daemon address, host:port or unix:/path (default {constants.DAEMON_ADDRESS})")
+    return parser
+
+
+def build_serve_parser():
+    parser = argparse.ArgumentParser(prog="zmake serve",
+                                     description="Run zmake build daemon")
+    parser.add_argument("--address", default=constants.DAEMON_ADDRESS,
+                        help=f"listen address, host:port or unix:/path (default {constants.DAEMON_ADDRESS})")
+    parser.add_argument("--memory-cache-mb", type=int, default=256,
+                        help="size of in-memory cache for converted assets and JS files")
+    return parser
+
+
+def build_verify_parser():
+    parser = argparse.ArgumentParser(prog="zmake verify",
+                                     description="Check TGA images in package or directory")
+    parser.add_argument("path",
+                        help=".bin/.zip/.zpk/.zab package or directory")
+    parser.add_argument("--json", action="store_true",
+                        help="print JSON summary to stdout")
+    return parser
+
+
+def print_guide():
+    print(GUIDE)
+    print("Config locations:")
+    print(f'  {utils.APP_PATH / "zmake.json"}')
+    print(f'  {constants.CONFIG_DIR / "zmake.json"}')
+    print("")
 
 
 def main():
@@ -15,21 +76,44 @@ def main():
     else:
         logging.basicConfig(level=logging.INFO, format="%(message)s")
 
-    if len(sys.argv) < 2:
-        print(GUIDE)
-        print("Config locations:")
-        print(f'  {utils.APP_PATH / "zmake.json"}')
-        print(f'  {constants.CONFIG_DIR / "zmake.json"}')
-        print("")
+    if sys.argv[1:2] == ["serve"]:
+        from zmake import server
+        args = build_serve_parser().parse_args(sys.argv[2:])
+        server.serve(args.address, args.memory_cache_mb)
+        raise SystemExit
+
+    if sys.argv[1:2] == ["verify"]:
+        args = build_verify_parser().parse_args(sys.argv[2:])
+        raise SystemExit(run_verify(Path(args.path).resolve(), args.json))
+
+    args = build_parser().parse_args()
+
+    if args.path is None:
+        print_guide()
+        if args.non_interactive:
+            raise SystemExit(constants.EXIT_USAGE)
         print("Press any key to exit")
         input()
         raise SystemExit
 
-    path = Path(sys.argv[1]).resolve()
+    path = Path(args.path).resolve()
+
+    if args.dump_config:
+        raise SystemExit(dump_config(path))
+
+    if args.daemon:
+        raise SystemExit(run_on_daemon(path, args))
+
+    if args.non_interactive:
+        raise SystemExit(run_non_interactive(path, args))
 
+    run_interactive(path, args.only, args.skip)
+
+
+def run_interactive(path: Path, only=None, skip=None):
     # noinspection PyBroadException
     try:
-        ctx = ZMakeContext(path)
+        ctx = ZMakeContext(path, only=only, skip=skip)
         ctx.perform_auto()
     except QuietExitException:
         input()
@@ -37,3 +121,150 @@ def main():
         traceback.print_exc()
         print("FAILED")
         input()
+
+
+def dump_config(path: Path):
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            ctx = ZMakeContext(path)
+        except ZMakeException as e:
+            logging.getLogger("zmake").error(f"ERROR: {e}")
+            return e.exit_code
+
+    print(ctx.config.dump())
+    return constants.EXIT_OK
+
+
+def run_verify(path: Path, print_json=False):
+    """
+    :return: process exit code
+    """
+    from zmake import tga_verify
+
+    log = logging.getLogger("zmake")
+    if not path.exists():
+        log.error(f"ERROR: {path} not found")
+        return constants.EXIT_BAD_INPUT
+
+    checked, broken = tga_verify.verify_path(path)
+    for name, problems in broken.items():
+        log.error(f"{name}: {', '.join(problems)}")
+    log.info(f"Checked {checked} TGA images, {len(broken)} broken")
+
+    exit_code = constants.EXIT_ASSET_FAILED if broken else constants.EXIT_OK
+    if print_json:
+        print(json.dumps({"path": str(path), "checked": checked, "broken": broken, "exit_code": exit_code}))
+    return exit_code
+
+
+def get_exit_code(e: BaseException):
+    if isinstance(e, ZMakeException):
+        return e.exit_code
+    elif isinstance(e, KeyboardInterrupt):
+        return constants.EXIT_INTERRUPTED
+    elif isinstance(e, (FileExistsError, FileNotFoundError)):
+        return constants.EXIT_BAD_INPUT
+    return constants.EXIT_FAILED
+
+
+def run_task(path: Path, action="auto", project_type=None, convert_direction=None, on_progress=None,
+             cancel_token=None, only=None, skip=None):
+    """
+    Process path without any user interaction.
+
+    :param on_progress: progress listener, see ProgressTracker
+    :param cancel_token: CancellationToken to stop task from other thread
+    :param only: build stages to run (partial build)
+    :param skip: build stages to skip (partial build)
+
+    :return: summary dict, with exit_code
+    """
+    summary = {
+        "version": constants.VERSION,
+        "path": str(path),
+        "action": "",
+        "status": "ok",
+        "exit_code": constants.EXIT_OK,
+    }
+    start_time = time.time()
+
+    ctx = None
+    # noinspection PyBroadException
+    try:
+        ctx = ZMakeContext(path,
+                           non_interactive=True,
+                           project_type=project_type,
+                           convert_direction=convert_direction,
+                           cancel_token=cancel_token,
+                           only=only,
+                           skip=skip)
+        if on_progress is not None:
+            ctx.progress.add_listener(on_progress)
+        ctx.perform(action)
+    except (Exception, KeyboardInterrupt) as e:
+        if isinstance(e, ZMakeException):
+            if not isinstance(e, QuietExitException):
+                logging.getLogger("zmake").error(f"ERROR: {e}")
+        else:
+            logging.getLogger("zmake").exception("FAILED")
+        summary["status"] = "failed"
+        summary["exit_code"] = get_exit_code(e)
+        summary["error_type"] = type(e).__name__
+        summary["error"] = str(e)
+
+    if ctx is not None:
+        summary["action"] = ctx.action
+        summary["statistics"] = ctx.statistics
+        summary["timings"] = ctx.timings
+        if ctx.action == "build" and (ctx.path / "dist").is_dir():
+            summary["outputs"] = sorted(str(p) for p in (ctx.path / "dist").iterdir() if p.name != ".gitignore")
+
+    summary["duration"] = round(time.time() - start_time, 3)
+    return summary
+
+
+def run_non_interactive(path: Path, args):
+    """
+    Run task and print JSON summary. Everything
+    except summary goes to stderr.
+
+    :return: process exit code
+    """
+    with contextlib.redirect_stdout(sys.stderr):
+        summary = run_task(path, "auto", args.project_type, args.direction, only=args.only, skip=args.skip)
+
+    print(json.dumps(summary))
+    return summary["exit_code"]
+
+
+def run_on_daemon(path: Path, args):
+    """
+    Send task to running daemon, print their log to stderr.
+    Falls back to local processing, if daemon isn't available.
+
+    :return: process exit code
+    """
+    from zmake import server
+
+    def on_event(event):
+        if event["event"] == "log":
+            print(event["message"], file=sys.stderr)
+
+    request = {"action": "auto", "path": str(path), "type": args.project_type, "direction": args.direction,
+               "only": args.only, "skip": args.skip}
+    try:
+        summary = server.send_request(request, on_event, args.daemon_address)
+    except (OSError, ValueError) as e:
+        logging.getLogger("zmake").warning(f"Daemon at {args.daemon_address} isn't available ({e}), "
+                                           f"process locally")
+        if args.non_interactive:
+            return run_non_interactive(path, args)
+        return run_interactive(path, args.only, args.skip)
+
+    summary.pop("event")
+    if args.non_interactive:
+        print(json.dumps(summary))
+    elif summary["exit_code"] != constants.EXIT_OK:
+        print("FAILED")
+        input()
+    return summary["exit_code"]
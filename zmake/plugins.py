@@ -0,0 +1,259 @@
+"""
+In-process plugins: Python modules that add build stages.
+
+Plugin is a .py file in project (path relative to project folder) or
+installed module registered under "zmake.plugins" entry point group,
+enabled by listing it in "plugins" config key. Plugin registers handlers
+with plugin_handler() on import:
+
+    from zmake.plugins import plugin_handler
+
+    @plugin_handler("Minify JSON", ["data/*.json"], stage="data", outputs=["data"])
+    def minify(run):
+        for rel_name in run.changed:
+            data = json.loads((run.context.path / rel_name).read_bytes())
+            run.write(rel_name, rel_name, json.dumps(data, separators=(",", ":")))
+"""
+import fnmatch
+import importlib.metadata
+import importlib.util
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from zmake import context as zmake_context
+from zmake.cache import FileCache, make_key, hash_file
+from zmake.exceptions import ConfigException
+
+PLUGIN_GROUP = "zmake.plugins"
+
+# Folders that are never passed to plugins
+EXCLUDED_DIRS = ("build/", "dist/")
+
+plugin_cache = FileCache("plugins")
+
+# plugin ID -> (mtime_ns of plugin file or None, module)
+_loaded = {}
+_load_lock = threading.Lock()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def worker_pool():
+    """
+    :return: thread pool shared by all plugins, lives until process exit
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix="zmake-plugin")
+        return _pool
+
+
+def _entry_point(name: str):
+    eps = importlib.metadata.entry_points()
+    eps = eps.select(group=PLUGIN_GROUP) if hasattr(eps, "select") else eps.get(PLUGIN_GROUP, [])
+    for ep in eps:
+        if ep.name == name:
+            return ep
+    return None
+
+
+def _plugin_id(name: str, project_path: Path):
+    # Plugin files of different projects are different plugins
+    if name.endswith(".py"):
+        return str((project_path / name).resolve())
+    return name
+
+
+def _import(name: str, plugin_id: str):
+    if name.endswith(".py"):
+        path = Path(plugin_id)
+        try:
+            mtime = path.stat().st_mtime_ns
+        except OSError:
+            raise ConfigException(f"Plugin file \"{name}\" not found")
+
+        loaded = _loaded.get(plugin_id)
+        if loaded is not None and loaded[0] == mtime:
+            return
+        # Handlers may be renamed or removed in new version
+        zmake_context.remove_plugin_handlers(plugin_id)
+        spec = importlib.util.spec_from_file_location(f"zmake_plugin_{len(_loaded)}_{path.stem}", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _loaded[plugin_id] = (mtime, module)
+        return
+
+    if plugin_id in _loaded:
+        return
+    ep = _entry_point(name)
+    if ep is None:
+        raise ConfigException(f"Plugin \"{name}\" isn't installed (no \"{PLUGIN_GROUP}\" entry point)")
+    _loaded[plugin_id] = (None, ep.load())
+
+
+def load_plugins(names: list, project_path: Path):
+    """
+    Import enabled plugins, so their handlers are registered. Plugin files
+    are imported again when changed (old handlers are removed first).
+
+    :param names: "plugins" config value
+    :return: IDs of plugins that are active for this project
+    """
+    result = []
+    with _load_lock:
+        for name in names:
+            plugin_id = _plugin_id(name, project_path)
+            zmake_context.loading_plugin = plugin_id
+            try:
+                _import(name, plugin_id)
+            except ConfigException:
+                raise
+            except Exception as e:
+                raise ConfigException(f"Can't load plugin \"{name}\": {e}") from e
+            finally:
+                zmake_context.loading_plugin = None
+            result.append(plugin_id)
+    return result
+
+
+class PluginRun:
+    """
+    Plugin invocation state, passed to plugin function.
+
+    :ivar files: all project files that match plugin globs, relative paths
+    :ivar changed: files that are new or changed since last build, plugin
+                   should process only them, outputs of others are restored
+                   from cache
+    :ivar removed: files that were present in last build
+    :ivar pool: shared thread pool
+    """
+    def __init__(self, context, name: str, files: list, changed: list, removed: list):
+        self.context = context
+        self.name = name
+        self.files = files
+        self.changed = changed
+        self.removed = removed
+        self.pool = worker_pool()
+        self.build_path = context.path / "build"
+        self.outputs = {}
+        self._lock = threading.Lock()
+
+    def write(self, source, rel_name: str, data):
+        """
+        Write output file into build/. Thread-safe.
+
+        :param source: input file this output was made from, outputs
+                       with None source aren't cached and should be
+                       written on every run
+        :param rel_name: path inside build/
+        :param data: bytes or str
+        """
+        if isinstance(data, str):
+            data = data.encode("utf8")
+        path = self.build_path / rel_name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+        if source is not None:
+            with self._lock:
+                self.outputs.setdefault(source, {})[rel_name] = data
+
+
+def _collect_files(project_path: Path, globs: list):
+    result = []
+    for path in sorted(project_path.rglob("*")):
+        rel_name = path.relative_to(project_path).as_posix()
+        if rel_name.startswith(EXCLUDED_DIRS) or not path.is_file():
+            continue
+        if any(fnmatch.fnmatch(rel_name, pattern) for pattern in globs):
+            result.append(rel_name)
+    return result
+
+
+def _restore(run: PluginRun, outputs: dict):
+    blobs = {}
+    for rel_name, key in outputs.items():
+        data = plugin_cache.get(key)
+        if data is None:
+            return False
+        blobs[rel_name] = data
+    for rel_name, data in blobs.items():
+        path = run.build_path / rel_name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    return True
+
+
+def _run_plugin(context, plugin_id: str, name: str, func, globs: list, version, config_keys: list):
+    with_cache = context.config["with_cache"]
+    files = _collect_files(context.path, globs)
+    pool = worker_pool()
+    hashes = dict(zip(files, pool.map(lambda f: hash_file(context.path / f), files)))
+
+    state_key = make_key("plugin", plugin_id, name, version, str(context.path),
+                         json.dumps({key: context.config.get(key) for key in config_keys}, sort_keys=True))
+    state = {}
+    if with_cache:
+        data = plugin_cache.get(state_key)
+        if data is not None:
+            state = json.loads(data)
+
+    run = PluginRun(context, name, files, [], [f for f in state if f not in hashes])
+    restored = {}
+    for rel_name in files:
+        entry = state.get(rel_name)
+        if entry is not None and entry["hash"] == hashes[rel_name] and _restore(run, entry["outputs"]):
+            restored[rel_name] = entry
+        else:
+            run.changed.append(rel_name)
+
+    func(run)
+
+    if with_cache:
+        new_state = dict(restored)
+        for rel_name in run.changed:
+            outputs = {}
+            for out_name, data in run.outputs.get(rel_name, {}).items():
+                key = make_key("plugin-output", data)
+                plugin_cache.put(key, data)
+                outputs[out_name] = key
+            new_state[rel_name] = {"hash": hashes[rel_name], "outputs": outputs}
+        plugin_cache.put(state_key, json.dumps(new_state).encode("utf8"))
+
+    context.logger.info(f"  {len(run.changed)} of {len(files)} files changed, "
+                        f"{len(restored)} restored from cache")
+
+
+def plugin_handler(name: str, globs: list, before="Deduplicate assets", stage=None,
+                   outputs=None, version=1, config_keys=()):
+    """
+    Register plugin build handler. Function receives PluginRun, should
+    process files from run.changed and write results with run.write().
+
+    :param globs: project files to pass to plugin, fnmatch patterns
+                  relative to project folder
+    :param before: name of build handler to run before
+    :param stage: stage name for --only/--skip; handlers without stage
+                  run only in full builds
+    :param outputs: paths in build/ written by plugin; with None, plugin
+                    doesn't run in parallel with other handlers
+    :param version: change to invalidate cached outputs
+    :param config_keys: config keys that affect outputs, part of cache key
+    """
+    def _w(func):
+        plugin_id = zmake_context.loading_plugin
+
+        def handler(context):
+            context.logger.info(f"{name}:")
+            _run_plugin(context, plugin_id, name, func, list(globs), version, list(config_keys))
+
+        zmake_context.build_handler(name, stage=stage, inputs=None if outputs is None else [],
+                                    outputs=outputs or (), before=before)(handler)
+        return func
+    return _w
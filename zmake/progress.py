@@ -0,0 +1,104 @@
+import threading
+import time
+
+
+class ProgressTracker:
+    """
+    Collects build progress and sends it to listeners as event dicts:
+
+    - kind: "handler_start", "handler_end" or "files"
+    - handler, handler_index, handlers_total: current build stage
+    - done, total: files processed in current stage
+    - bytes: bytes written in current stage
+    - fraction: overall progress, 0..1
+    - eta: estimated seconds left for current stage, or None
+    """
+    def __init__(self):
+        self.listeners = []
+        self.lock = threading.Lock()
+        # Handlers may run in parallel, each thread tracks own stage
+        self.local = threading.local()
+        self.handlers_total = 1
+        self.handlers_done = 0
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def _stage(self):
+        stage = getattr(self.local, "stage", None)
+        if stage is None:
+            stage = self.local.stage = _Stage("", 0)
+        return stage
+
+    def start_handler(self, name: str, index: int, count: int):
+        with self.lock:
+            self.local.stage = _Stage(name, index)
+            self.handlers_total = max(count, 1)
+            if index == 0:
+                self.handlers_done = 0
+        self._emit("handler_start")
+
+    def end_handler(self):
+        with self.lock:
+            stage = self._stage()
+            stage.done = stage.total
+            stage.finished = True
+            self.handlers_done += 1
+        self._emit("handler_end")
+
+    def set_total(self, total: int):
+        with self.lock:
+            stage = self._stage()
+            stage.total = total
+            stage.done = 0
+        self._emit("files")
+
+    def advance(self, count=1, bytes_written=0):
+        with self.lock:
+            stage = self._stage()
+            stage.done += count
+            stage.bytes += bytes_written
+        self._emit("files")
+
+    def _emit(self, kind: str):
+        if len(self.listeners) == 0:
+            return
+
+        with self.lock:
+            stage = self._stage()
+            stage_fraction = stage.done / stage.total if stage.total > 0 else 0
+            handlers_done = self.handlers_done
+            if stage.finished:
+                stage_fraction = 0
+
+            eta = None
+            if 0 < stage.done < stage.total:
+                elapsed = time.time() - stage.start
+                eta = round(elapsed / stage.done * (stage.total - stage.done), 1)
+
+            event = {
+                "kind": kind,
+                "handler": stage.handler,
+                "handler_index": stage.index,
+                "handlers_total": self.handlers_total,
+                "done": stage.done,
+                "total": stage.total,
+                "bytes": stage.bytes,
+                "fraction": min((handlers_done + stage_fraction) / self.handlers_total, 1),
+                "eta": eta,
+            }
+
+            # Listeners may be called from several threads
+            for listener in self.listeners:
+                listener(event)
+
+
+class _Stage:
+    def __init__(self, handler: str, index: int):
+        self.handler = handler
+        self.index = index
+        self.done = 0
+        self.total = 0
+        self.bytes = 0
+        self.finished = False
+        self.start = time.time()
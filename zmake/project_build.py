@@ -1,28 +1,40 @@
+import fnmatch
 import io
 import json
+import logging
 import os
+import posixpath
+import re
+import shlex
 import shutil
 import subprocess
+import tempfile
 import time
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from zipfile import ZipFile, ZIP_DEFLATED
 
 from PIL import Image
 
-from zmake import utils, image_io, constants
-from zmake.context import build_handler, ZMakeContext
-from zmake.third_tools_manager import run_ext_tool
+from zmake import utils, image_io, constants, asset_analyzer, animation, tga_save, tga_verify, glyphs
+from zmake.asset_index import AssetIndex, is_ignored, DEFAULT_IGNORE_FILES
+from zmake.cache import FileCache, make_key, hash_file
+from zmake.context import build_handler, ZMakeContext, AssetException, ToolFailedException, UsageException, \
+    HANDLER_INFO
+from zmake.source_map import SourceMapBuilder, shift_source_map
+from zmake.third_tools_manager import run_ext_tool, get_tool_version
 
+log = logging.getLogger("zmake")
+js_cache = FileCache("js")
+preview_cache = FileCache("preview")
 
-def should_ignore_file(filename: str, context: ZMakeContext):
-    for file_to_ignore in context.config.get("ignore_files", [".DS_Store", "Thumbs.db"]):
-        if file_to_ignore in filename:
-            return True
 
-    return False
+def should_ignore_file(filename: str, context: ZMakeContext):
+    return is_ignored(filename, context.config.get("ignore_files", DEFAULT_IGNORE_FILES))
 
 
-@build_handler("Pre-build command")
+@build_handler("Pre-build command", stage="prebuild")
 def post_build(context: ZMakeContext):
     if context.config.get("pre_build_script", "") == "":
         return
@@ -30,11 +42,53 @@ def post_build(context: ZMakeContext):
     subprocess.Popen([os.path.expanduser(context.config["pre_build_script"]), str(context.path)]).wait()
 
 
+def _remove_output(path: Path, keep: set):
+    if path in keep:
+        return
+    if path.is_dir() and any(path in k.parents for k in keep):
+        for child in path.iterdir():
+            _remove_output(child, keep)
+    elif path.is_dir():
+        shutil.rmtree(path)
+    elif path.exists():
+        path.unlink()
+
+
+def _prepare_partial(context: ZMakeContext):
+    """
+    Keep build/ and dist/ from previous build, remove only
+    outputs of handlers that will run. Outputs of enabled handlers
+    that don't run are kept, even inside folders of running ones.
+    """
+    path_build = context.path / "build"
+    if not (path_build / "app.json").is_file():
+        raise UsageException("No previous build to reuse, run full build first")
+
+    def outputs(key):
+        return {path_build / output.format(target_dir=context.target_dir) for output in HANDLER_INFO[key].outputs}
+
+    keep = set()
+    for key in context.build_handlers:
+        info = HANDLER_INFO[key]
+        if key not in context.build_plan and (info.enabled_by is None or context.config[info.enabled_by]):
+            keep |= outputs(key)
+
+    for key in context.build_plan:
+        for path in outputs(key):
+            _remove_output(path, keep)
+
+    (context.path / "dist").mkdir(exist_ok=True)
+    (path_build / context.target_dir).mkdir(exist_ok=True)
+
+
 @build_handler("Prepare")
 def prepare(context: ZMakeContext):
     path_build = context.path / "build"
     path_dist = context.path / "dist"
 
+    if context.build_plan is not None:
+        return _prepare_partial(context)
+
     if path_build.exists():
         shutil.rmtree(path_build)
     if path_dist.exists():
@@ -52,9 +106,12 @@ def prepare(context: ZMakeContext):
     (path_build / context.target_dir).mkdir()
 
 
-@build_handler("Process app.json")
-def process_app_json(context: ZMakeContext):
-    context.logger.info("Processing app.json:")
+def prepare_app_json(app_json: dict, config: dict):
+    """
+    Add package info to app.json and apply selected target (if any).
+
+    :return: selected target ID, or None
+    """
     package_info = {
         "mode": "preview",
         "timeStamp": round(time.time()),
@@ -63,21 +120,30 @@ def process_app_json(context: ZMakeContext):
         "zmake": constants.VERSION
     }
 
-    context.app_json["packageInfo"] = package_info
-    context.app_json["platforms"] = context.config["zeus_platforms"]
+    app_json["packageInfo"] = package_info
+    app_json["platforms"] = config["zeus_platforms"]
 
-    if "targets" in context.app_json:
-        target_id = context.config["zeus_target"]
-        if target_id not in context.app_json["targets"]:
-            target_id = list(context.app_json["targets"].keys())[0]
-        context.logger.info(f"  Found targets, use \"{target_id}\" target")
+    if "targets" not in app_json:
+        return None
 
-        context.path_assets = context.path / "assets" / target_id
+    target_id = config["zeus_target"]
+    if target_id not in app_json["targets"]:
+        target_id = list(app_json["targets"].keys())[0]
+
+    for key in app_json["targets"][target_id]:
+        app_json[key] = app_json["targets"][target_id][key]
+
+    del app_json["targets"]
+    return target_id
 
-        for key in context.app_json["targets"][target_id]:
-            context.app_json[key] = context.app_json["targets"][target_id][key]
 
-        del context.app_json["targets"]
+@build_handler("Process app.json", inputs=[], outputs=["app.json"])
+def process_app_json(context: ZMakeContext):
+    context.logger.info("Processing app.json:")
+    target_id = prepare_app_json(context.app_json, context.config)
+    if target_id is not None:
+        context.logger.info(f"  Found targets, use \"{target_id}\" target")
+        context.path_assets = context.path / "assets" / target_id
 
     app_json_string = json.dumps(context.app_json, indent=4, sort_keys=True)
     with open(context.path / "build" / "app.json", "w") as f:
@@ -86,56 +152,372 @@ def process_app_json(context: ZMakeContext):
     context.logger.info("  Done")
 
 
-@build_handler("Convert assets")
+def _select_formats(context: ZMakeContext, index: AssetIndex):
+    """
+    Find smallest legal format for each image without explicit format.
+
+    :return: analysis results of images that switch format
+    """
+    files = [e for e in index.files() if not e.explicit_type and e.source.suffix.lower() == ".png"]
+    if len(files) == 0:
+        return {}
+
+    results = asset_analyzer.analyse(files, context.config["rotated_assets"], context.config["encode_mode"],
+                                     context.config["with_cache"], context.cancel_token)
+
+    total_best = 0
+    total_default = 0
+    for result in results.values():
+        default_type = context.config["def_format"]
+        if context.config["auto_rgba"] and "TGA-P" not in result["sizes"]:
+            default_type = "TGA-32"
+        if default_type not in result["sizes"]:
+            # Will be quantized, size can't be compared
+            continue
+        total_best += result["sizes"][result["best"]]
+        total_default += result["sizes"][default_type]
+
+    context.logger.info(f"  Auto format for {len(results)} images: {total_best / 1024:.1f} KB "
+                        f"instead of {total_default / 1024:.1f} KB")
+
+    # Images that keep their format still go through shared palettes and auto_rle
+    target_types = {e.rel_name: e.target_type for e in files}
+    switched = {name: result for name, result in results.items() if result["best"] != target_types[name]}
+    if len(switched) > 0:
+        context.logger.info(f"  {len(switched)} images switched format, shared palettes "
+                            f"and auto_rle don't apply to them")
+    return switched
+
+
+def _select_palette_formats(context: ZMakeContext, index: AssetIndex, formats: dict, skip: set):
+    """
+    Switch images with default palette format between TGA-P and TGA-RLP,
+    by estimated size. Images that may be rotated are kept as is.
+    """
+    files = [e for e in index.files()
+             if not e.explicit_type and e.target_type in ["TGA-P", "TGA-RLP"]
+             and e.rel_name not in formats and e.rel_name not in skip
+             and e.source.suffix.lower() == ".png"
+             and not asset_analyzer.is_rotated(e.rel_name, context.config["rotated_assets"])]
+    if len(files) == 0:
+        return {}
+
+    results = asset_analyzer.estimate_palette(files, context.config["encode_mode"],
+                                              context.config["with_cache"], context.cancel_token)
+    selected = {}
+    switched = Counter()
+    saved = 0
+    for entry in files:
+        sizes = results[entry.rel_name]
+        if sizes is None:
+            # Will be quantized
+            continue
+        best = asset_analyzer.choose_palette_format(sizes, entry.target_type, context.config["auto_rle_tolerance"])
+        if best != entry.target_type:
+            selected[entry.rel_name] = {"best": best}
+            switched[best] += 1
+            saved += sizes[entry.target_type] - sizes[best]
+
+    context.statistics["auto_rle_saved"] = saved
+    context.logger.info(f"  Auto RLE: {switched['TGA-RLP']} images switched to TGA-RLP, "
+                        f"{switched['TGA-P']} to TGA-P, ~{saved / 1024:.1f} KB saved")
+    return selected
+
+
+def convert_asset(file: Path, target_type: str, config: dict, auto_target: str = None, truncate_palette=False):
+    """
+    Convert one asset file to target format.
+
+    :param auto_target: format selected by analyser, replaces auto_rgba rule
+    :param truncate_palette: write only used palette entries
+    :return: file content and saved format, or None and "RAW"
+             if file should be copied as is
+    """
+    image, file_type = image_io.load_auto(file, config["encode_mode"])
+    if file_type == target_type or file_type == "N/A":
+        return None, "RAW"
+    return encode_asset_image(image, target_type, config, auto_target, truncate_palette)
+
+
+def encode_asset_image(image: Image.Image, target_type: str, config: dict, auto_target: str = None,
+                       truncate_palette=False):
+    """
+    Encode image with asset rules: auto_rgba and quantization
+    of palette formats.
+
+    :return: file content and saved format
+    """
+    if auto_target is not None:
+        target_type = auto_target
+    elif config["auto_rgba"]:
+        count_colors = len(Counter(image.getdata()).values())
+        if count_colors > 256:
+            target_type = "TGA-32"
+
+    if target_type in ["TGA-P", "TGA-RLP"] and not image.getcolors():
+        image = utils.image_color_compress(image, None, log,
+                                           config["quantize_method"],
+                                           config["quantize_dither"],
+                                           config["with_cache"])
+
+    return image_io.encode_auto(image, target_type, config["encode_mode"], truncate_palette), target_type
+
+
+def palette_options(config: dict, rel_name: str):
+    """
+    :param rel_name: asset path, relative to assets folder
+    :return: palette options of asset folder, from first matching
+             "palette_folders" pattern
+    """
+    folder = posixpath.dirname(rel_name)
+    for pattern, options in config["palette_folders"].items():
+        if fnmatch.fnmatch(folder, pattern):
+            return {"shared": options.get("shared", False), "truncate": options.get("truncate", False)}
+    return {"shared": False, "truncate": False}
+
+
+def _count_palette_saving(context: ZMakeContext, data: bytes):
+    """
+    Add bytes saved by truncated palette of TGA-P/RLP file to statistics.
+    """
+    if data[2] not in (1, 9):
+        return
+    saved = (256 - int.from_bytes(data[5:7], "little")) * 4
+    context.statistics["palette_bytes_saved"] = context.statistics.get("palette_bytes_saved", 0) + saved
+
+
+def _write_palette_group(context: ZMakeContext, entries: list, results: list, statistics: dict, done: set):
+    for entry, data in zip(entries, results):
+        entry.output.parent.mkdir(parents=True, exist_ok=True)
+        with open(entry.output, "wb") as f:
+            f.write(data)
+        _count_palette_saving(context, data)
+        utils.increment_or_add(statistics, entry.target_type)
+        done.add(entry.rel_name)
+
+
+def _encode_shared_palettes(context: ZMakeContext, index: AssetIndex, formats: dict, skip: set,
+                            statistics: dict):
+    """
+    Encode palette images of folders with "shared" option using one
+    union palette per folder and format.
+
+    :return: relative names of encoded files
+    """
+    groups = {}
+    for entry in index.files():
+        if entry.rel_name in formats or entry.rel_name in skip or entry.target_type not in ["TGA-P", "TGA-RLP"]:
+            continue
+        if entry.source.suffix.lower() != ".png" or not palette_options(context.config, entry.rel_name)["shared"]:
+            continue
+        if image_io.get_format(entry.source) != "PNG":
+            continue
+        groups.setdefault((posixpath.dirname(entry.rel_name), entry.target_type), []).append(entry)
+
+    done = set()
+    for (folder, target_type), entries in groups.items():
+        context.check_cancelled()
+        if len(entries) < 2:
+            continue
+
+        images = []
+        for entry in entries:
+            with Image.open(entry.source) as image:
+                images.append(image.convert("RGBA"))
+
+        # Padding color may be added to palette
+        colors = animation.count_colors(images)
+        if colors is None or colors > 255:
+            context.logger.info(f"  Too many colors in {folder or '.'}/ for shared {target_type} palette, "
+                                f"encode separately")
+            continue
+
+        truncate = palette_options(context.config, entries[0].rel_name)["truncate"]
+        results = tga_save.encode_palette_sequence(images, context.config["encode_mode"],
+                                                   target_type == "TGA-RLP", truncate)
+        _write_palette_group(context, entries, results, statistics, done)
+        context.logger.info(f"  {len(entries)} {target_type} images in {folder or '.'}/ "
+                            f"encoded with shared palette ({colors} colors)")
+
+    return done
+
+
+def _encode_sequences(context: ZMakeContext, index: AssetIndex, formats: dict, statistics: dict):
+    """
+    Encode animation frames with shared palettes.
+
+    :return: relative names of encoded files
+    """
+    candidates = [e for e in index.files()
+                  if e.rel_name not in formats and e.target_type in ["TGA-P", "TGA-RLP"]
+                  and e.source.suffix.lower() == ".png" and image_io.get_format(e.source) == "PNG"]
+
+    done = set()
+    for frames in animation.find_sequences(candidates, context.config["anim_min_frames"],
+                                           context.config["anim_patterns"]):
+        context.check_cancelled()
+        name = f"{frames[0].rel_name}..{frames[-1].source.name}"
+        images = []
+        for entry in frames:
+            with Image.open(entry.source) as image:
+                images.append(image.convert("RGBA"))
+
+        too_many_colors = any(image.getcolors(256) is None for image in images)
+        if too_many_colors and context.config["auto_rgba"]:
+            # Will be saved as TGA-32
+            continue
+
+        result = animation.encode_sequence(images, frames[0].target_type, context.config["encode_mode"],
+                                           too_many_colors,
+                                           context.config["quantize_method"],
+                                           context.config["quantize_dither"],
+                                           context.config["with_cache"],
+                                           palette_options(context.config, frames[0].rel_name)["truncate"])
+        if result is None:
+            context.logger.info(f"  Frames {name} don't fit into one palette, encode separately")
+            continue
+
+        _write_palette_group(context, frames, result, statistics, done)
+
+        context.logger.info(f"  {len(frames)} frames {name} encoded with shared palette")
+        if context.config["anim_delta_report"]:
+            deltas = animation.frame_deltas(images)
+            context.logger.info("    Changed pixels per frame: " + ", ".join(f"{d * 100:.0f}%" for d in deltas))
+
+    return done
+
+
+@build_handler("Convert assets", stage="assets", inputs=["app.json"], outputs=["assets"])
 def handle_assets(context: ZMakeContext):
     source = context.path_assets
     dest = context.path / "build" / "assets"
-    dest.mkdir()
+    # May contain outputs of other stages in partial build
+    dest.mkdir(exist_ok=True)
 
     context.logger.info("Processing assets:")
 
-    statistics = {}
-    for file in source.rglob("**/*"):
-        rel_name = str(file)[len(str(source)) + 1:]
-        file = context.check_override(file)
+    index = AssetIndex.build(context.path, source, dest, context.config)
+    context.asset_index = index
+    changed, removed = index.changed()
+    if len(index.previous) > 0:
+        context.logger.info(f"  {len(changed)} assets changed, {len(removed)} removed since last build")
+
+    formats = {}
+    if context.config["auto_format"]:
+        formats = _select_formats(context, index)
 
-        if file.is_dir():
-            os.mkdir(dest / rel_name)
+    statistics = {}
+    encoded_frames = set()
+    if context.config["anim_shared_palette"]:
+        encoded_frames = _encode_sequences(context, index, formats, statistics)
+    if context.config["auto_rle"]:
+        formats.update(_select_palette_formats(context, index, formats, encoded_frames))
+    encoded_frames |= _encode_shared_palettes(context, index, formats, encoded_frames, statistics)
+
+    # (content hash, target format) -> first converted entry
+    converted = {}
+    duplicates = []
+    entries = list(index.entries.values())
+    context.progress.set_total(len(entries))
+    for entry in entries:
+        context.check_cancelled()
+        file = entry.source
+        output = entry.output
+
+        if entry.is_dir:
+            output.mkdir(exist_ok=True)
+            context.progress.advance()
+            continue
+        if entry.ignored:
+            context.logger.info(f"  Skip: {entry.rel_name}")
+            context.progress.advance()
             continue
 
         try:
-            image, file_type = image_io.load_auto(file, context.config["encode_mode"])
-            target_type = context.get_img_target_type(file)
-            if file_type == target_type or file_type == "N/A":
-                context.logger.info(f"Copy asset as is {file}")
-                shutil.copy(file, dest / rel_name)
-                utils.increment_or_add(statistics, "RAW")
+            truncate_palette = palette_options(context.config, entry.rel_name)["truncate"]
+            content_key = (hash_file(file), entry.target_type, formats.get(entry.rel_name, {}).get("best"),
+                           truncate_palette)
+            if entry.rel_name in encoded_frames:
+                converted.setdefault(content_key, entry)
+                context.progress.advance(1, output.stat().st_size)
+                continue
+            if content_key in converted:
+                entry.duplicate_of = converted[content_key].rel_name
+                shutil.copy(converted[content_key].output, output)
+                duplicates.append(entry)
+                context.progress.advance(1, output.stat().st_size)
                 continue
 
-            if context.config["auto_rgba"]:
-                count_colors = len(Counter(image.getdata()).values())
-                if count_colors > 256:
-                    target_type = "TGA-32"
-
-            if target_type in ["TGA-P", "TGA-RLP"] and not image.getcolors():
-                image = utils.image_color_compress(image, None, context.logger)
+            data, target_type = convert_asset(file, entry.target_type, context.config,
+                                              formats.get(entry.rel_name, {}).get("best"), truncate_palette)
+            if data is None:
+                context.logger.info(f"Copy asset as is {file}")
+                shutil.copy(file, output)
+            else:
+                with open(output, "wb") as f:
+                    f.write(data)
+                if truncate_palette:
+                    _count_palette_saving(context, data)
 
-            ret = image_io.save_auto(image, dest / rel_name, target_type, context.config["encode_mode"])
-            assert ret is True
             utils.increment_or_add(statistics, target_type)
+            converted[content_key] = entry
+            context.progress.advance(1, output.stat().st_size)
         except Exception as e:
             context.logger.exception(f"FAILED, file {file}")
-            raise e
+            raise AssetException(f"Can't convert {file}") from e
+
+    index.save()
 
     if context.config["with_zeus_compat"] and (context.path / "assets" / "raw").is_dir():
         context.logger.info("  Copy RAW files (zeus_compat)")
         shutil.copytree(context.path / "assets" / "raw", dest / "raw")
 
+    context.statistics.update(statistics)
     for key in statistics:
         context.logger.info(f"  {statistics[key]} saved in {key} format")
 
+    if context.statistics.get("palette_bytes_saved", 0) > 0:
+        context.logger.info(f"  Truncated palettes saved {context.statistics['palette_bytes_saved'] / 1024:.1f} KB")
 
-@build_handler("Common files")
+    if len(duplicates) > 0:
+        context.statistics["duplicates"] = len(duplicates)
+        context.logger.info(f"  {len(duplicates)} duplicates, converted once:")
+        for entry in duplicates:
+            context.logger.info(f"    {entry.rel_name} = {entry.duplicate_of}")
+
+
+@build_handler("Render glyph sets", stage="assets", enabled_by="glyph_sets", inputs=[], outputs=["assets"])
+def handle_glyph_sets(context: ZMakeContext):
+    if len(context.config["glyph_sets"]) == 0:
+        return
+
+    context.logger.info("Rendering glyph sets:")
+    dest = context.path / "build" / "assets"
+    specs = [glyphs.parse_set(spec, i, context.config["def_format"])
+             for i, spec in enumerate(context.config["glyph_sets"])]
+
+    def encode(image, target_type):
+        return encode_asset_image(image, target_type, context.config)
+
+    encode_key = (context.config["encode_mode"], context.config["auto_rgba"],
+                  context.config["quantize_method"], context.config["quantize_dither"])
+    results = glyphs.render_sets(context.path, specs, encode, encode_key,
+                                 context.config["with_cache"], context.cancel_token)
+
+    total = 0
+    for spec, (items, restored) in zip(specs, results):
+        for rel_name, data, _ in items:
+            output = dest / rel_name
+            output.parent.mkdir(parents=True, exist_ok=True)
+            with open(output, "wb") as f:
+                f.write(data)
+        total += len(items)
+        context.logger.info(f"  {len(items)} glyphs of {spec['font']} {spec['size']}px -> {spec['output']}, "
+                            f"{restored} restored from cache")
+    context.statistics["glyphs"] = total
+
+
+@build_handler("Common files", stage="common", inputs=[])
 def common_files(context: ZMakeContext):
     context.logger.info("Copying common files:")
     files = context.config["common_files"]
@@ -143,14 +525,14 @@ def common_files(context: ZMakeContext):
         p = context.path / fn
         if p.is_dir():
             context.logger.info(f"  Copy folder {fn}")
-            shutil.copytree(p, context.path / "build" / fn)
+            shutil.copytree(p, context.path / "build" / fn, dirs_exist_ok=True)
         elif p.is_file():
             context.logger.info(f"  Copy file {fn}")
             shutil.copy(p, context.path / "build" / fn)
     context.logger.info("  Done")
 
 
-@build_handler("Build app.js")
+@build_handler("Build app.js", stage="js", inputs=[], outputs=["app.js"])
 def handle_appjs(context: ZMakeContext):
     context.logger.info("Processing app.js:")
 
@@ -186,37 +568,148 @@ def handle_appjs(context: ZMakeContext):
     context.logger.info("Done")
 
 
-@build_handler("Build page from src/lib")
+def combine_src(project_path: Path, out, source_map: SourceMapBuilder = None):
+    """
+    Write lib/src files (and entrypoint.js), wrapped into page template, to text stream.
+    Source map paths are relative to dist dir.
+    """
+    files = []
+    for directory in [project_path / 'lib', project_path / 'src']:
+        if directory.is_dir():
+            files.extend(sorted(directory.rglob("**/*.js")))
+
+    entrypoint = project_path / 'entrypoint.js'
+    if entrypoint.is_file():
+        files.append(entrypoint)
+
+    prefix, suffix = utils.get_app_asset("basement.js").split("{content}", 1)
+    out.write(prefix)
+    line = prefix.count("\n")
+
+    for file in files:
+        out.write(f"// source: {file}\n")
+        line += 1
+
+        source_index = None
+        if source_map is not None:
+            rel_path = os.path.relpath(file, project_path / "dist")
+            source_index = source_map.add_source(rel_path.replace("\\", "/"))
+
+        with file.open("r", encoding="utf8") as f:
+            for source_line, data in enumerate(f):
+                out.write(data)
+                if source_map is not None:
+                    source_map.add_line(line, source_index, source_line)
+                if data.endswith("\n"):
+                    line += 1
+        out.write("\n")
+        line += 1
+
+    out.write(suffix)
+
+
+@build_handler("Build page from src/lib", stage="js", inputs=[], outputs=["{target_dir}"])
 def handle_src(context: ZMakeContext):
+    # Partial build keeps dist/, map of previous build may be outdated
+    map_path = context.path / "dist" / "index.js.map"
+    if map_path.is_file():
+        map_path.unlink()
+
     if not (context.path / "src").is_dir() or (context.path / context.target_dir / "index.js").is_file():
         return
 
     context.logger.info("Combine src/lib files to index.js:")
-    out = ""
-    for directory in [context.path / 'lib', context.path / 'src']:
-        if not directory.is_dir():
+    source_map = None
+    if context.config["with_source_map"]:
+        source_map = SourceMapBuilder("index.js")
+
+    fn = context.path / "build" / context.target_dir / "index.js"
+    with open(fn, "w", encoding="utf8") as out:
+        combine_src(context.path, out, source_map)
+
+    if source_map is not None:
+        source_map.save(map_path)
+        context.logger.info("  Source map saved to dist/index.js.map")
+
+    context.logger.info(f"  Done")
+
+
+def _esbuild_cache_key(context: ZMakeContext, file: Path, outbase: str):
+    version = get_tool_version("esbuild")
+    if not context.config["with_cache"] or version is None:
+        return None
+
+    with open(file, "rb") as f:
+        data = f.read()
+
+    return make_key("esbuild", version,
+                    context.config["esbuild_params"],
+                    context.config["with_zeus_compat"],
+                    os.path.relpath(file, outbase),
+                    data)
+
+
+def _restore_esbuild_output(key: str, out_dir: Path):
+    """
+    Restore esbuild output from cache, if all input files
+    that was bundled into them are unchanged.
+    """
+    data = js_cache.get(key)
+    if data is None:
+        return False
+
+    entry = json.loads(data)
+    for path, file_hash in entry["inputs"].items():
+        if not os.path.isfile(path) or hash_file(Path(path)) != file_hash:
+            return False
+
+    dest = out_dir / entry["output"]
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    with open(dest, "w", encoding="utf8") as f:
+        f.write(entry["data"])
+    return True
+
+
+def _store_esbuild_outputs(metafile: Path, pending: dict, out_dir: Path):
+    with open(metafile, "r", encoding="utf8") as f:
+        meta = json.load(f)
+
+    for output, info in meta["outputs"].items():
+        if "entryPoint" not in info:
+            continue
+        key = pending.get(os.path.normcase(os.path.abspath(info["entryPoint"])))
+        if key is None:
             continue
 
-        for file in sorted(directory.rglob("**/*.js")):
-            out += f"// source: {file}\n"
-            with file.open("r", encoding="utf8") as f:
-                out += f.read() + "\n"
+        inputs = {}
+        for path in info["inputs"]:
+            path = os.path.abspath(path)
+            if os.path.isfile(path):
+                inputs[path] = hash_file(Path(path))
 
-    entrypoint = context.path / 'entrypoint.js'
-    if entrypoint.is_file():
-        out += f"// source: {entrypoint}\n"
-        with entrypoint.open("r", encoding="utf8") as f:
-            out += f.read() + "\n"
+        with open(output, "r", encoding="utf8") as f:
+            js_cache.put(key, json.dumps({
+                "output": os.path.relpath(os.path.abspath(output), out_dir),
+                "inputs": inputs,
+                "data": f.read(),
+            }).encode("utf8"))
 
-    out = utils.get_app_asset("basement.js").replace("{content}", out)
-    fn = context.path / "build" / context.target_dir / "index.js"
-    with open(fn, "w", encoding="utf8") as f:
-        f.write(out)
 
-    context.logger.info(f"  Done")
+def _uglifyjs_cache_key(context: ZMakeContext, file: Path):
+    version = get_tool_version("uglifyjs")
+    if not context.config["with_cache"] or version is None:
+        return None
 
+    with open(file, "rb") as f:
+        data = f.read()
 
-@build_handler("Process JS files")
+    return make_key("uglifyjs", version,
+                    context.config["uglifyjs_params"],
+                    context.config["with_zeus_compat"],
+                    data)
+
+
+@build_handler("Process JS files", stage="js", inputs=[], outputs=["{target_dir}"])
 def handle_app(context: ZMakeContext):
     if not (context.path / context.target_dir).is_dir():
         return
@@ -236,16 +729,37 @@ def handle_app(context: ZMakeContext):
             context.logger.info("Add zeus_fixes_inject")
             command.append(f"--inject:{utils.APP_PATH / 'data' / 'zeus_fixes_inject.js'}")
 
+        entries = [context.check_override(file) for file in src_dir.rglob("**/*.js")]
+        if len(entries) == 0:
+            return
+
+        # Set explicitly, so output paths won't depend on which entries are rebuilt
+        outbase = os.path.commonpath([file.parent for file in entries])
         command.extend(["--platform=node",
                         "--log-level=warning",
                         f"--outdir={out_dir}",
+                        f"--outbase={outbase}",
                         "--format=iife"])
 
-        for file in src_dir.rglob("**/*.js"):
-            command.append(context.check_override(file))
-
-        run_ext_tool(command, context, "ESBuild")
-        context.logger.info("  ESBuild finished successfully")
+        pending = {}
+        for file in entries:
+            key = _esbuild_cache_key(context, file, outbase)
+            if key is None or not _restore_esbuild_output(key, out_dir):
+                pending[os.path.normcase(os.path.abspath(file))] = key
+
+        if len(pending) == 0:
+            context.logger.info(f"  All {len(entries)} files restored from cache")
+            return
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            metafile = Path(tmp_dir) / "meta.json"
+            command.append(f"--metafile={metafile}")
+            command.extend(pending.keys())
+            run_ext_tool(command, context, "ESBuild")
+            _store_esbuild_outputs(metafile, pending, out_dir)
+
+        context.logger.info(f"  ESBuild finished successfully, "
+                            f"{len(entries) - len(pending)} files restored from cache")
     else:
         i = 0
         for file in src_dir.rglob("**/*.js"):
@@ -258,65 +772,249 @@ def handle_app(context: ZMakeContext):
         context.logger.info(f"  Copied {i} files")
 
 
-@build_handler("Post-processing JS files")
+def _read_text_files(path: Path):
+    """
+    :return: dict file -> content of all UTF-8 text files in folder
+    """
+    result = {}
+    for file in sorted(path.rglob("**/*")):
+        if not file.is_file():
+            continue
+        data = file.read_bytes()
+        if b"\0" in data:
+            continue
+        try:
+            result[file] = data.decode("utf8")
+        except UnicodeDecodeError:
+            continue
+    return result
+
+
+@build_handler("Deduplicate assets", stage="dedup", requires=["assets", "js"], enabled_by="dedup_assets",
+               inputs=["*"], outputs=["assets", "app.json", "app.js", "{target_dir}"])
+def dedup_assets(context: ZMakeContext):
+    if not context.config["dedup_assets"] or context.asset_index is None:
+        return
+
+    duplicates = [e for e in context.asset_index.entries.values() if e.duplicate_of is not None]
+    if len(duplicates) == 0:
+        return
+
+    context.logger.info("Deduplicating assets:")
+    # JS, app.json and any other text files may refer to assets
+    text_files = _read_text_files(context.path / "build")
+    changed_files = set()
+
+    removed = 0
+    saved = 0
+    for entry in duplicates:
+        # Only quoted paths can be safely replaced, so files that are also
+        # mentioned other way may be referenced dynamically and have to stay
+        pattern = re.compile(r"([\"'`])" + re.escape(entry.rel_name) + r"\1")
+        mention = re.compile(r"(?<![\w.-])" + re.escape(entry.rel_name) + r"(?![\w.-])")
+        mentions = {file: len(mention.findall(content)) for file, content in text_files.items()}
+        mentions = {file: count for file, count in mentions.items() if count > 0}
+        quoted = {file: pattern.subn(lambda m: m.group(1) + entry.duplicate_of + m.group(1), text_files[file])
+                  for file in mentions}
+        if len(mentions) == 0:
+            context.logger.info(f"  Keep {entry.rel_name}, no references found")
+            continue
+        if any(quoted[file][1] != count for file, count in mentions.items()):
+            context.logger.info(f"  Keep {entry.rel_name}, not all references can be replaced")
+            continue
+
+        for file, (content, _) in quoted.items():
+            text_files[file] = content
+            changed_files.add(file)
+
+        saved += entry.output.stat().st_size
+        entry.output.unlink()
+        removed += 1
+
+    for file in changed_files:
+        with open(file, "w", encoding="utf8") as f:
+            f.write(text_files[file])
+
+    context.statistics["duplicates_removed"] = removed
+    context.logger.info(f"  Removed {removed} duplicates ({saved / 1024:.1f} KB), "
+                        f"updated {len(changed_files)} files")
+
+
+def _tree_hash(path: Path, skip: list):
+    parts = []
+    for file in sorted(path.rglob("**/*")):
+        if file.is_file() and file.relative_to(path).as_posix() not in skip:
+            parts.extend([file.relative_to(path).as_posix(), hash_file(file)])
+    return make_key(*parts)
+
+
+def _preview_size(context: ZMakeContext):
+    """
+    :return: preview thumbnail size of first target device
+    """
+    devices = utils.load_devices()
+    for platform in context.app_json.get("platforms", []):
+        device = devices.get(platform.get("deviceSource"))
+        if device is not None and "watchfacePreviewWidth" in device:
+            return device["watchfacePreviewWidth"], device["watchfacePreviewHeight"]
+    return 128, 326
+
+
+def _render_preview(context: ZMakeContext, build_copy: Path):
+    with_gif = context.config["zepp_preview_gif"]
+    outputs = ["preview.png", "preview.gif"] if with_gif else ["preview.png"]
+    dist = context.path / "dist"
+
+    try:
+        version = get_tool_version("zepp-preview")
+        key = None
+        if context.config["with_cache"] and version is not None:
+            # app.json contains build time, so use it without packageInfo
+            app_json = {k: v for k, v in context.app_json.items() if k != "packageInfo"}
+            key = make_key("zepp-preview", version, with_gif, json.dumps(app_json, sort_keys=True),
+                           _tree_hash(build_copy, ["app.json"]))
+            cached = [preview_cache.get(make_key(key, name)) for name in outputs]
+            if None not in cached:
+                for name, data in zip(outputs, cached):
+                    with open(dist / name, "wb") as f:
+                        f.write(data)
+                context.logger.info("  Preview restored from cache")
+                return
+
+        command = ["zepp-preview", "-o", dist]
+        if with_gif:
+            command.append("--gif")
+        command.append(build_copy)
+        run_ext_tool(command, context, "ZeppPreview")
+
+        if key is not None:
+            for name in outputs:
+                with open(dist / name, "rb") as f:
+                    preview_cache.put(make_key(key, name), f.read())
+    finally:
+        shutil.rmtree(build_copy.parent, ignore_errors=True)
+
+
+@build_handler("Start preview", stage="preview", inputs=["*"])
+def start_preview(context: ZMakeContext):
+    """
+    Render preview in background, while JS files are post-processed.
+    Snapshot of build dir is used, so it won't change during rendering.
+    """
+    if not context.config["with_zepp_preview"]:
+        return
+
+    build_copy = Path(tempfile.mkdtemp()) / "build"
+    shutil.copytree(context.path / "build", build_copy)
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    context.preview_job = executor.submit(_render_preview, context, build_copy)
+    executor.shutdown(wait=False)
+
+
+@build_handler("Post-processing JS files", stage="js", inputs=[], outputs=["{target_dir}"])
 def handle_post_processing(context: ZMakeContext):
     i = 0
+    cached = 0
     js_dir = context.path / "build" / context.target_dir
-    for file in js_dir.rglob("**/*.js"):
+    comment = utils.get_app_asset("comment.js") + "\n"
+    files = list(js_dir.rglob("**/*.js"))
+    context.progress.set_total(len(files))
+    for file in files:
+        context.check_cancelled()
+        source_map = None
+        if context.config["with_source_map"] and file == js_dir / "index.js" \
+                and (context.path / "dist" / "index.js.map").is_file():
+            source_map = context.path / "dist" / "index.js.map"
+
         if context.config["with_uglifyjs"]:
-            command = ["uglifyjs"]
-            params = context.config['uglifyjs_params']
-            if params != "":
-                command.extend(params.split(" "))
-            command.extend(["-o", str(file), str(file)])
-            run_ext_tool(command, context, "UglifyJS")
+            key = None
+            if source_map is None:
+                key = _uglifyjs_cache_key(context, file)
+            data = js_cache.get(key) if key is not None else None
+
+            if data is not None:
+                with open(file, "wb") as f:
+                    f.write(data)
+                cached += 1
+            else:
+                command = ["uglifyjs"]
+                params = context.config['uglifyjs_params']
+                if params != "":
+                    command.extend(params.split(" "))
+                if source_map is not None:
+                    command.extend(["--source-map", f"content='{source_map}'"])
+                command.extend(["-o", str(file), str(file)])
+                run_ext_tool(command, context, "UglifyJS")
+
+                if key is not None:
+                    with open(file, "rb") as f:
+                        js_cache.put(key, f.read())
+
+            # Uglify writes updated map near output file
+            if source_map is not None and file.with_name(file.name + ".map").is_file():
+                shutil.move(file.with_name(file.name + ".map"), source_map)
 
         # Inject comment
         with open(file, "r", encoding="utf8") as f:
-            content = utils.get_app_asset("comment.js") + "\n" + f.read()
+            content = comment + f.read()
         with open(file, "w", encoding="utf8") as f:
             f.write(content)
+        if source_map is not None:
+            shift_source_map(source_map, comment.count("\n"))
         i += 1
+        context.progress.advance(1, file.stat().st_size)
 
-    context.logger.info(f"  Post-processed {i} files")
+    context.logger.info(f"  Post-processed {i} files, {cached} restored from cache")
 
 
-@build_handler("Preview")
+@build_handler("Preview", stage="preview", inputs=["*"])
 def zepp_preview(context: ZMakeContext):
-    if not context.config["with_zepp_preview"]:
+    job = context.preview_job
+    if job is None:
         return
-
-    command = ["zepp-preview",
-               "-o", context.path / "dist",
-               "--gif",
-               context.path / "build"]
+    context.preview_job = None
 
     context.logger.info("Creating 'preview.png':")
-
-    run_ext_tool(command, context, "ZeppPreview")
+    job.result()
     assert (context.path / "dist/preview.png").is_file()
-    assert (context.path / "dist/preview.gif").is_file()
 
     if context.config["add_preview_asset"] and (context.path / "build" / "watchface").is_dir():
-        context.logger.info("  Add preview.png (128x326) to assets")
-        pv = Image.open(context.path / "dist/preview.png")
-        pv.thumbnail((128, 326))
-        pv = pv.convert("RGB").quantize(256)
-        image_io.save_auto(pv, context.path / "build/assets/preview.png", "TGA-RLP", context.config["encode_mode"])
+        size = _preview_size(context)
+        context.logger.info(f"  Add preview.png ({size[0]}x{size[1]}) to assets")
+        with open(context.path / "dist/preview.png", "rb") as f:
+            source = f.read()
+
+        key = make_key("thumbnail", source, size, context.config["encode_mode"])
+        data = preview_cache.get(key) if context.config["with_cache"] else None
+        if data is None:
+            pv = Image.open(io.BytesIO(source))
+            pv.thumbnail(size)
+            pv = pv.convert("RGB").quantize(256)
+            data = image_io.encode_auto(pv, "TGA-RLP", context.config["encode_mode"])
+            if context.config["with_cache"]:
+                preview_cache.put(key, data)
+
+        with open(context.path / "build/assets/preview.png", "wb") as f:
+            f.write(data)
 
     context.logger.info("  Done")
 
 
-@build_handler("Package BIN and ZIP")
+@build_handler("Package BIN and ZIP", stage="package", inputs=["*"])
 def package(context: ZMakeContext):
     context.logger.info("Packaging:")
     basename = context.path.name
 
     device_extension = context.config["package_extension"]
     device_zip = context.path / "dist" / f"{basename}.{device_extension}"
+    files = list((context.path / "build").rglob("**/*"))
+    context.progress.set_total(len(files))
     with ZipFile(device_zip, "w", ZIP_DEFLATED) as arc:
-        for file in (context.path / "build").rglob("**/*"):
+        for file in files:
+            context.check_cancelled()
             fn = str(file)[len(str(context.path / "build")):]
+            context.progress.advance()
             if should_ignore_file(fn, context):
                 context.logger.info(f"Skip: {fn}")
                 continue
@@ -337,8 +1035,20 @@ def package(context: ZMakeContext):
 
     context.logger.info("  Created BIN/ZIP files")
 
+    package_size = device_zip.stat().st_size
+    context.statistics["package_size"] = package_size
+    context.logger.info(f"  Package size: {package_size / 1024:.1f} KB")
+    budgets = asset_analyzer.check_budget(package_size, context.app_json.get("platforms", []),
+                                          context.config["size_budget_kb"])
+    for device_id, budget, fits in budgets:
+        if fits:
+            context.logger.info(f"  Fits {device_id} budget ({budget / 1024:.0f} KB)")
+        else:
+            context.logger.warning(f"  Exceeds {device_id} budget ({budget / 1024:.0f} KB) "
+                                   f"by {(package_size - budget) / 1024:.1f} KB")
+
 
-@build_handler("Make ZEUS package")
+@build_handler("Make ZEUS package", stage="package", inputs=["*"])
 def make_zeus_pkg(context: ZMakeContext):
     if not context.config["with_zeus_compat"]:
         return
@@ -348,6 +1058,7 @@ def make_zeus_pkg(context: ZMakeContext):
     device_zip_file = io.BytesIO()
     with ZipFile(device_zip_file, "w", ZIP_DEFLATED) as archive:
         for file in (context.path / "build").rglob("**/*"):
+            context.check_cancelled()
             fn = str(file)[len(str(context.path / "build")):]
             if should_ignore_file(fn, context):
                 continue
@@ -366,29 +1077,105 @@ def make_zeus_pkg(context: ZMakeContext):
     context.logger.info("  Created ZPK file")
 
 
-@build_handler("ADB Install")
+@build_handler("Verify package", stage="verify", inputs=["*"])
+def verify_package(context: ZMakeContext):
+    """
+    Check TGA structure of all images in package, before it's deployed.
+    """
+    if not context.config["verify_package"]:
+        return
+
+    context.logger.info("Verifying package:")
+    package_file = context.path / "dist" / f"{context.path.name}.{context.config['package_extension']}"
+    checked, broken = tga_verify.verify_path(package_file, context.cancel_token)
+    for name, problems in broken.items():
+        context.logger.error(f"  {name}: {', '.join(problems)}")
+    if broken:
+        raise AssetException(f"{len(broken)} of {checked} TGA images in package are broken")
+    context.logger.info(f"  Checked {checked} TGA images")
+
+
+def _adb_deploy_files(context: ZMakeContext):
+    """
+    :return: remote dir and dict remote relative path -> local file,
+             same layout as unpacked dist zip
+    """
+    basename = context.path.name
+    dist = context.path / "dist"
+    if context.config["package_extension"] == "zip":
+        build = context.path / "build"
+        files = {}
+        for file in build.rglob("**/*"):
+            rel_name = file.relative_to(build).as_posix()
+            if file.is_file() and not should_ignore_file(f"/{rel_name}", context):
+                files[rel_name] = file
+        return context.config["adb_path"], files
+
+    files = {
+        f"{basename}.bin": dist / f"{basename}.{context.config['package_extension']}",
+        "infos.xml": dist / "infos.xml",
+    }
+    if (dist / "preview.png").is_file():
+        files[f"{basename}.png"] = dist / "preview.png"
+    return f"{context.config['adb_path']}/{basename}", files
+
+
+@build_handler("ADB Install", stage="adb", inputs=["*"])
 def adb_install(context: ZMakeContext):
+    """
+    Upload only files changed since previous upload. Hashes of uploaded
+    files are stored on device, near uploaded files.
+    """
     if not context.config["with_adb"]:
         return
 
     context.logger.info("Uploading to phone via ADB:")
-    path = context.config["adb_path"]
-
-    basename = context.path.name
-    dist_zip = context.path / "dist" / f"{basename}.zip"
+    start_time = time.time()
+    remote_dir, files = _adb_deploy_files(context)
+    manifest_name = f".{context.path.name}.zmake_manifest.json"
+    remote_dir_q = shlex.quote(remote_dir)
+    manifest_q = shlex.quote(f"{remote_dir}/{manifest_name}")
 
     try:
-        run_ext_tool(["adb", "shell", "mkdir", "-p", path], context, "ADB")
-        run_ext_tool(["adb", "push", dist_zip, path], context, "ADB")
-        run_ext_tool(["adb", "shell", f"cd {path} && unzip -o {basename}.zip"], context, "ADB")
-        run_ext_tool(['adb', "shell", "rm", f"{path}/{basename}.zip"], context, "ADB")
-    except AssertionError:
+        output = run_ext_tool(["adb", "shell", f"mkdir -p {remote_dir_q} && "
+                                              f"cat {manifest_q} 2>/dev/null; true"],
+                              context, "ADB", log_output=False)
+        try:
+            remote_manifest = json.loads(output)
+        except ValueError:
+            remote_manifest = {}
+
+        manifest = {rel_name: hash_file(file) for rel_name, file in files.items()}
+        changed = [rel_name for rel_name in files if remote_manifest.get(rel_name) != manifest[rel_name]]
+        stale = [rel_name for rel_name in remote_manifest if rel_name not in files]
+        if len(changed) == 0 and len(stale) == 0:
+            context.logger.info("  Already up to date")
+            return
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            delta_name = f".{context.path.name}.zmake_delta.zip"
+            delta = Path(tmp_dir) / delta_name
+            with ZipFile(delta, "w", ZIP_DEFLATED) as arc:
+                for rel_name in changed:
+                    arc.write(files[rel_name], rel_name)
+                arc.writestr(manifest_name, json.dumps(manifest))
+            delta_size = delta.stat().st_size
+
+            run_ext_tool(["adb", "push", delta, f"{remote_dir}/{delta_name}"], context, "ADB", log_output=False)
+            commands = [f"cd {remote_dir_q}",
+                        f"unzip -o -q {shlex.quote(delta_name)}",
+                        f"rm {shlex.quote(delta_name)}"]
+            if len(stale) > 0:
+                commands.append("rm -f " + " ".join(shlex.quote(rel_name) for rel_name in stale))
+            run_ext_tool(["adb", "shell", " && ".join(commands)], context, "ADB")
+
+        context.logger.info(f"  Uploaded {len(changed)} of {len(files)} files ({delta_size / 1024:.1f} KB), "
+                            f"removed {len(stale)}, took {time.time() - start_time:.1f}s")
+    except ToolFailedException:
         context.logger.info("  Failed, ignore")
 
-    context.logger.info("  ")
-
 
-@build_handler("Post-build command")
+@build_handler("Post-build command", stage="postbuild")
 def post_build(context: ZMakeContext):
     if context.config["post_build_script"] == "":
         return
@@ -0,0 +1,196 @@
+import io
+import logging
+
+from PIL import Image, features
+
+from zmake.cache import FileCache, make_key
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+log = logging.getLogger("Quantize")
+
+METHODS = ["auto", "libimagequant", "kmeans", "octree", "mediancut"]
+
+# Bump when quantization results will change, to drop old cache entries
+CACHE_VERSION = 1
+
+KMEANS_SAMPLE_SIZE = 256
+KMEANS_ITERATIONS = 10
+CHUNK_SIZE = 16384
+
+BAYER_8X8 = [
+    [0, 32, 8, 40, 2, 34, 10, 42],
+    [48, 16, 56, 24, 50, 18, 58, 26],
+    [12, 44, 4, 36, 14, 46, 6, 38],
+    [60, 28, 52, 20, 62, 30, 54, 22],
+    [3, 35, 11, 43, 1, 33, 9, 41],
+    [51, 19, 59, 27, 49, 17, 57, 25],
+    [15, 47, 7, 39, 13, 45, 5, 37],
+    [63, 31, 55, 23, 61, 29, 53, 21],
+]
+
+cache = FileCache("quantize")
+
+
+def resolve_method(method: str):
+    """
+    Select real method for "auto" and replace unavailable
+    methods with the best available one.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown quantize method {method}, use one of {METHODS}")
+
+    if method in ["auto", "libimagequant"] and features.check_feature("libimagequant"):
+        return "libimagequant"
+    if method in ["auto", "libimagequant", "kmeans"] and np is not None:
+        return "kmeans"
+    if method in ["auto", "libimagequant", "kmeans"]:
+        return "octree"
+    return method
+
+
+def has_alpha(image: Image.Image):
+    return image.mode == "RGBA" and image.getchannel("A").getextrema()[0] != 255
+
+
+def quantize(image: Image.Image, method="auto", dither=False, colors=256, use_cache=True):
+    """
+    Reduce image to given count of colors.
+
+    :param image: source image
+    :param method: one of METHODS
+    :param dither: apply ordered (Bayer 8x8) dither, requires numpy
+    :param colors: max count of colors in result
+    :param use_cache: use on-disk cache keyed by image content
+    :return: RGBA image
+    """
+    image = image.convert("RGBA")
+    method = resolve_method(method)
+    if dither and np is None:
+        log.debug("numpy not available, ordered dither disabled")
+        dither = False
+
+    key = None
+    if use_cache:
+        key = make_key(CACHE_VERSION, method, dither, colors, image.size, image.tobytes())
+        data = cache.get(key)
+        if data is not None:
+            with Image.open(io.BytesIO(data)) as cached:
+                return cached.convert("RGBA")
+
+    log.debug(f"Quantize {image.size} with method={method}, dither={dither}")
+    if method == "kmeans":
+        palette = _kmeans_palette(image, colors)
+        result = _map_to_palette(image, palette, dither)
+    else:
+        result = _pillow_quantize(image, method, colors)
+        if dither:
+            palette = np.array([color for _, color in result.getcolors(colors)], dtype=np.uint8)
+            result = _map_to_palette(image, palette, dither)
+
+    if key is not None:
+        buffer = io.BytesIO()
+        result.save(buffer, "PNG", compress_level=1)
+        cache.put(key, buffer.getvalue())
+
+    return result
+
+
+def _pillow_quantize(image: Image.Image, method: str, colors: int):
+    if method == "mediancut":
+        # Pillow median cut don't support alpha
+        if has_alpha(image):
+            method = "octree"
+        else:
+            return image.convert("RGB").quantize(colors, Image.Quantize.MEDIANCUT).convert("RGBA")
+
+    pil_method = {
+        "octree": Image.Quantize.FASTOCTREE,
+        "libimagequant": Image.Quantize.LIBIMAGEQUANT,
+    }[method]
+    return image.quantize(colors, pil_method).convert("RGBA")
+
+
+def _as_pixels(image: Image.Image):
+    return np.frombuffer(image.tobytes(), dtype=np.uint8).reshape(-1, 4)
+
+
+def _nearest(pixels, palette):
+    """
+    Index of nearest palette entry for each pixel, in chunks
+    to keep memory usage bounded.
+    """
+    palette = palette.astype(np.float32)
+    palette_norm = (palette ** 2).sum(axis=1)
+    result = np.empty(len(pixels), dtype=np.uint8)
+    for start in range(0, len(pixels), CHUNK_SIZE):
+        chunk = pixels[start:start + CHUNK_SIZE].astype(np.float32)
+        # |p - c|^2 without |p|^2, which is same for all entries
+        distance = palette_norm[None, :] - 2 * (chunk @ palette.T)
+        result[start:start + CHUNK_SIZE] = distance.argmin(axis=1)
+    return result
+
+
+def _kmeans_palette(image: Image.Image, colors: int):
+    """
+    Weighted k-means over unique colors of downsampled image,
+    initialized from fast octree palette.
+    """
+    sample = image
+    if max(image.size) > KMEANS_SAMPLE_SIZE:
+        sample = image.copy()
+        sample.thumbnail((KMEANS_SAMPLE_SIZE, KMEANS_SAMPLE_SIZE), Image.Resampling.BOX)
+
+    packed = _as_pixels(sample).view(np.uint32).ravel()
+    unique, counts = np.unique(packed, return_counts=True)
+    points = unique.view(np.uint8).reshape(-1, 4).astype(np.float64)
+    if len(points) <= colors:
+        return points.astype(np.uint8)
+
+    initial = sample.quantize(colors, Image.Quantize.FASTOCTREE).convert("RGBA").getcolors(colors)
+    centers = np.array([color for _, color in initial], dtype=np.float64)
+    weights = counts.astype(np.float64)
+
+    for _ in range(KMEANS_ITERATIONS):
+        labels = _nearest(points, centers)
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, points * weights[:, None])
+        totals = np.bincount(labels, weights=weights, minlength=len(centers))
+        used = totals > 0
+        new_centers = centers.copy()
+        new_centers[used] = sums[used] / totals[used, None]
+        if np.abs(new_centers - centers).max() < 0.5:
+            centers = new_centers
+            break
+        centers = new_centers
+
+    return np.clip(np.rint(centers), 0, 255).astype(np.uint8)
+
+
+def _map_to_palette(image: Image.Image, palette, dither: bool):
+    pixels = _as_pixels(image)
+
+    if dither:
+        # Shift RGB channels by threshold map scaled to mean palette step
+        spread = 255 / max(2.0, round(len(palette) ** (1 / 3)))
+        bayer = (np.array(BAYER_8X8, dtype=np.float64) + 0.5) / 64 - 0.5
+        rows = np.arange(image.height) % 8
+        cols = np.arange(image.width) % 8
+        offset = (bayer[rows[:, None], cols[None, :]] * spread).reshape(-1)
+
+        shifted = pixels.astype(np.float64)
+        shifted[:, :3] += offset[:, None]
+        shifted = np.clip(np.rint(shifted), 0, 255).astype(np.uint8)
+        indexes = _nearest(shifted, palette)
+    else:
+        # Map unique colors only, then expand back
+        packed = pixels.view(np.uint32).ravel()
+        unique, inverse = np.unique(packed, return_inverse=True)
+        lookup = _nearest(unique.view(np.uint8).reshape(-1, 4), palette)
+        indexes = lookup[inverse.ravel()]
+
+    out = palette[indexes].reshape(image.height, image.width, 4)
+    return Image.frombytes("RGBA", image.size, out.tobytes())
@@ -0,0 +1,256 @@
+import contextlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import socket
+import socketserver
+import threading
+from pathlib import Path
+
+from zmake import constants, cache
+from zmake.context import CancellationToken
+from zmake.third_tools_manager import find_tool, get_tool_version
+
+log = logging.getLogger("ZMakeServer")
+
+# Request action -> ZMakeContext.perform() action
+ACTIONS = {
+    "auto": "auto",
+    "build": "build",
+    "convert": "convert",
+    "unpack": "unpack",
+    "patch": "patch_zab",
+    "init": "init",
+}
+
+KNOWN_TOOLS = ["esbuild", "uglifyjs", "zepp-preview", "adb"]
+
+
+def _write_token(path: Path):
+    """
+    Create new random token, readable only by current user.
+    """
+    token = secrets.token_hex(32)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.exists():
+        path.unlink()
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(token)
+    return token
+
+
+def read_token(path: Path = constants.DAEMON_TOKEN_FILE):
+    """
+    :return: token of running daemon, or None if there's no token file
+    """
+    try:
+        return path.read_text().strip()
+    except OSError:
+        return None
+
+
+def parse_address(address: str):
+    """
+    :param address: "host:port" or "unix:/path/to/socket"
+    :return: socket family and address
+    """
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[5:]
+
+    host, port = address.rsplit(":", 1)
+    return socket.AF_INET, (host, int(port))
+
+
+class _EventLogHandler(logging.Handler):
+    def __init__(self, send):
+        super().__init__()
+        self.send = send
+        self.setFormatter(logging.Formatter("%(message)s"))
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.send({"event": "log", "level": record.levelname, "message": self.format(record)})
+
+
+class _EventStdout:
+    """
+    Forwards print() output of running task as log events.
+    """
+    def __init__(self, send):
+        self.send = send
+        self.buffer = ""
+
+    def write(self, data):
+        self.buffer += data
+        while "\n" in self.buffer:
+            line, self.buffer = self.buffer.split("\n", 1)
+            self.send({"event": "log", "level": "INFO", "message": line})
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def send(self, event: dict):
+        if self.disconnected:
+            return
+        try:
+            self.wfile.write(json.dumps(event).encode("utf8") + b"\n")
+            self.wfile.flush()
+        except OSError:
+            # Nobody waits for result anymore
+            self.disconnected = True
+            if self.cancel_token is not None:
+                self.cancel_token.cancel()
+
+    def handle(self):
+        # Prevent circular import, main uses this module
+        from zmake.main import run_task
+
+        self.disconnected = False
+        self.cancel_token = None
+        try:
+            request = json.loads(self.rfile.readline())
+        except ValueError:
+            request = None
+        if not isinstance(request, dict):
+            request = {}
+        action = request.get("action", "auto")
+
+        token = request.get("token")
+        if not isinstance(token, str) or not hmac.compare_digest(token, self.server.token):
+            self.send({"event": "result", "status": "failed", "exit_code": constants.EXIT_USAGE,
+                       "error": "Bad or missing token"})
+            return
+
+        if action == "ping":
+            self.send({"event": "result", "status": "ok", "exit_code": constants.EXIT_OK,
+                       "version": constants.VERSION})
+            return
+        elif action == "cancel":
+            token = self.server.current_token
+            if token is not None:
+                token.cancel()
+            self.send({"event": "result", "status": "ok", "exit_code": constants.EXIT_OK,
+                       "cancelled": token is not None})
+            return
+        elif action == "shutdown":
+            self.send({"event": "result", "status": "ok", "exit_code": constants.EXIT_OK})
+            threading.Thread(target=self.server.shutdown).start()
+            return
+        elif action not in ACTIONS or not isinstance(request.get("path"), str):
+            self.send({"event": "result", "status": "failed", "exit_code": constants.EXIT_USAGE,
+                       "error": "Bad request"})
+            return
+
+        # Tasks use global state (logging, stdout), so run them one by one
+        with self.server.task_lock:
+            self.cancel_token = CancellationToken()
+            self.server.current_token = self.cancel_token
+
+            handler = _EventLogHandler(self.send)
+            root_logger = logging.getLogger()
+            root_logger.addHandler(handler)
+            try:
+                with contextlib.redirect_stdout(_EventStdout(self.send)):
+                    summary = run_task(Path(request["path"]).resolve(), ACTIONS[action],
+                                       request.get("type"), request.get("direction"),
+                                       lambda e: self.send({"event": "progress", **e}),
+                                       self.cancel_token,
+                                       request.get("only"), request.get("skip"))
+            finally:
+                root_logger.removeHandler(handler)
+                self.server.current_token = None
+
+        self.send({"event": "result", **summary})
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+if hasattr(socketserver, "ThreadingUnixStreamServer"):
+    class _UnixServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+
+def serve(address=constants.DAEMON_ADDRESS, memory_cache_mb=256, token_file=constants.DAEMON_TOKEN_FILE):
+    """
+    Run build daemon until "shutdown" request. Everything that can be
+    reused between tasks (imports, device DB, tool locations, caches)
+    stays loaded in memory. Requests without token from token_file
+    are rejected, Unix socket is accessible only by current user.
+    """
+    family, bind_address = parse_address(address)
+
+    cache.enable_memory_cache(memory_cache_mb)
+    for tool in KNOWN_TOOLS:
+        find_tool(tool)
+    for tool in ["esbuild", "uglifyjs"]:
+        get_tool_version(tool)
+
+    if family == socket.AF_UNIX:
+        if os.path.exists(bind_address):
+            os.unlink(bind_address)
+        os.makedirs(os.path.dirname(bind_address) or ".", exist_ok=True)
+        old_umask = os.umask(0o177)
+        try:
+            server = _UnixServer(bind_address, _RequestHandler)
+        finally:
+            os.umask(old_umask)
+        os.chmod(bind_address, 0o600)
+    else:
+        server = _TCPServer(bind_address, _RequestHandler)
+    server.token = _write_token(Path(token_file))
+    server.task_lock = threading.Lock()
+    server.current_token = None
+
+    log.info(f"zmake {constants.VERSION} daemon listening on {address}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if family == socket.AF_UNIX and os.path.exists(bind_address):
+            os.unlink(bind_address)
+        if read_token(Path(token_file)) == server.token:
+            os.unlink(token_file)
+
+
+def send_request(request: dict, on_event=None, address=constants.DAEMON_ADDRESS, timeout=None,
+                 token_file=constants.DAEMON_TOKEN_FILE):
+    """
+    Send request to running daemon and wait for result.
+
+    :param request: dict with "action", "path" and optional "type", "direction"
+    :param on_event: function, called for each log/progress event
+    :param token_file: file with daemon token, added to request
+    :return: result event (task summary)
+    """
+    request = {"token": read_token(Path(token_file)), **request}
+    family, connect_address = parse_address(address)
+    with socket.socket(family, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(connect_address)
+        sock.sendall(json.dumps(request).encode("utf8") + b"\n")
+
+        with sock.makefile("rb") as f:
+            for line in f:
+                event = json.loads(line)
+                if event["event"] == "result":
+                    return event
+                if on_event is not None:
+                    on_event(event)
+
+    raise ConnectionError("Daemon closed connection without result")
+
+
+def is_running(address=constants.DAEMON_ADDRESS, token_file=constants.DAEMON_TOKEN_FILE):
+    try:
+        return send_request({"action": "ping"}, address=address, timeout=1,
+                            token_file=token_file)["status"] == "ok"
+    except (OSError, ValueError):
+        return False
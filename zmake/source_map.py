@@ -0,0 +1,67 @@
+import json
+from pathlib import Path
+
+BASE64_CHARS = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+
+
+def _encode_vlq(value: int):
+    value = (-value << 1) | 1 if value < 0 else value << 1
+    out = ""
+    while True:
+        digit = value & 31
+        value >>= 5
+        if value > 0:
+            digit |= 32
+        out += BASE64_CHARS[digit]
+        if value == 0:
+            return out
+
+
+class SourceMapBuilder:
+    """
+    Line-level source map (v3) for concatenated files: each generated
+    line is mapped to the start of one source line.
+    """
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        self.sources = []
+        self.lines = []
+        self._last_source = 0
+        self._last_line = 0
+
+    def add_source(self, source: str):
+        self.sources.append(source)
+        return len(self.sources) - 1
+
+    def add_line(self, generated_line: int, source_index: int, source_line: int):
+        while len(self.lines) < generated_line:
+            self.lines.append("")
+
+        segment = "A" + _encode_vlq(source_index - self._last_source) + \
+                  _encode_vlq(source_line - self._last_line) + "A"
+        self._last_source = source_index
+        self._last_line = source_line
+        self.lines.append(segment)
+
+    def save(self, path: Path):
+        with open(path, "w", encoding="utf8") as f:
+            json.dump({
+                "version": 3,
+                "file": self.file_name,
+                "sources": self.sources,
+                "names": [],
+                "mappings": ";".join(self.lines),
+            }, f)
+
+
+def shift_source_map(path: Path, count_lines: int):
+    """
+    Update map after count_lines lines were prepended to generated file.
+    """
+    with open(path, "r", encoding="utf8") as f:
+        data = json.load(f)
+
+    data["mappings"] = ";" * count_lines + data["mappings"]
+
+    with open(path, "w", encoding="utf8") as f:
+        json.dump(data, f)
@@ -1,20 +1,24 @@
 from PIL import Image
 import logging
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 log = logging.getLogger("TgaLoad")
 
 
-def _apply_zepp_header(image: Image.Image, id_data: bytes):
+def _get_zepp_width(id_data: bytes, width: int):
     if len(id_data) < 46 or id_data[0:4] != b"SOMH":
-        return
+        return width
 
     # Use width from ZeppOS ID string
     # GTR/GTS/AB compatibility
     zepp_width = int.from_bytes(id_data[4:6], "little")
-    if zepp_width != image.width:
+    if zepp_width != width:
         log.debug(f"use width from tga header, zepp_width={zepp_width}")
-        image = image.crop((0, 0, zepp_width, image.height))
-    return image
+    return min(zepp_width, width)
 
 
 def _parse_tga_header(header):
@@ -38,6 +42,169 @@ def _fetch_palette(f, palette_length, encode_mode):
     return palette_raw
 
 
+class TgaRowReader:
+    """
+    Streaming TGA decoder: reads pixel data row by row, so only one row
+    (and the rest of one RLE packet) is kept in memory.
+
+    Usage::
+
+        reader = TgaRowReader(f, encode_mode)
+        for row in reader.rows():
+            ...  # RGBA bytes, reader.width pixels
+    """
+
+    def __init__(self, f, encode_mode="dialog"):
+        """
+        Reads header, ID and palette.
+
+        :param f: opened file, positioned at TGA start
+        """
+        header = f.read(18)
+        if len(header) < 18:
+            raise ValueError("Truncated TGA header")
+
+        self.f = f
+        self.encode_mode = encode_mode
+        self.palette = None
+        id_data = f.read(header[0])
+
+        if header[1] == 1 and header[2] in (1, 9):
+            if header[7] != 32:
+                raise ValueError(f"Unsupported palette entry size {header[7]}")
+            palette_length, self.tga_width, self.height = _parse_tga_header(header)
+            self.palette = _fetch_palette(f, palette_length, encode_mode)
+            # Indexes out of palette are opaque black, same as in PIL
+            self.palette.extend(b"\x00\x00\x00\xff" * (256 - palette_length))
+            self.format = "TGA-P" if header[2] == 1 else "TGA-RLP"
+            self.bpp = 1
+        elif header[1] == 0 and header[2] == 2:
+            colormode = header[16]
+            if colormode not in (16, 32):
+                raise Exception("Not implemented")
+            self.tga_width = int.from_bytes(header[12:14], "little")
+            self.height = int.from_bytes(header[14:16], "little")
+            self.format = f"TGA-{colormode}"
+            self.bpp = colormode // 8
+        else:
+            raise ValueError("Unknown TGA type")
+
+        self.width = _get_zepp_width(id_data, self.tga_width)
+
+    @property
+    def size(self):
+        return self.width, self.height
+
+    def _raw_rows(self):
+        """
+        :return: rows of raw pixel data, padded to TGA width
+        """
+        pitch = self.tga_width * self.bpp
+        if self.format != "TGA-RLP":
+            for _ in range(self.height):
+                row = self.f.read(pitch)
+                if len(row) < pitch:
+                    raise ValueError("Truncated TGA data")
+                yield row
+            return
+
+        # RLE packets may cross row boundaries, keep rest for next row
+        pending = bytearray()
+        for _ in range(self.height):
+            while len(pending) < pitch:
+                head = self.f.read(1)
+                if not head:
+                    raise ValueError("Truncated TGA data")
+                count = (head[0] & 127) + 1
+                if head[0] & 128:
+                    pending.extend(self.f.read(1) * count)
+                else:
+                    pending.extend(self.f.read(count))
+            yield bytes(pending[:pitch])
+            del pending[:pitch]
+
+    def _to_rgba(self, row: bytes):
+        row = row[:self.width * self.bpp]
+        if self.palette is not None:
+            if np is not None:
+                lut = np.frombuffer(self.palette, dtype=np.uint8).reshape(-1, 4)
+                return lut[np.frombuffer(row, dtype=np.uint8)].tobytes()
+            palette = self.palette
+            return b"".join(palette[i * 4:i * 4 + 4] for i in row)
+
+        # Truecolor pixels are stored in same order in both modes,
+        # only palette entries differ
+        if self.bpp == 4:
+            out = bytearray(row)
+            out[0::4] = row[2::4]
+            out[2::4] = row[0::4]
+            return bytes(out)
+
+        return _unpack_rgb565(row)
+
+    def rows(self):
+        """
+        :return: generator of RGBA rows (bytes), from top to bottom
+        """
+        for row in self._raw_rows():
+            yield self._to_rgba(row)
+
+    def tiles(self, tile_height=64):
+        """
+        :return: generator of (y, RGBA image) with up to tile_height rows each
+        """
+        buffer = bytearray()
+        y = 0
+        for row in self.rows():
+            buffer.extend(row)
+            if len(buffer) == self.width * 4 * tile_height:
+                yield y, Image.frombytes("RGBA", (self.width, tile_height), bytes(buffer))
+                y += tile_height
+                buffer.clear()
+        if buffer:
+            yield y, Image.frombytes("RGBA", (self.width, self.height - y), bytes(buffer))
+
+    def read_image(self):
+        """
+        Decode whole image.
+
+        :return: RGBA PIL image
+        """
+        data = bytearray(self.width * self.height * 4)
+        row_size = self.width * 4
+        for y, row in enumerate(self.rows()):
+            data[y * row_size:(y + 1) * row_size] = row
+
+        if len(self.f.peek()) > 0:
+            log.debug("WARNING: NOT ALL DATA PARSED, looks like it's a bug")
+            log.debug(f"peek_size={len(self.f.peek())}")
+        return Image.frombytes("RGBA", self.size, bytes(data))
+
+
+def _unpack_rgb565(data: bytes):
+    if np is not None:
+        v = np.frombuffer(data, dtype="<u2")
+        r = (v >> 11) & 31
+        g = (v >> 5) & 63
+        b = v & 31
+
+        out = np.full((len(v), 4), 255, dtype=np.uint8)
+        out[:, 0] = (r * 255 / 31).astype(np.uint8)
+        out[:, 1] = (g * 255 / 63).astype(np.uint8)
+        out[:, 2] = (b * 255 / 31).astype(np.uint8)
+        return out.tobytes()
+
+    out = bytearray()
+    for i in range(0, len(data), 2):
+        v = data[i] + (data[i + 1] << 8)
+        r = (v & 0b1111100000000000) >> 11
+        g = (v & 0b0000011111100000) >> 5
+        b = v & 0b0000000000011111
+
+        out.extend((int(r * 255/31), int(g * 255/63), int(b * 255/31), 255))
+    return bytes(out)
+
+
 def load_palette_tga(f, encode_mode="dialog"):
     """
     Read Tga with DATA TYPE 1
@@ -45,31 +212,9 @@ def load_palette_tga(f, encode_mode="dialog"):
     :param f: opened file
     :return: PIL image
     """
-    header = f.read(18)
-
-    assert header[1] == 1
-    assert header[2] == 1
-    assert header[7] == 32
-
-    # Skip ID
-    id_length = header[0]
-    id_data = f.read(id_length)
-    palette_length, width, height = _parse_tga_header(header)
-
-    # Read RAW img data
-    palette_raw = _fetch_palette(f, palette_length, encode_mode)
-    img_data = f.read(width*height)
-    if len(f.peek()) > 0:
-        log.debug("WARNING: NOT ALL DATA PARSED, looks like it's a bug")
-        log.debug(f"peek_size={len(f.peek())}")
-
-    image = Image.new("P", (width, height))
-    image.putpalette(palette_raw, "RGBA")
-    image.putdata(img_data)
-
-    image = _apply_zepp_header(image, id_data)
-
-    return image.convert("RGBA")
+    reader = TgaRowReader(f, encode_mode)
+    assert reader.format == "TGA-P"
+    return reader.read_image()
 
 
 def load_rl_palette_tga(f, encode_mode="dialog"):
@@ -79,43 +224,9 @@ def load_rl_palette_tga(f, encode_mode="dialog"):
     :param f: opened file
     :return: PIL image
     """
-    header = f.read(18)
-
-    assert header[1] == 1
-    assert header[2] == 9
-    assert header[7] == 32
-
-    # Skip ID
-    id_length = header[0]
-    id_data = f.read(id_length)
-    palette_length, width, height = _parse_tga_header(header)
-
-    # Read RAW img data
-    palette_raw = _fetch_palette(f, palette_length, encode_mode)
-    img_data = bytearray()
-
-    while len(img_data) < width * height:
-        pkg_head = f.read(1)[0]
-        count = (pkg_head & 127) + 1
-        if pkg_head & 128:
-            # RL pkg
-            index = f.read(1)[0]
-            # print("Read RL", pkg_head, index)
-            for i in range(count):
-                img_data.append(index)
-        else:
-            # RAW pkg
-            # print("Read RGB", pkg_head)
-            for i in range(count):
-                val = f.read(1)[0]
-                # print(val)
-                img_data.append(val)
-
-    image = Image.new("P", (width, height))
-    image.putpalette(palette_raw, "RGBA")
-    image.putdata(img_data)
-
-    return image.convert("RGBA")
+    reader = TgaRowReader(f, encode_mode)
+    assert reader.format == "TGA-RLP"
+    return reader.read_image()
 
 
 def load_truecolor_tga(f, encode_mode="dialog"):
@@ -125,48 +236,6 @@ def load_truecolor_tga(f, encode_mode="dialog"):
     :param f: opened file
     :return: PIL image
     """
-    header = f.read(18)
-
-    assert header[1] == 0
-    assert header[2] == 2
-
-    colormode = header[16]
-    id_length = header[0]
-    width = int.from_bytes(header[12:14], "little")
-    height = int.from_bytes(header[14:16], "little")
-
-    # Skip ID
-    f.read(id_length)
-
-    if colormode == 16:
-        unpacked = []
-        for i in range(height * width):
-            b2, b1 = f.read(2)
-            v = (b1 << 8) + b2
-            r = (v & 0b1111100000000000) >> 11
-            g = (v & 0b0000011111100000) >> 5
-            b = v & 0b0000000000011111
-
-            if encode_mode == "nxp":
-                r, b = b, r
-
-            unpacked.append((int(r * 255/31),
-                             int(g * 255/63),
-                             int(b * 255/31),
-                             255))
-    elif colormode == 32:
-        unpacked = []
-        for i in range(height * width):
-            if encode_mode == "nxp":
-                r, g, b, a = f.read(4)
-            else:
-                b, g, r, a = f.read(4)
-            unpacked.append((r, g, b, a))
-    else:
-        raise Exception("Not implemented")
-
-    image = Image.new("RGBA", (width, height))
-    # noinspection PyTypeChecker
-    image.putdata(unpacked)
-
-    return image, f"TGA-{colormode}"
+    reader = TgaRowReader(f, encode_mode)
+    assert reader.format in ("TGA-16", "TGA-32")
+    return reader.read_image(), reader.format
@@ -2,98 +2,150 @@ from pathlib import Path
 
 from PIL import Image
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
-def save_truecolor_tga(img: Image.Image, path: Path, depth, encode_mode="dialog"):
-    img = img.convert("RGBA")
-    data = bytearray()
+HEADER_SIZE = 18
+ID_SIZE = 46
+
+
+def _padded_width(width: int, encode_mode: str):
+    """
+    TGA Width fix: nxp devices require width to be multiple of 16.
+    """
+    if encode_mode == "nxp" and width % 16 != 0:
+        return width + 16 - (width % 16)
+    return width
 
-    # TGA Width fix
-    real_width = img.width
-    if encode_mode == "nxp" and real_width % 16 != 0:
-        tga_width = real_width + 16 - (real_width % 16)
-        assert tga_width % 16 == 0
-        new_img = Image.new(img.mode, (tga_width, img.height))
-        new_img.paste(img)
-        img = new_img
-
-    data.append(46)                                                     # ID len
-    data.append(0)                                                      # Has colormap
-    data.append(2)                                                      # Mode
-    data.extend(b'\x00' * 9)                                            # Palette config, origin
-    data.extend(img.width.to_bytes(2, byteorder="little"))              # width
-    data.extend(img.height.to_bytes(2, byteorder="little"))             # height
-    data.append(depth)                                                  # color mode
-    data.append(32)                                                     # misc
 
-    # ID data
+def _write_rows(out: bytearray, offset: int, pixels: bytes, width: int, tga_width: int, height: int, bpp: int):
+    """
+    Write rows of unpadded pixel data into preallocated buffer at padded pitch.
+    Padding bytes are left as is.
+    """
+    row_size = width * bpp
+    pitch = tga_width * bpp
+    if row_size == pitch:
+        out[offset:offset + pitch * height] = pixels
+        return
+
+    if np is not None:
+        view = np.frombuffer(out, dtype=np.uint8, count=pitch * height, offset=offset).reshape(height, pitch)
+        view[:, :row_size] = np.frombuffer(pixels, dtype=np.uint8).reshape(height, row_size)
+        return
+
+    source = memoryview(pixels)
+    for y in range(height):
+        start = offset + y * pitch
+        out[start:start + row_size] = source[y * row_size:(y + 1) * row_size]
+
+
+def _write_id(data: bytearray, real_width: int):
     data.extend(b"\x53\x4f\x4d\x48")
     data.extend(real_width.to_bytes(2, byteorder="little"))
     data.extend(b"\0" * 40)
 
-    # Image data
-    if depth == 16:
-        for pixel in img.getdata():
-            r = round(31/255 * pixel[0])
-            g = round(63/255 * pixel[1])
-            b = round(31/255 * pixel[2])
 
-            data.append(((g & 0b111) << 5) + b)
-            data.append((r << 3) + (g >> 3))
+def _encode_rgb565(img: Image.Image):
+    if np is not None:
+        pixels = np.asarray(img, dtype=np.float64)
+        r = np.round(31 / 255 * pixels[:, :, 0]).astype(np.uint16)
+        g = np.round(63 / 255 * pixels[:, :, 1]).astype(np.uint16)
+        b = np.round(31 / 255 * pixels[:, :, 2]).astype(np.uint16)
+        return ((r << 11) | (g << 5) | b).astype("<u2").tobytes()
+
+    data = bytearray()
+    for pixel in img.getdata():
+        r = round(31/255 * pixel[0])
+        g = round(63/255 * pixel[1])
+        b = round(31/255 * pixel[2])
+
+        data.append(((g & 0b111) << 5) + b)
+        data.append((r << 3) + (g >> 3))
+    return data
+
+
+def save_truecolor_tga(img: Image.Image, path: Path, depth, encode_mode="dialog"):
+    data = encode_truecolor_tga(img, depth, encode_mode)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def encode_truecolor_tga(img: Image.Image, depth, encode_mode="dialog"):
+    img = img.convert("RGBA")
+    real_width = img.width
+    tga_width = _padded_width(real_width, encode_mode)
+
+    if depth == 16:
+        pixels = _encode_rgb565(img)
     elif depth == 32:
-        for r, g, b, a in img.getdata():
-            data.extend([b, g, r, a])
+        pixels = img.tobytes("raw", "BGRA")
     else:
         raise ValueError("Not supported")
+    bpp = depth // 8
 
-    with open(path, "wb") as f:
-        f.write(data)
+    data = bytearray()
+    data.append(ID_SIZE)                                                # ID len
+    data.append(0)                                                      # Has colormap
+    data.append(2)                                                      # Mode
+    data.extend(b'\x00' * 9)                                            # Palette config, origin
+    data.extend(tga_width.to_bytes(2, byteorder="little"))              # width
+    data.extend(img.height.to_bytes(2, byteorder="little"))             # height
+    data.append(depth)                                                  # color mode
+    data.append(32)                                                     # misc
+    _write_id(data, real_width)
 
+    # Image data, padding is transparent black
+    offset = len(data)
+    data.extend(bytes(tga_width * img.height * bpp))
+    _write_rows(data, offset, pixels, real_width, tga_width, img.height, bpp)
 
-def _prep_palette_base(img, encode_mode):
-    """
-    Prepare data with palette header and data.
+    return bytes(data)
 
-    :param img: Source image
-    :return: bytes and palette
+
+def _palette_indexes(pixels: bytes, palette: list):
     """
-    data = bytearray()
+    :param pixels: raw RGBA data
+    :return: palette index of each pixel, as bytes
+    """
+    if np is not None:
+        colors = np.array([int.from_bytes(bytes(c), "little") for c in palette], dtype=np.uint32)
+        order = np.argsort(colors)
+        pixels = np.frombuffer(pixels, dtype="<u4")
+        positions = np.searchsorted(colors[order], pixels)
+        return order[positions].astype(np.uint8).tobytes()
 
-    # TGA Width fix
-    real_width = img.width
-    if encode_mode == "nxp" and real_width % 16 != 0:
-        tga_width = real_width + 16 - (real_width % 16)
-        assert tga_width % 16 == 0
-        new_img = Image.new(img.mode, (tga_width, img.height))
-        new_img.paste(img)
-        img = new_img
-
-    # Palette data
-    palette = []
-    assert img.getcolors() is not None
+    lookup = {color: index for index, color in enumerate(palette)}
+    view = memoryview(pixels)
+    return bytes(lookup[tuple(view[i:i + 4])] for i in range(0, len(pixels), 4))
 
-    for _, val in img.getcolors():
-        palette.append(val)
 
-    while len(palette) < 256:
-        palette.append((0, 0, 0, 255))
+def _palette_header(width: int, height: int, palette: list, encode_mode: str, truncate=False):
+    """
+    :param palette: palette colors, will be filled up to 256 entries
+    :param truncate: write only used palette entries
+    :return: TGA header with ID and palette
+    """
+    data = bytearray()
+    tga_width = _padded_width(width, encode_mode)
+    if not truncate:
+        palette = palette + [(0, 0, 0, 255)] * (256 - len(palette))
 
     # Build TGA header
-    data.append(46)                                                     # ID len
+    data.append(ID_SIZE)                                                # ID len
     data.append(1)                                                      # Has colormap
     data.append(1)                                                      # Mode
     data.extend(b'\x00\x00')                                            # CM origin
     data.extend(len(palette).to_bytes(2, byteorder="little"))           # Palette length
     data.append(32)                                                     # Palette entry length, bits
     data.extend([0, 0, 0, 0])                                           # X\Y origin of image, locked
-    data.extend(img.width.to_bytes(2, byteorder="little"))              # width
-    data.extend(img.height.to_bytes(2, byteorder="little"))             # height
+    data.extend(tga_width.to_bytes(2, byteorder="little"))              # width
+    data.extend(height.to_bytes(2, byteorder="little"))                 # height
     data.append(8)                                                      # mapped pixel size
     data.append(32)                                                     # misc
-
-    # ID data
-    data.extend(b"\x53\x4f\x4d\x48")
-    data.extend(real_width.to_bytes(2, byteorder="little"))
-    data.extend(b"\0" * 40)
+    _write_id(data, width)
 
     # Palette
     for r, g, b, a in palette:
@@ -103,28 +155,56 @@ def _prep_palette_base(img, encode_mode):
             value = b, g, r, a
         data.extend(value)
 
-    return img, data, palette
+    return data
 
 
-def save_rl_palette_tga(img: Image.Image, path: Path, encode_mode="dialog"):
+def _pad_indexes(indexes: bytes, width: int, height: int, palette: list, encode_mode: str):
+    tga_width = _padded_width(width, encode_mode)
+    if tga_width == width:
+        return indexes
+
+    padded = bytearray([palette.index((0, 0, 0, 0))]) * (tga_width * height)
+    _write_rows(padded, 0, indexes, width, tga_width, height, 1)
+    return padded
+
+
+def _build_palette(images: list, encode_mode: str):
     """
-    Write PIL image to TGA file with DATA TYPE 9
+    Collect colors of all images into one palette.
+    """
+    palette = []
+    for img in images:
+        assert img.getcolors() is not None
+        for _, val in img.getcolors():
+            if val not in palette:
+                palette.append(val)
 
-    :param encode_mode:
-    :param img: source img
-    :param path: dest path
-    :return:
+        if _padded_width(img.width, encode_mode) != img.width and (0, 0, 0, 0) not in palette:
+            # Padding pixels are transparent black
+            palette.append((0, 0, 0, 0))
+
+    assert len(palette) <= 256
+    return palette
+
+
+def _prep_palette_base(img, encode_mode, truncate=False):
     """
-    img = img.convert("RGBA")
-    img, data, palette = _prep_palette_base(img, encode_mode)
-    data[2] = 9
+    Prepare data with palette header and data.
 
-    # Image data
+    :param img: Source image, RGBA
+    :return: header bytes and pixel indexes, padded to TGA width
+    """
+    palette = _build_palette([img], encode_mode)
+    data = _palette_header(img.width, img.height, palette, encode_mode, truncate)
+    indexes = _palette_indexes(img.tobytes(), palette)
+    return data, _pad_indexes(indexes, img.width, img.height, palette, encode_mode)
+
+
+def _rl_encode(indexes: bytes):
     out = bytearray(b"\x00")
     head_index = 0
 
-    for pixel in img.getdata():
-        index = palette.index(pixel)
+    for index in indexes:
         head = out[head_index]
         if len(out) == 1:
             # First index
@@ -154,11 +234,69 @@ def save_rl_palette_tga(img: Image.Image, path: Path, encode_mode="dialog"):
             out.append(index)
             head_index = len(out) - 2
 
-    data.extend(out)
+    return out
+
+
+def encode_palette_sequence(images: list, encode_mode="dialog", rle=False, truncate_palette=False):
+    """
+    Encode images with one shared palette, e.g. animation frames.
+    Pixels of all images are mapped to palette in one batch.
+
+    :param images: RGBA images, up to 256 colors in total
+    :param rle: use TGA-RLP instead of TGA-P
+    :param truncate_palette: write only used palette entries
+    :return: list of file contents
+    """
+    palette = _build_palette(images, encode_mode)
+    indexes = _palette_indexes(b"".join(img.tobytes() for img in images), palette)
+
+    result = []
+    offset = 0
+    for img in images:
+        size = img.width * img.height
+        frame = _pad_indexes(indexes[offset:offset + size], img.width, img.height, palette, encode_mode)
+        offset += size
+
+        data = _palette_header(img.width, img.height, palette, encode_mode, truncate_palette)
+        if rle:
+            data[2] = 9
+            data.extend(_rl_encode(frame))
+        else:
+            data.extend(frame)
+        result.append(bytes(data))
+
+    return result
+
+
+def save_rl_palette_tga(img: Image.Image, path: Path, encode_mode="dialog"):
+    """
+    Write PIL image to TGA file with DATA TYPE 9
+
+    :param encode_mode:
+    :param img: source img
+    :param path: dest path
+    :return:
+    """
+    data = encode_rl_palette_tga(img, encode_mode)
     with open(path, "wb") as f:
         f.write(data)
 
 
+def encode_rl_palette_tga(img: Image.Image, encode_mode="dialog", truncate_palette=False):
+    """
+    Encode PIL image as TGA with DATA TYPE 9
+
+    :param truncate_palette: write only used palette entries
+    :return: file content
+    """
+    img = img.convert("RGBA")
+    data, indexes = _prep_palette_base(img, encode_mode, truncate_palette)
+    data[2] = 9
+
+    data.extend(_rl_encode(indexes))
+    return bytes(data)
+
+
 def save_palette_tga(img: Image.Image, path: Path, encode_mode="dialog"):
     """
     Write PIL image to TGA file with DATA TYPE 1
@@ -168,13 +306,21 @@ def save_palette_tga(img: Image.Image, path: Path, encode_mode="dialog"):
     :param path: dest path
     :return:
     """
+    data = encode_palette_tga(img, encode_mode)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def encode_palette_tga(img: Image.Image, encode_mode="dialog", truncate_palette=False):
+    """
+    Encode PIL image as TGA with DATA TYPE 1
+
+    :param truncate_palette: write only used palette entries
+    :return: file content
+    """
     img = img.convert("RGBA")
-    img, data, palette = _prep_palette_base(img, encode_mode)
+    data, indexes = _prep_palette_base(img, encode_mode, truncate_palette)
 
     # Image data
-    for pixel in img.getdata():
-        index = palette.index(pixel)
-        data.append(index)
-
-    with open(path, "wb") as f:
-        f.write(data)
+    data.extend(indexes)
+    return bytes(data)
@@ -0,0 +1,171 @@
+import contextlib
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from zipfile import ZipFile, BadZipFile
+
+HEADER_SIZE = 18
+ID_SIZE = 46
+PNG_SIGNATURE = b"\211PNG"
+
+# Nested packages: .zab contains .zpk, .zpk contains device.zip
+ARCHIVE_EXTENSIONS = (".bin", ".zip", ".zpk", ".zab")
+
+
+def _check_rle(payload: bytes, pixels: int, palette_length: int):
+    """
+    Walk RLE packets without unpacking them.
+    """
+    problems = []
+    pos = 0
+    count = 0
+    max_index = 0
+    while count < pixels:
+        if pos >= len(payload):
+            return [f"truncated RLE data ({count} of {pixels} pixels)"]
+
+        head = payload[pos]
+        pos += 1
+        if head & 128:
+            if pos >= len(payload):
+                return [f"truncated RLE data ({count} of {pixels} pixels)"]
+            max_index = max(max_index, payload[pos])
+            pos += 1
+        else:
+            chunk = payload[pos:pos + (head & 127) + 1]
+            if len(chunk) < (head & 127) + 1:
+                return [f"truncated RLE data ({count} of {pixels} pixels)"]
+            max_index = max(max_index, max(chunk))
+            pos += len(chunk)
+        count += (head & 127) + 1
+
+    if count > pixels:
+        problems.append(f"last RLE packet exceeds image by {count - pixels} pixels")
+    if pos < len(payload):
+        problems.append(f"{len(payload) - pos} bytes after image data")
+    if max_index >= palette_length:
+        problems.append(f"palette index {max_index} out of range")
+    return problems
+
+
+def check_tga(data: bytes):
+    """
+    Validate ZeppOS TGA structure without decoding: header, SOMH ID block,
+    palette, RLE packet bounds and payload size.
+
+    :param data: file content
+    :return: list of problems, empty if file is valid
+    """
+    if len(data) < HEADER_SIZE:
+        return ["truncated header"]
+
+    problems = []
+    id_length = data[0]
+    image_type = data[2]
+    palette_length = int.from_bytes(data[5:7], "little")
+    width = int.from_bytes(data[12:14], "little")
+    height = int.from_bytes(data[14:16], "little")
+    depth = data[16]
+
+    if image_type in (1, 9):
+        if data[1] != 1:
+            problems.append("palette flag isn't set")
+        if data[7] != 32:
+            problems.append(f"unsupported palette entry size {data[7]}")
+        if not 0 < palette_length <= 256:
+            problems.append(f"bad palette length {palette_length}")
+        if depth != 8:
+            problems.append(f"unsupported index size {depth}")
+        bpp = 1
+    elif image_type == 2:
+        if data[1] != 0:
+            problems.append("palette flag is set for truecolor image")
+        if depth not in (16, 32):
+            return problems + [f"unsupported color depth {depth}"]
+        bpp = depth // 8
+        palette_length = 0
+    else:
+        return [f"unsupported image type {image_type}"]
+
+    if width == 0 or height == 0:
+        problems.append(f"empty image {width}x{height}")
+
+    # ZeppOS ID block with real image width
+    id_data = data[HEADER_SIZE:HEADER_SIZE + id_length]
+    if len(id_data) < id_length:
+        return problems + ["truncated ID block"]
+    if id_length < ID_SIZE or id_data[0:4] != b"SOMH":
+        problems.append("no SOMH ID block")
+    else:
+        real_width = int.from_bytes(id_data[4:6], "little")
+        if real_width == 0 or real_width > width:
+            problems.append(f"bad width in ID block: {real_width}, header width {width}")
+
+    pos = HEADER_SIZE + id_length + palette_length * 4
+    if pos > len(data):
+        return problems + ["truncated palette"]
+
+    payload = data[pos:]
+    pixels = width * height
+    if image_type == 9:
+        return problems + _check_rle(payload, pixels, palette_length)
+
+    expected = pixels * bpp
+    if len(payload) < expected:
+        return problems + [f"truncated image data ({len(payload)} of {expected} bytes)"]
+    elif len(payload) > expected:
+        problems.append(f"{len(payload) - expected} bytes after image data")
+    if palette_length > 0 and pixels > 0 and max(payload[:expected]) >= palette_length:
+        problems.append(f"palette index {max(payload[:expected])} out of range")
+    return problems
+
+
+def _check_file(read):
+    data = read()
+    if data[:4] == PNG_SIGNATURE:
+        return None
+    return check_tga(data)
+
+
+def _collect_archive(arc: ZipFile, prefix: str, items: dict):
+    for name in arc.namelist():
+        lower = name.lower()
+        if lower.endswith(".png"):
+            items[prefix + name] = lambda n=name: arc.read(n)
+        elif lower.endswith(ARCHIVE_EXTENSIONS):
+            try:
+                nested = ZipFile(io.BytesIO(arc.read(name)))
+            except BadZipFile:
+                continue
+            _collect_archive(nested, f"{prefix}{name}/", items)
+
+
+def verify_path(path: Path, cancel_token=None):
+    """
+    Check all TGA images in package file or directory, in parallel.
+    PNG files are skipped.
+
+    :param path: .bin/.zip/.zpk/.zab package, or directory
+    :return: number of checked TGA files and dict name -> list of problems
+             (broken files only)
+    """
+    def process(name):
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        return name, _check_file(items[name])
+
+    items = {}
+    with contextlib.ExitStack() as stack:
+        if path.is_dir():
+            for file in sorted(path.rglob("**/*.png")):
+                items[file.relative_to(path).as_posix()] = file.read_bytes
+        else:
+            _collect_archive(stack.enter_context(ZipFile(path)), "", items)
+
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+            results = list(pool.map(process, items))
+
+    checked = sum(1 for _, problems in results if problems is not None)
+    broken = {name: problems for name, problems in results if problems}
+    return checked, broken
@@ -1,9 +1,10 @@
+import os
 import shutil
 import subprocess
 import sys
 
 from zmake import ZMakeContext
-from zmake.context import QuietExitException
+from zmake.context import ToolNotFoundException, ToolFailedException
 
 NO_TOOL_MSG = """        
 Please install them, or disable usage of that tool in config,
@@ -11,33 +12,87 @@ if it don't required to build your application.
 
 For more information, check https://mmk.pw/en/zmake/guide/."""
 
+_tool_locations = {}
 
-def run_ext_tool(command, context: ZMakeContext, display_name: str):
+# (tool location, mtime_ns) -> version
+_tool_versions = {}
+
+
+def find_tool(name: str):
+    """
+    Find location of external tool. Found locations are memoized
+    until tool is removed from there.
+
+    :return: tool location (or just name, if not found) and list of tried variants
+    """
     if sys.platform == "win32":
-        possible_location = [f"{command[0]}.cmd", f"{command[0]}.exe"]
+        possible_location = [f"{name}.cmd", f"{name}.exe"]
     elif sys.platform == "darwin":
-        possible_location = [command[0], f"/opt/homebrew/bin/{command[0]}"]
+        possible_location = [name, f"/opt/homebrew/bin/{name}"]
     else:
-        possible_location = [command[0]]
+        possible_location = [name]
+
+    if name in _tool_locations and os.path.isfile(_tool_locations[name]):
+        return _tool_locations[name], possible_location
 
     for variant in possible_location:
         location = shutil.which(variant)
         if location is not None:
-            command[0] = location
-            break
+            _tool_locations[name] = location
+            return location, possible_location
+
+    return name, possible_location
+
+
+def get_tool_version(name: str):
+    """
+    Result is memoized by tool location and modification time, so
+    updated or newly installed tools are detected (e.g. by daemon).
+
+    :return: output of `tool --version`, or None if tool isn't available
+    """
+    location = find_tool(name)[0]
+    if name not in _tool_locations:
+        return None
+    try:
+        key = (location, os.stat(location).st_mtime_ns)
+    except OSError:
+        return None
+    if key in _tool_versions:
+        return _tool_versions[key]
+
+    try:
+        p = subprocess.run([location, "--version"], capture_output=True, text=True)
+    except OSError:
+        return None
+    version = p.stdout.strip() if p.returncode == 0 else None
+    _tool_versions[key] = version
+    return version
+
+
+def run_ext_tool(command, context: ZMakeContext, display_name: str, log_output=True):
+    """
+    Run external tool, fail if it isn't found or exits with error.
+
+    :param log_output: write tool stdout to log
+    :return: tool stdout
+    """
+    command[0], possible_location = find_tool(command[0])
 
     try:
         p = subprocess.run(command, capture_output=True, text=True)
-        if p.stdout != "":
+        if p.stdout != "" and log_output:
             context.logger.info(p.stdout)
         if p.stderr != "":
             context.logger.error(p.stderr)
-        assert p.returncode == 0
     except FileNotFoundError:
         err = f"ERROR: External tool {display_name} not found\n" \
               f"Tried locations: {possible_location}" \
               f"{NO_TOOL_MSG}"
         context.logger.error(err)
-        raise QuietExitException()
+        raise ToolNotFoundException()
 
+    if p.returncode != 0:
+        raise ToolFailedException(f"{display_name} failed with exit code {p.returncode}")
 
+    return p.stdout
@@ -1,13 +1,14 @@
+import codecs
+import functools
 import json
 import logging
 import os
 import sys
-from datetime import datetime
 from pathlib import Path
 
 from PIL import Image
 
-from zmake.constants import BACKUP_DIR
+from zmake import quantize, backup
 
 if getattr(sys, 'frozen', False):
     APP_PATH = Path(os.path.dirname(sys.executable))
@@ -22,14 +23,33 @@ def read_json(path: Path):
     with open(path, "rb") as f:
         data = f.read()
 
-    for charset in ["utf8", "utf_8_sig", "utf16"]:
-        try:
-            body = json.loads(data.decode(charset))
-            return body
-        except Exception:
-            print(f"Decode with {charset} failed, retry...")
+    # Detect charset by BOM, instead of trying each one
+    if data.startswith(codecs.BOM_UTF8):
+        charset = "utf_8_sig"
+    elif data.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)) or b"\0" in data[:4]:
+        charset = "utf16"
+    else:
+        charset = "utf8"
+
+    try:
+        return json.loads(data.decode(charset))
+    except ValueError as e:
+        raise ValueError(f"Can't decode JSON-file ({charset}): {e}")
+
 
-    raise ValueError("Can't decode JSON-file")
+@functools.lru_cache
+def load_devices():
+    """
+    :return: dict deviceSource -> device info from zepp_devices.json
+    """
+    with open(APP_PATH / "data" / "zepp_devices.json", "r") as f:
+        devices = json.load(f)
+
+    source_to_device = {}
+    for device in devices:
+        for source in device["deviceSource"]:
+            source_to_device[source] = device
+    return source_to_device
 
 
 def get_app_asset(name: str):
@@ -46,30 +66,13 @@ def increment_or_add(dictionary, key):
     dictionary[key] += 1
 
 
-def image_color_compress(image: Image.Image, file: Path | None, log: logging.Logger):
+def image_color_compress(image: Image.Image, file: Path | None, log: logging.Logger,
+                         method="auto", dither=False, use_cache=True):
     log.debug(f"Start color compression for {image.format} {image.mode}")
 
-    # Save fallback
+    # Save fallback, file must be replaced (not rewritten) after that
     if file is not None:
-        if not BACKUP_DIR.exists():
-            BACKUP_DIR.mkdir(parents=True)
-
-        time_tag = str(datetime.today()).replace(' ', '_').replace(':', '')
-        path = BACKUP_DIR / f"{time_tag}__{file.name}"
+        path = backup.submit(file)
         log.warning(f"  [!] Color compression applied: {file}, backup at {path}")
-        image.save(path)
-
-    # Quantize
-    is_rgb = True
-    if image.mode == "RGBA":
-        for a in image.getdata():
-            if a[3] != 255:
-                is_rgb = False
-                break
-
-    if is_rgb:
-        image = image.convert("RGB").quantize(256).convert("RGBA")
-    else:
-        image = image.quantize(256)
 
-    return image
+    return quantize.quantize(image, method, dither, use_cache=use_cache)
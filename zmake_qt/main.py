@@ -2,11 +2,19 @@ import subprocess
 import webbrowser
 
 import zmake
+from zmake.context import CancellationToken
 from zmake.utils import APP_PATH
 
-from PySide6.QtWidgets import QMainWindow
+from PySide6.QtCore import QThreadPool
+from PySide6.QtWidgets import QMainWindow, QInputDialog, QPushButton
 from zmake_qt.qt6.guide_window import Ui_GuideWindow
 from zmake_qt.qt6.progress_window import Ui_ProgressWindow
+from zmake_qt.worker import ZMakeWorker
+
+PROGRESS_MAXIMUM = 1000
+# Local builds share global build handler and plugin registry, so dropped
+# paths are processed one by one. Daemon runs its tasks one by one too.
+MAX_WORKERS = 1
 
 
 # noinspection PyMethodMayBeStatic
@@ -37,12 +45,95 @@ class GuideWindow(QMainWindow, Ui_GuideWindow):
 
 
 class ProgressWindow(QMainWindow, Ui_ProgressWindow):
+    """
+    Runs queued paths in worker pool. Workers talk to this window
+    only via signals, their log/progress is already batched.
+    """
     def __init__(self):
         super().__init__()
         self.setupUi(self)
+        self.setAcceptDrops(True)
+
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(MAX_WORKERS)
+        self.cancel_token = CancellationToken()
+        self.running = {}
+        self.failed = False
+
+        self.cancel_button = QPushButton("Cancel", self.centralwidget)
+        self.cancel_button.clicked.connect(self.cancel)
+        self.verticalLayout.addWidget(self.cancel_button)
+
+    def enqueue(self, path: str):
+        if path in self.running:
+            return
+
+        worker = ZMakeWorker(path, self.cancel_token)
+        worker.signals.on_log.connect(self.write_log)
+        worker.signals.on_progress.connect(self.set_progress)
+        worker.signals.on_dialog.connect(self.open_dialog)
+        worker.signals.on_finish.connect(self.on_worker_finish)
+
+        self.running[path] = worker
+        self.pool.start(worker)
+        self.update_title()
+
+    def update_title(self):
+        self.setWindowTitle(f"ZMake: Processing {len(self.running)} task(s)...")
+
+    def cancel(self):
+        self.cancel_token.cancel()
+        self.cancel_button.setEnabled(False)
+
+    def open_dialog(self, worker: ZMakeWorker, msg: str, options: list):
+        item, ok = QInputDialog.getItem(self, "Question", msg, options, 0, False)
+        worker.answer(item if ok else None)
+
+    def on_worker_finish(self, path: str, success: bool):
+        del self.running[path]
+        self.failed = self.failed or not success
+        self.update_title()
+
+        if len(self.running) > 0:
+            return
+
+        self.remove_progress()
+        self.cancel_button.hide()
+        if not self.failed:
+            self.close()
 
     def remove_progress(self):
         self.progressBar.hide()
 
-    def write_log(self, msg):
-        self.log_view.append(msg)
+    def write_log(self, lines: list):
+        self.log_view.append("\n".join(lines))
+
+    def set_progress(self, progress: dict):
+        text = progress["handler"]
+        if progress["total"] > 0:
+            text += f" {progress['done']}/{progress['total']}"
+        if progress["eta"] is not None:
+            text += f", {round(progress['eta'])}s left"
+
+        self.progressBar.setMaximum(PROGRESS_MAXIMUM)
+        self.progressBar.setValue(round(progress["fraction"] * PROGRESS_MAXIMUM))
+        self.progressBar.setFormat(text)
+
+    def dragEnterEvent(self, event):
+        if event.mimeData().hasUrls():
+            event.acceptProposedAction()
+
+    def dropEvent(self, event):
+        if self.cancel_token.is_cancelled:
+            self.cancel_token = CancellationToken()
+        self.progressBar.show()
+        self.cancel_button.show()
+        self.cancel_button.setEnabled(True)
+
+        for url in event.mimeData().urls():
+            if url.isLocalFile():
+                self.enqueue(url.toLocalFile())
+
+    def closeEvent(self, event):
+        self.cancel_token.cancel()
+        super().closeEvent(event)
@@ -0,0 +1,182 @@
+import logging
+import threading
+import time
+from pathlib import Path
+
+from PySide6.QtCore import QObject, QRunnable, Signal
+
+from zmake import ZMakeContext, constants, server
+from zmake.build_scheduler import current_task, record_task
+from zmake.context import CancellationToken, CancelledException
+
+REFRESH_INTERVAL = 0.1
+
+
+# noinspection PyUnresolvedReferences
+class WorkerSignals(QObject):
+    on_log = Signal(list)
+    on_progress = Signal(dict)
+    on_dialog = Signal(object, str, list)
+    on_finish = Signal(str, bool)
+
+
+class EventBatcher:
+    """
+    Collects log lines and progress events from worker thread and emits
+    them as signals at fixed rate, so UI isn't flooded with signals.
+    """
+    def __init__(self, signals: WorkerSignals):
+        self.signals = signals
+        self.lock = threading.Lock()
+        self.lines = []
+        self.progress = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.flush()
+
+    def write_log(self, msg: str):
+        with self.lock:
+            self.lines.append(msg)
+
+    def set_progress(self, event: dict):
+        with self.lock:
+            self.progress = event
+
+    def flush(self):
+        with self.lock:
+            lines, self.lines = self.lines, []
+            progress, self.progress = self.progress, None
+
+        if len(lines) > 0:
+            self.signals.on_log.emit(lines)
+        if progress is not None:
+            self.signals.on_progress.emit(progress)
+
+    def _run(self):
+        while not self.stopped.wait(REFRESH_INTERVAL):
+            self.flush()
+
+
+class QtLogHandler(logging.Handler):
+    """
+    Pass log records of one worker task to batcher. Build handlers
+    run in other threads, so records are matched by task, not thread.
+    """
+    def __init__(self, batcher: EventBatcher, task_id):
+        super().__init__()
+        self.batcher = batcher
+        self.task_id = task_id
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if record_task(record) is self.task_id:
+            self.batcher.write_log(self.format(record))
+
+
+class ZMakeWorker(QRunnable):
+    """
+    Process one path in thread pool. Communicates with UI only via signals,
+    UI may call answer() and cancel token from main thread.
+    """
+    def __init__(self, path: str, cancel_token: CancellationToken):
+        super().__init__()
+        self.path = path
+        self.cancel_token = cancel_token
+        self.signals = WorkerSignals()
+        self.batcher = EventBatcher(self.signals)
+
+        self.dialog_closed = threading.Event()
+        self.dialog_response = None
+        self.daemon_cancel_sent = False
+
+    def answer(self, response):
+        """
+        Called from UI thread, when question dialog is closed.
+        """
+        self.dialog_response = response
+        self.dialog_closed.set()
+
+    def ask_question(self, msg, options):
+        self.dialog_closed.clear()
+        self.signals.on_dialog.emit(self, msg, options)
+        self.dialog_closed.wait()
+
+        if self.dialog_response is None:
+            self.cancel_token.cancel()
+            raise CancelledException("Cancelled by user")
+        return self.dialog_response
+
+    def on_daemon_event(self, event):
+        if event["event"] == "log":
+            self.batcher.write_log(event["message"])
+        elif event["event"] == "progress":
+            self.batcher.set_progress(event)
+
+        if self.cancel_token.is_cancelled and not self.daemon_cancel_sent:
+            self.daemon_cancel_sent = True
+            server.send_request({"action": "cancel"}, timeout=1)
+
+    def run_on_daemon(self, path: Path):
+        """
+        Try to process path with running zmake daemon.
+
+        :return: task success, or None if task should be processed locally
+        """
+        if not server.is_running():
+            return None
+
+        try:
+            result = server.send_request({"action": "auto", "path": str(path)}, self.on_daemon_event)
+        except (OSError, ValueError):
+            return None
+
+        if result["exit_code"] == constants.EXIT_INPUT_REQUIRED:
+            # Daemon can't ask questions, so do this task locally
+            return None
+
+        return result["exit_code"] == constants.EXIT_OK
+
+    def run_local(self, path: Path):
+        task_token = current_task.set(self)
+        log_handler = QtLogHandler(self.batcher, self)
+        root_logger = logging.getLogger()
+        root_logger.addHandler(log_handler)
+
+        # noinspection PyBroadException
+        try:
+            context = ZMakeContext(path, cancel_token=self.cancel_token)
+            context.progress.add_listener(self.batcher.set_progress)
+            context.ask_question = self.ask_question
+            context.perform_auto()
+            return True
+        except CancelledException:
+            logging.getLogger("zmake").info("Cancelled")
+            return False
+        except Exception:
+            logging.getLogger("zmake").exception("Build failed")
+            return False
+        finally:
+            root_logger.removeHandler(log_handler)
+            current_task.reset(task_token)
+
+    def run(self):
+        path = Path(self.path).resolve()
+        self.batcher.start()
+
+        success = self.run_on_daemon(path)
+        if success is None:
+            success = self.run_local(path)
+
+        if not success:
+            self.batcher.write_log(f"Build failed: {path}")
+
+        # Give user some time to see log
+        time.sleep(0.5)
+        self.batcher.stop()
+        self.signals.on_finish.emit(self.path, success)